@@ -18,12 +18,29 @@ class VectorStoreConfig:
     type: str
     embedding_model: str
     kwargs: dict[str, Any]
+    dimensions: int | None = None
+    dimension_mode: str = "request"
+    vector_dtype: str = "float32"
+
+
+def _parse_vector_store_config(cfg: dict[str, Any]) -> VectorStoreConfig:
+    return VectorStoreConfig(
+        type=cfg["type"],
+        embedding_model=cfg["embedding_model"],
+        kwargs=cfg["kwargs"],
+        dimensions=cfg.get("dimensions"),
+        dimension_mode=cfg.get("dimension_mode", "request"),
+        vector_dtype=cfg.get("vector_dtype", "float32"),
+    )
 
 
 @dataclass
 class LLMConfig:
     model_name: str
     model_provider: str
+    #  client timeout and retries of each call, None for the provider default
+    timeout_s: float | None = None
+    max_retries: int | None = None
 
 
 @dataclass
@@ -31,6 +48,7 @@ class AnalyzeQueryConfig:
     llm_key: str
     temperature: float = 0.0
     prompt: str | None = None
+    skip_rewrite_max_words: int = 0
 
 
 @dataclass
@@ -46,9 +64,16 @@ class RetrieveConfig:
     dense_params: dict[str, Any] = field(default_factory=dict)
     sparse_type: str = field(default_factory="none")
     sparse_params: dict[str, Any] = field(default_factory=dict)
+    sparse_tokenizer: str = "nltk"
     ensemble_weights: list[float] = field(default_factory=lambda: [0.5, 0.5])
     reranker_type: str = field(default_factory="none")
     reranker_params: dict[str, Any] = field(default_factory=dict)
+    reranker_timeout_s: float | None = None
+    speculative: bool = False
+    source_shards: bool = False
+    tenant_shards: bool = False
+    max_loaded_shards: int = 32
+    max_shard_memory_mb: float = 4096.0
 
 
 @dataclass
@@ -58,11 +83,43 @@ class NodesConfig:
     generate: GenerateConfig
 
 
+@dataclass
+class BatchConfig:
+    """
+    /ask/batch: LLM and reranker calls in flight at once, and the largest
+    number of questions accepted in one request.
+    """
+
+    max_concurrency: int = 8
+    max_questions: int = 500
+
+
+@dataclass
+class DeadlineConfig:
+    """
+    Latency budget of /ask requests, and the time reserved for each stage: a
+    stage is skipped or degraded when the budget left cannot cover it and the
+    stages after it.
+    """
+
+    #  budget of requests that do not set latency_budget_s, None for no budget
+    default_budget_s: float | None = None
+    max_budget_s: float = 60.0
+    rewrite_s: float = 1.5
+    retrieve_s: float = 0.5
+    rerank_s: float = 1.0
+    generate_s: float = 3.0
+    #  contexts passed to generate when less than generate_s is left
+    truncated_contexts: int = 2
+
+
 @dataclass
 class RagConfig:
     vector_stores: dict[str, VectorStoreConfig]
     llms: dict[str, LLMConfig]
     nodes: NodesConfig
+    batch: BatchConfig = field(default_factory=BatchConfig)
+    deadlines: DeadlineConfig = field(default_factory=DeadlineConfig)
 
 
 def _load_rag_config(path) -> RagConfig:
@@ -71,17 +128,15 @@ def _load_rag_config(path) -> RagConfig:
 
     vector_stores: dict[str, VectorStoreConfig] = {}
     for key, cfg in (raw.get("vector_stores") or {}).items():
-        vector_stores[key] = VectorStoreConfig(
-            type=cfg["type"],
-            embedding_model=cfg["embedding_model"],
-            kwargs=cfg["kwargs"],
-        )
+        vector_stores[key] = _parse_vector_store_config(cfg)
 
     llms: dict[str, LLMConfig] = {}
     for key, cfg in (raw.get("llms") or {}).items():
         llms[key] = LLMConfig(
             model_name=cfg["model_name"],
             model_provider=cfg["model_provider"],
+            timeout_s=cfg.get("timeout_s"),
+            max_retries=cfg.get("max_retries"),
         )
 
     aq_raw = raw["nodes"]["analyze_query"]
@@ -92,6 +147,7 @@ def _load_rag_config(path) -> RagConfig:
         llm_key=aq_llm_key,
         temperature=aq_params.get("temperature", 0.0),
         prompt=aq_raw.get("prompt"),
+        skip_rewrite_max_words=aq_raw.get("skip_rewrite_max_words", 0),
     )
 
     r_raw = raw["nodes"]["retrieve"]
@@ -99,6 +155,7 @@ def _load_rag_config(path) -> RagConfig:
     sparse_raw = r_raw["sparse"]
     ensemble_raw = r_raw.get("ensemble") or {}
     reranker_raw = r_raw["reranker"]
+    shards_raw = r_raw.get("tenant_shards") or {}
     r_vs_key = dense_raw["vector_store"]
     vs_retrieval_kwargs = raw["vector_stores"][r_vs_key]["retrieval_kwargs"]
 
@@ -112,9 +169,16 @@ def _load_rag_config(path) -> RagConfig:
         dense_params=r_merged_params,
         sparse_type=sparse_raw["type"],
         sparse_params=sparse_raw.get("params") or {},
+        sparse_tokenizer=sparse_raw.get("tokenizer", "nltk"),
         ensemble_weights=ensemble_raw.get("weights", [0.5, 0.5]),
         reranker_type=reranker_raw["type"],
         reranker_params=reranker_raw.get("params") or {},
+        reranker_timeout_s=reranker_raw.get("timeout_s"),
+        speculative=r_raw.get("speculative", False),
+        source_shards=dense_raw.get("source_shards", False),
+        tenant_shards=shards_raw.get("enabled", False),
+        max_loaded_shards=shards_raw.get("max_loaded", 32),
+        max_shard_memory_mb=shards_raw.get("max_memory_mb", 4096.0),
     )
 
     g_raw = raw["nodes"]["generate"]
@@ -133,10 +197,20 @@ def _load_rag_config(path) -> RagConfig:
         generate=generate,
     )
 
+    batch_raw = raw.get("batch") or {}
+    batch = BatchConfig(
+        max_concurrency=batch_raw.get("max_concurrency", 8),
+        max_questions=batch_raw.get("max_questions", 500),
+    )
+
+    deadlines = DeadlineConfig(**(raw.get("deadlines") or {}))
+
     return RagConfig(
         vector_stores=vector_stores,
         llms=llms,
         nodes=nodes,
+        batch=batch,
+        deadlines=deadlines,
     )
 
 
@@ -153,18 +227,73 @@ class LoaderConfig:
 class PdfSourceConfig:
     loader: LoaderConfig
     metadata: dict | None
+    #  re-ingest indexed files whose content or loader params changed
+    check_changes: bool = True
+    #  cache parsed elements under artifacts/parse_cache
+    parse_cache: bool = True
 
 
 @dataclass
 class WebSourceConfig:
     loader: LoaderConfig
     metadata: dict | None
+    #  re-ingest indexed pages that changed since they were fetched
+    check_changes: bool = True
+
+
+@dataclass
+class SqlTableConfig:
+    """
+    One chunk per row of query, with text rendered from template, e.g.
+    "{Food} produces {CO2} kg of CO2 per kg". Databases are read from file
+    under data/sql, or from any SQLAlchemy url.
+    """
+
+    query: str
+    template: str
+    file: str | None = None
+    url: str | None = None
+    #  columns using a decimal comma, e.g. "1,5"
+    decimal_comma: list[str] = field(default_factory=list)
+    chunksize: int = 10_000
+
+    def __post_init__(self):
+        if (self.file is None) == (self.url is None):
+            raise ValueError("A SQL database needs either a file or a url")
 
 
 @dataclass
 class SqlSourceConfig:
     loader: LoaderConfig | None
     metadata: dict | None
+    databases: dict[str, SqlTableConfig] = field(default_factory=dict)
+
+
+@dataclass
+class StreamingConfig:
+    queue_size: int = 512
+    process_batch_size: int = 64
+    embed_batch_size: int = 256
+
+
+@dataclass
+class DedupConfig:
+    """
+    Near-duplicate detection of PDF and web chunks across sources, with MinHash
+    signatures of shingle_size word shingles and LSH over bands of the
+    signature. Chunks with an estimated Jaccard similarity of at least
+    threshold to an ingested chunk are dropped, or with action "link" kept
+    with a duplicate_of field. Off unless enabled, as dropping changes the
+    corpus of an existing deployment.
+    """
+
+    enabled: bool = False
+    threshold: float = 0.85
+    num_perm: int = 128
+    bands: int = 16
+    shingle_size: int = 5
+    seed: int = 0
+    action: str = "drop"
 
 
 @dataclass
@@ -174,6 +303,11 @@ class IngestionConfig:
     pdf: PdfSourceConfig | None
     web: WebSourceConfig | None
     sql: SqlSourceConfig | None
+    tenant_id: str = "default"
+    shard_by_tenant: bool = False
+    merge_indexes: bool = True
+    streaming: StreamingConfig = field(default_factory=StreamingConfig)
+    dedup: DedupConfig = field(default_factory=DedupConfig)
 
 
 def _load_ingestion_config(path) -> IngestionConfig:
@@ -184,17 +318,15 @@ def _load_ingestion_config(path) -> IngestionConfig:
 
     vs_key = raw["ingestion"]["vector_store"]
     vs_cfg = raw["vector_stores"][vs_key]
-    vector_store = VectorStoreConfig(
-        type=vs_cfg["type"],
-        embedding_model=vs_cfg["embedding_model"],
-        kwargs=vs_cfg["kwargs"],
-    )
+    vector_store = _parse_vector_store_config(vs_cfg)
 
     pdf_loader_cfg = raw["ingestion"]["sources"]["pdf"]["loader"]
     pdf_loader_metadata = raw["ingestion"]["sources"]["pdf"]
     pdf = PdfSourceConfig(
         loader=LoaderConfig(**pdf_loader_cfg),
         metadata=pdf_loader_metadata,
+        check_changes=pdf_loader_metadata.get("check_changes", True),
+        parse_cache=pdf_loader_metadata.get("parse_cache", True),
     )
 
     web_loader_cfg = raw["ingestion"]["sources"]["web"]["loader"]
@@ -202,13 +334,18 @@ def _load_ingestion_config(path) -> IngestionConfig:
     web = WebSourceConfig(
         loader=LoaderConfig(**web_loader_cfg),
         metadata=web_loader_metadata,
+        check_changes=web_loader_metadata.get("check_changes", True),
     )
 
     sql_loader_cfg = raw["ingestion"]["sources"]["sql"]["loader"]
     sql_loader_metadata = raw["ingestion"]["sources"]["sql"]
-    sql = WebSourceConfig(
+    sql = SqlSourceConfig(
         loader=LoaderConfig(**sql_loader_cfg),
         metadata=sql_loader_metadata,
+        databases={
+            name: SqlTableConfig(**table)
+            for name, table in sql_loader_metadata.get("databases", {}).items()
+        },
     )
 
     return IngestionConfig(
@@ -217,6 +354,11 @@ def _load_ingestion_config(path) -> IngestionConfig:
         pdf=pdf,
         web=web,
         sql=sql,
+        tenant_id=raw["ingestion"].get("tenant_id", "default"),
+        shard_by_tenant=raw["ingestion"].get("shard_by_tenant", False),
+        merge_indexes=raw["ingestion"].get("merge_indexes", True),
+        streaming=StreamingConfig(**raw["ingestion"].get("streaming", {})),
+        dedup=DedupConfig(**raw["ingestion"].get("dedup", {})),
     )
 
 
@@ -254,9 +396,28 @@ def _load_eval_config(path) -> IngestionConfig:
     )
 
 
+@dataclass
+class AdmissionConfig:
+    """
+    Per-worker admission control of /ask and /ask/batch: requests served at
+    once, requests waiting for a slot, and the longest wait before a 503.
+    service_time_s seeds the average service time used to estimate waits.
+    Off unless enabled, the limits depend on the deployment.
+    """
+
+    enabled: bool = False
+    max_in_flight: int = 16
+    max_queue: int = 64
+    queue_timeout_s: float = 10.0
+    service_time_s: float = 5.0
+
+
 @dataclass
 class InitConfig:
     download_index: bool
+    watch_manifest: bool = False
+    watch_interval_s: float = 30.0
+    admission: AdmissionConfig = field(default_factory=AdmissionConfig)
 
 
 def _load_init_config(path) -> InitConfig:
@@ -266,7 +427,12 @@ def _load_init_config(path) -> InitConfig:
     init_raw = raw["init"]
     download_index = init_raw["download_index"]
 
-    return InitConfig(download_index=download_index)
+    return InitConfig(
+        download_index=download_index,
+        watch_manifest=init_raw.get("watch_manifest", False),
+        watch_interval_s=init_raw.get("watch_interval_s", 30.0),
+        admission=AdmissionConfig(**init_raw.get("admission", {})),
+    )
 
 
 #  settings
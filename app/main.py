@@ -1,46 +1,217 @@
-from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from contextlib import asynccontextmanager, nullcontext
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field, field_validator
 from app.rag_pipeline import build_graph
-from app.config import get_settings
+from app.config import get_settings, Settings
 from app.utils.vector_stores import VectorStoreType
+from app.utils.admission import AdmissionController, Overloaded
 from app.utils.artifacts import ensure_corpus_assets
+from app.utils.deadline import DeadlineExceeded, configure_pool
+from app.utils.filters import validate_filters
+from app.utils.memory import PeakRssSampler, rss_mb
+from app.utils.shards import UnknownTenantError
 from app.utils.paths import DOC_DIR, ART_DIR
+from app.utils.timing import timed, format_timings
 from dotenv import load_dotenv
+import asyncio
+import gc
+import hmac
+import json
 import os
+import time
+import weakref
 
 
 load_dotenv()
 
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 
 class QueryRequest(BaseModel):
     question: str
+    filters: dict[str, str | list[str]] | None = None
+    tenant_id: str | None = None
+    #  seconds, /ask only
+    latency_budget_s: float | None = Field(default=None, gt=0)
 
+    @field_validator("filters")
+    @classmethod
+    def check_filters(cls, filters):
+        return validate_filters(filters)
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    cfg = get_settings()
+
+class BatchQueryRequest(BaseModel):
+    questions: list[QueryRequest]
+
+    @field_validator("questions")
+    @classmethod
+    def check_no_budget(cls, questions):
+        #  answer_batch has no deadline, rather than dropping the field
+        if any(q.latency_budget_s is not None for q in questions):
+            raise ValueError("latency_budget_s is only supported by /ask")
+        return questions
+
+
+def _manifest_path(cfg: Settings):
+    vs_key = cfg.rag.nodes.retrieve.dense_vector_store_key
+    vs_config = cfg.rag.vector_stores[vs_key]
+    return ART_DIR / vs_config.type / "manifest.json"
+
+
+def _manifest_mtime(cfg: Settings) -> int | None:
+    try:
+        return _manifest_path(cfg).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _build_app_graph(
+    cfg: Settings,
+    timings: dict[str, float] | None = None,
+    sync_artifacts: bool = True,
+):
+    """
+    Sync the corpus artifacts if configured and sync_artifacts is set, and
+    build the RAG graph.
+    """
     rag_cfg = cfg.rag
     init_cfg = cfg.init
     vs_key = rag_cfg.nodes.retrieve.dense_vector_store_key
     vs_config = rag_cfg.vector_stores[vs_key]
     vs_dir = ART_DIR / vs_config.type
     doc_dir = DOC_DIR
-    if vs_config.type == VectorStoreType.FAISS and init_cfg.download_index:
-        vs_dir, doc_dir = ensure_corpus_assets(
-            config=vs_config,
-            repo_id=os.getenv("HF_DATASET_REPO"),
-            revision=os.getenv("HF_DATASET_REVISION", "main"),
-            want_sources=True,
+    if (
+        sync_artifacts
+        and vs_config.type == VectorStoreType.FAISS
+        and init_cfg.download_index
+    ):
+        with timed(timings, "ensure_corpus_assets"):
+            vs_dir, doc_dir = ensure_corpus_assets(
+                config=vs_config,
+                repo_id=os.getenv("HF_DATASET_REPO"),
+                revision=os.getenv("HF_DATASET_REVISION", "main"),
+                want_sources=True,
+            )
+    with timed(timings, "build_graph"):
+        graph = build_graph(
+            rag_cfg,
+            vs_dir=vs_dir,
+            doc_dir=doc_dir,
+            timings=timings,
         )
-    graph = build_graph(
-        rag_cfg,
-        vs_dir=vs_dir,
-        doc_dir=doc_dir,
-    )
+    return graph
+
+
+async def _release_when_drained(old_graph_ref: weakref.ref, timeout_s: float = 300.0):
+    """
+    In-flight requests keep a reference to the graph they started with.
+    Collect the old graph once the last of them has finished.
+    """
+    deadline = time.monotonic() + timeout_s
+    while old_graph_ref() is not None and time.monotonic() < deadline:
+        gc.collect()
+        await asyncio.sleep(1.0)
+    print(f"[reload] old graph released, rss={rss_mb():.0f}MB")
+
+
+async def reload_graph(app: FastAPI, sync_artifacts: bool = True) -> dict:
+    """
+    Build a new graph in a background thread while the current one keeps
+    serving requests, then swap app.state.graph in a single assignment.
+    Returns a report with the reload time and memory use during the swap.
+    """
+    cfg = get_settings()
+    timings = {}
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    with PeakRssSampler() as sampler:
+        graph = await asyncio.to_thread(_build_app_graph, cfg, timings, sync_artifacts)
+
+    old_graph_ref = weakref.ref(app.state.graph)
     app.state.graph = graph
+    app.state.manifest_mtime = _manifest_mtime(cfg)
+    del graph
+    gc.collect()
+
+    report = {
+        "reload_seconds": round(time.perf_counter() - start, 3),
+        "rss_before_mb": round(rss_before, 1),
+        "rss_peak_mb": round(sampler.peak_mb, 1),
+        "rss_after_swap_mb": round(rss_mb(), 1),
+        "old_graph_in_flight": old_graph_ref() is not None,
+        "phases": {phase: round(seconds, 3) for phase, seconds in timings.items()},
+    }
+    app.state.last_reload = report
+    print(
+        f"[reload] {report['reload_seconds']}s, rss before/peak/after: "
+        f"{report['rss_before_mb']}/{report['rss_peak_mb']}/"
+        f"{report['rss_after_swap_mb']}MB"
+    )
+
+    if old_graph_ref() is not None:
+        asyncio.create_task(_release_when_drained(old_graph_ref))
+
+    return report
+
+
+async def _watch_manifest(app: FastAPI, interval_s: float):
+    """
+    Reload the graph when the vector store manifest.json changes on disk,
+    e.g. after ingestion merged a new index. The artifacts are not synced
+    first, which would replace the local index with the remote one.
+    """
+    cfg = get_settings()
+    while True:
+        await asyncio.sleep(interval_s)
+        mtime = _manifest_mtime(cfg)
+        if mtime is None or mtime == app.state.manifest_mtime:
+            continue
+        if app.state.reload_lock.locked():
+            continue
+        print(f"[reload] {_manifest_path(cfg)} changed, reloading")
+        async with app.state.reload_lock:
+            try:
+                await reload_graph(app, sync_artifacts=False)
+            except Exception as e:
+                #  keep serving with the current graph
+                app.state.manifest_mtime = mtime
+                print(f"[reload] failed: {e!r}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    timings = {}
+    with timed(timings, "load_settings"):
+        cfg = get_settings()
+    app.state.graph = _build_app_graph(cfg, timings)
+    app.state.startup_timings = timings
+    app.state.manifest_mtime = _manifest_mtime(cfg)
+    app.state.reload_lock = asyncio.Lock()
+    app.state.last_reload = None
+    admission_cfg = cfg.init.admission
+    app.state.admission = (
+        AdmissionController(
+            max_in_flight=admission_cfg.max_in_flight,
+            max_queue=admission_cfg.max_queue,
+            queue_timeout_s=admission_cfg.queue_timeout_s,
+            service_time_s=admission_cfg.service_time_s,
+        )
+        if admission_cfg.enabled
+        else None
+    )
+    configure_pool(admission_cfg.max_in_flight)
+    print(f"[startup] {format_timings(timings)}")
+
+    watcher = None
+    if cfg.init.watch_manifest:
+        watcher = asyncio.create_task(_watch_manifest(app, cfg.init.watch_interval_s))
     yield
+    if watcher is not None:
+        watcher.cancel()
 
 
 app = FastAPI(title="RAG API", version="0.1", lifespan=lifespan)
@@ -58,13 +229,160 @@ app.add_middleware(
 )
 
 
+def _graph_inputs(req: QueryRequest) -> dict:
+    inputs = {"question": req.question}
+    if req.filters:
+        inputs["filters"] = req.filters
+    if req.tenant_id:
+        inputs["tenant_id"] = req.tenant_id
+    return inputs
+
+
+def _overloaded(e: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after_s)},
+    )
+
+
+def _deadline(req: QueryRequest) -> float | None:
+    """
+    The time.monotonic() by which the answer is due, counting from now, so
+    that the wait for admission is part of the budget.
+    """
+    deadlines = get_settings().rag.deadlines
+    budget_s = req.latency_budget_s or deadlines.default_budget_s
+    if budget_s is None:
+        return None
+    return time.monotonic() + min(budget_s, deadlines.max_budget_s)
+
+
 @app.post("/ask")
 async def ask_question(req: QueryRequest):
-    graph = app.state.graph
-    result = graph.invoke({"question": req.question})
+    inputs = _graph_inputs(req)
+    deadline = _deadline(req)
+    if deadline is not None:
+        inputs["deadline"] = deadline
+    admission = app.state.admission
+    try:
+        async with admission.slot() if admission is not None else nullcontext():
+            graph = app.state.graph
+            #  off the event loop, so that requests in flight run concurrently
+            result = await asyncio.to_thread(graph.invoke, inputs)
+    except Overloaded as e:
+        raise _overloaded(e)
+    except UnknownTenantError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Latency budget exceeded: {e}")
     return result
 
 
+@app.post("/ask/batch")
+async def ask_batch(req: BatchQueryRequest):
+    """
+    Answer several questions, streamed back as NDJSON, one result per line in
+    the order they complete, with the index of the question they answer.
+    """
+    max_questions = get_settings().rag.batch.max_questions
+    if len(req.questions) > max_questions:
+        raise HTTPException(
+            status_code=413, detail=f"At most {max_questions} questions per batch"
+        )
+    #  a batch holds one slot until its last result is streamed
+    admission = app.state.admission
+    if admission is not None:
+        try:
+            await admission.acquire()
+        except Overloaded as e:
+            raise _overloaded(e)
+    released = False
+
+    def release():
+        nonlocal released
+        if admission is not None and not released:
+            released = True
+            admission.release()
+
+    try:
+        graph = app.state.graph
+        results = iter(graph.answer_batch([_graph_inputs(q) for q in req.questions]))
+
+        async def lines():
+            try:
+                while (
+                    result := await asyncio.to_thread(next, results, None)
+                ) is not None:
+                    yield json.dumps(jsonable_encoder(result)) + "\n"
+            finally:
+                release()
+
+        #  the background task releases the slot if streaming never started
+        return StreamingResponse(
+            lines(),
+            media_type="application/x-ndjson",
+            background=BackgroundTask(release),
+        )
+    except BaseException:
+        release()
+        raise
+
+
+def _check_admin_token(x_admin_token: str | None):
+    #  fail closed: without ADMIN_TOKEN the admin endpoints are disabled
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not hmac.compare_digest(
+        (x_admin_token or "").encode("utf-8"), ADMIN_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def _shard_cache(graph):
+    retriever = getattr(graph, "retriever", None)
+    #  unwrap the reranker
+    retriever = getattr(retriever, "base_retriever", retriever)
+    return getattr(retriever, "shards", None)
+
+
+@app.post("/admin/reload")
+async def reload_index(x_admin_token: str | None = Header(default=None)):
+    _check_admin_token(x_admin_token)
+    if app.state.reload_lock.locked():
+        raise HTTPException(status_code=409, detail="Reload already in progress")
+
+    async with app.state.reload_lock:
+        try:
+            return await reload_graph(app)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"Reload failed, still serving: {e!r}"
+            )
+
+
+@app.get("/admin/shards")
+async def shard_stats(x_admin_token: str | None = Header(default=None)):
+    _check_admin_token(x_admin_token)
+    shards = _shard_cache(app.state.graph)
+    if shards is None:
+        raise HTTPException(status_code=404, detail="Tenant shards are not enabled")
+    return shards.summary()
+
+
+@app.get("/metrics")
+async def admission_metrics():
+    """
+    Admission metrics of this worker in the Prometheus text format.
+    """
+    admission = app.state.admission
+    if admission is None:
+        raise HTTPException(status_code=404, detail="Admission control is disabled")
+    return PlainTextResponse(
+        admission.metrics(), media_type="text/plain; version=0.0.4"
+    )
+
+
 @app.get("/")
 async def report_status():
     return {"message": "status OK"}
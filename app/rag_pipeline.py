@@ -1,16 +1,51 @@
 from langchain.chat_models import init_chat_model
-from langchain_cohere import CohereRerank
-from langchain.retrievers import ContextualCompressionRetriever, EnsembleRetriever
-from langchain_community.retrievers import BM25Retriever
-from app.utils.vector_stores import VS_REGISTRY
+from rank_bm25 import BM25Okapi
+from app.utils.vector_stores import (
+    VS_REGISTRY,
+    VectorStoreType,
+    build_embeddings,
+    load_rescore_vectors,
+    set_faiss_search_params,
+    split_faiss_search_params,
+)
 from langchain_core.documents import Document
 from typing_extensions import TypedDict, Annotated
 from langgraph.graph import StateGraph, START
 from app.utils.docs import load_docs
-from app.utils.text import clean_tokens
+from app.utils.text import (
+    batch_clean_tokens,
+    get_query_tokenizer,
+    regex_clean_tokens,
+)
 from app.utils.prompts import get_chat_prompt_template
-from app.config import RagConfig
+from app.utils.retrievers import (
+    Chunk,
+    ChunkRetriever,
+    FAISSRetriever,
+    FilteredBM25Retriever,
+    FilteredEnsembleRetriever,
+    OpenSearchHybridRetriever,
+    OpenSearchRetriever,
+    RerankRetriever,
+    ShardedFAISSRetriever,
+    TenantShardedRetriever,
+    build_faiss_metadata_index,
+    build_metadata_index,
+    retrieve_chunks,
+    retrieve_chunks_batch,
+    to_documents,
+)
+from app.utils.shards import ShardCache, UnknownTenantError, check_tenant_id
+from app.utils.deadline import DeadlineExceeded, call_with_timeout, remaining_s
+from app.utils.timing import timed
+from app.utils.paths import ART_DIR, TENANT_DIR
+from app.config import LLMConfig, RagConfig
+from app.utils.filters import Filters
 from dotenv import load_dotenv
+from collections import defaultdict
+from functools import partial
+from pathlib import Path
+from typing import Iterator
 import os
 import time
 
@@ -27,47 +62,228 @@ HF_DATASET_REPO = os.getenv("HF_DATASET_REPO")
 HF_REVISION = os.getenv("HF_DATASET_REVISION", "main")
 
 
+def _build_dense_retriever(
+    config: RagConfig,
+    vector_store,
+    vs_dir=None,
+    timings: dict[str, float] | None = None,
+):
+    """
+    Build the dense retriever over a loaded vector store.
+    """
+
+    retr_cfg = config.nodes.retrieve
+    vs_config = config.vector_stores[retr_cfg.dense_vector_store_key]
+    dense_params = dict(retr_cfg.dense_params)
+    rescore_candidates = dense_params.pop("rescore_candidates", None)
+    if vs_config.type == VectorStoreType.FAISS:
+        dense_params, index_params = split_faiss_search_params(dense_params)
+        set_faiss_search_params(vector_store.index, index_params)
+        with timed(timings, "build_metadata_index"):
+            dense_retriever = FAISSRetriever(
+                vector_store=vector_store,
+                k=dense_params.get("k", 4),
+                vectors=load_rescore_vectors(vs_dir) if rescore_candidates else None,
+                rescore_candidates=rescore_candidates or 0,
+                metadata_index=build_faiss_metadata_index(vector_store),
+            )
+    elif vs_config.type == VectorStoreType.OPENSEARCH:
+        dense_retriever = OpenSearchRetriever(
+            vector_store=vector_store, search_kwargs=dense_params
+        )
+    else:
+        dense_retriever = vector_store.as_retriever(search_kwargs=dense_params)
+
+    return dense_retriever
+
+
+def _build_source_sharded_retriever(
+    config: RagConfig, vs_dir=None
+) -> ShardedFAISSRetriever:
+    """
+    Load the per-source FAISS indexes under vs_dir as shards of one retriever,
+    searched in parallel instead of merged.
+    """
+    retr_cfg = config.nodes.retrieve
+    vs_config = config.vector_stores[retr_cfg.dense_vector_store_key]
+    vs_dir = Path(vs_dir or ART_DIR / vs_config.type)
+
+    shards = {}
+    for shard_dir in sorted(vs_dir.glob("*/")):
+        if not (shard_dir / "manifest.json").exists():
+            continue
+        vector_store = VS_REGISTRY[vs_config.type]["load"](vs_config, path=shard_dir)
+        #  re-scored with the shard's own vectors.npy: the merged one is in the
+        #  row order of the merged index. Per-source indexes are flat and have
+        #  none, their search is exact already
+        shards[shard_dir.name] = _build_dense_retriever(
+            config, vector_store, vs_dir=shard_dir
+        )
+    print(f"[retrieve] loaded {len(shards)} source shards from {vs_dir}")
+
+    return ShardedFAISSRetriever(shards=shards, k=retr_cfg.dense_params.get("k", 4))
+
+
+def _build_hybrid_retriever(
+    config: RagConfig,
+    dense_retriever,
+    docs: list[Document],
+    timings: dict[str, float] | None = None,
+) -> FilteredEnsembleRetriever:
+    """
+    Build the dense + sparse ensemble over a dense retriever and the documents.
+    """
+
+    retr_cfg = config.nodes.retrieve
+    sparse_params = dict(retr_cfg.sparse_params)
+    bm25_params = sparse_params.pop("bm25_params", None) or {}
+    with timed(timings, "build_bm25"):
+        tokenized_docs = batch_clean_tokens(
+            [doc.page_content for doc in docs], tokenizer=retr_cfg.sparse_tokenizer
+        )
+        sparse_retriever = FilteredBM25Retriever(
+            vectorizer=BM25Okapi(tokenized_docs, **bm25_params),
+            docs=docs,
+            preprocess_func=get_query_tokenizer(retr_cfg.sparse_tokenizer),
+            metadata_index=build_metadata_index(docs),
+            **sparse_params,
+        )
+
+    return FilteredEnsembleRetriever(
+        retrievers=[dense_retriever, sparse_retriever],
+        weights=retr_cfg.ensemble_weights,
+    )
+
+
+def _build_opensearch_hybrid_retriever(config: RagConfig) -> OpenSearchHybridRetriever:
+    """
+    Dense and lexical retrieval both served by OpenSearch, with pooled sync and
+    async clients.
+    """
+    from app.utils.opensearch import (
+        build_async_opensearch_client,
+        build_opensearch_client,
+    )
+
+    retr_cfg = config.nodes.retrieve
+    vs_config = config.vector_stores[retr_cfg.dense_vector_store_key]
+    if vs_config.type != VectorStoreType.OPENSEARCH:
+        raise ValueError("OpenSearch sparse retrieval needs an OpenSearch vector store")
+
+    url = os.getenv("OPENSEARCH_COLLECTION_ENDPOINT")
+    connection = vs_config.kwargs.get("connection", {})
+    sparse_params = retr_cfg.sparse_params
+    return OpenSearchHybridRetriever(
+        client=build_opensearch_client(url, connection),
+        async_client=build_async_opensearch_client(url, connection),
+        index_name=vs_config.kwargs["index_name"],
+        embeddings=build_embeddings(
+            vs_config.embedding_model, vs_config.dimensions, vs_config.dimension_mode
+        ),
+        k_dense=retr_cfg.dense_params.get("k", 10),
+        k_sparse=sparse_params.get("k", 10),
+        weights=retr_cfg.ensemble_weights,
+        mode=sparse_params.get("mode", "msearch"),
+        search_pipeline=sparse_params.get("search_pipeline"),
+    )
+
+
+def _load_tenant_retriever(config: RagConfig, tenant_id: str):
+    """
+    Load the index of one tenant from artifacts/tenants/<tenant_id> and build its
+    hybrid retriever. BM25 is built from the documents in the FAISS docstore.
+    """
+    shard_dir = TENANT_DIR / check_tenant_id(tenant_id)
+    if not (shard_dir / "manifest.json").exists():
+        raise UnknownTenantError(f"No index for tenant {tenant_id!r}")
+
+    vs_config = config.vector_stores[config.nodes.retrieve.dense_vector_store_key]
+    vector_store = VS_REGISTRY[vs_config.type]["load"](vs_config, path=shard_dir)
+    docstore_ids = vector_store.index_to_docstore_id
+    docs = [
+        vector_store.docstore.search(docstore_ids[i])
+        for i in range(vector_store.index.ntotal)
+    ]
+    dense_retriever = _build_dense_retriever(config, vector_store, vs_dir=shard_dir)
+    return _build_hybrid_retriever(config, dense_retriever, docs)
+
+
+def _tenant_shard_size_mb(tenant_id: str) -> float:
+    """
+    Estimate the memory of a loaded shard from the size of its files on disk.
+    """
+    shard_dir = TENANT_DIR / tenant_id
+    return sum(path.stat().st_size for path in shard_dir.iterdir()) / 1e6
+
+
 def _build_retriever(
     config: RagConfig,
     **kwargs,
-) -> ContextualCompressionRetriever | EnsembleRetriever:
+) -> ChunkRetriever:
     """
     Build the hybrid retriever (dense + sparse ensemble, optionally wrapped with a reranker)
     based on the retrieve-node section of the config.
+    With tenant_shards, the ensemble is built per tenant on the tenant's first query.
     """
 
     retr_cfg = config.nodes.retrieve
     vs_config = config.vector_stores[retr_cfg.dense_vector_store_key]
     vs_dir = kwargs.get("vs_dir")
     doc_dir = kwargs.get("doc_dir")
-    vector_store = VS_REGISTRY[vs_config.type]["load"](
-        vs_config,
-        path=vs_dir,
-    )
-    dense_retriever = vector_store.as_retriever(search_kwargs=retr_cfg.dense_params)
+    timings = kwargs.get("timings")
 
-    if retr_cfg.sparse_type.lower() != "bm25":
+    sparse_type = retr_cfg.sparse_type.lower()
+    if sparse_type not in ("bm25", "opensearch"):
         raise ValueError(f"Unsupported sparse retriever type: {retr_cfg.sparse_type}")
 
-    docs = load_docs(vs_config, doc_dir=doc_dir)
-    sparse_retriever = BM25Retriever.from_documents(
-        docs,
-        **retr_cfg.sparse_params,
-        preprocess_func=clean_tokens,
-    )
-
-    hybrid_retriever = EnsembleRetriever(
-        retrievers=[dense_retriever, sparse_retriever],
-        weights=retr_cfg.ensemble_weights,
-    )
+    if sparse_type == "opensearch":
+        #  no corpus in memory, OpenSearch does the lexical search too
+        hybrid_retriever = _build_opensearch_hybrid_retriever(config)
+    elif retr_cfg.tenant_shards:
+        if vs_config.type != VectorStoreType.FAISS:
+            raise ValueError("Tenant shards are only supported for FAISS")
+        shards = ShardCache(
+            load=partial(_load_tenant_retriever, config),
+            size_mb=_tenant_shard_size_mb,
+            max_shards=retr_cfg.max_loaded_shards,
+            max_memory_mb=retr_cfg.max_shard_memory_mb,
+        )
+        hybrid_retriever = TenantShardedRetriever(shards=shards)
+    else:
+        if retr_cfg.source_shards:
+            if vs_config.type != VectorStoreType.FAISS:
+                raise ValueError("Source shards are only supported for FAISS")
+            with timed(timings, "load_vector_store"):
+                dense_retriever = _build_source_sharded_retriever(config, vs_dir)
+        else:
+            with timed(timings, "load_vector_store"):
+                vector_store = VS_REGISTRY[vs_config.type]["load"](
+                    vs_config,
+                    path=vs_dir,
+                )
+            dense_retriever = _build_dense_retriever(
+                config, vector_store, vs_dir=vs_dir, timings=timings
+            )
+        with timed(timings, "load_docs"):
+            docs = load_docs(vs_config, doc_dir=doc_dir)
+        hybrid_retriever = _build_hybrid_retriever(
+            config, dense_retriever, docs, timings=timings
+        )
 
     if retr_cfg.reranker_type.lower() == "cohere":
-        reranker = CohereRerank(**retr_cfg.reranker_params)
-        rerank_retriever = ContextualCompressionRetriever(
-            base_compressor=reranker,
+        with timed(timings, "build_reranker"):
+            import cohere
+            from langchain_cohere import CohereRerank
+
+            client = cohere.ClientV2(
+                COHERE_API_KEY, timeout=retr_cfg.reranker_timeout_s
+            )
+            reranker = CohereRerank(client=client, **retr_cfg.reranker_params)
+        return RerankRetriever(
             base_retriever=hybrid_retriever,
+            reranker=reranker,
+            max_concurrency=config.batch.max_concurrency,
         )
-        return rerank_retriever
 
     if retr_cfg.reranker_type.lower() in ("none", "", "null"):
         return hybrid_retriever
@@ -81,12 +297,21 @@ def _build_llms(config: RagConfig):
     Returns (query_analysis_llm, generate_llm).
     """
 
+    def client_kwargs(llm: LLMConfig) -> dict:
+        kwargs = {}
+        if llm.timeout_s is not None:
+            kwargs["timeout"] = llm.timeout_s
+        if llm.max_retries is not None:
+            kwargs["max_retries"] = llm.max_retries
+        return kwargs
+
     aq_cfg = config.nodes.analyze_query
     aq_llm = config.llms[aq_cfg.llm_key]
     query_analysis_llm = init_chat_model(
         model=aq_llm.model_name,
         model_provider=aq_llm.model_provider,
         temperature=aq_cfg.temperature,
+        **client_kwargs(aq_llm),
     )
 
     gen_cfg = config.nodes.generate
@@ -95,6 +320,7 @@ def _build_llms(config: RagConfig):
         model=gen_llm.model_name,
         model_provider=gen_llm.model_provider,
         temperature=gen_cfg.temperature,
+        **client_kwargs(gen_llm),
     )
 
     return query_analysis_llm, generate_llm
@@ -125,52 +351,320 @@ class Search(TypedDict):
     query: Annotated[str, ..., "Search query to run."]
 
 
+def _add_degradations(applied: list[str], new: list[str]) -> list[str]:
+    return applied + [d for d in new if d not in applied]
+
+
 class State(TypedDict):
     question: str
+    filters: dict
+    tenant_id: str
+    #  time.monotonic() by which the answer is due, see DeadlineConfig
+    deadline: float
     query: Search
+    speculative_chunks: list[Chunk]
+    chunks: list[Chunk]
+    #  Documents of the chunks passed to generate, for the caller
     contexts: list[Document]
     answer: str
     metadata: dict
+    #  stages skipped or degraded to meet the deadline
+    degradations: Annotated[list[str], _add_degradations]
+
+
+class Output(TypedDict):
+    """
+    The state returned by invoke, without the internal Chunk records.
+    """
+
+    question: str
+    filters: dict
+    tenant_id: str
+    query: Search
+    contexts: list[Document]
+    answer: str
+    metadata: dict
+    degradations: list[str]
+
+
+def _is_keyword_query(question: str, max_words: int) -> bool:
+    """
+    A question is keyword-like when it is short and not phrased as a question.
+    """
+    words = question.split()
+    return 0 < len(words) <= max_words and not question.rstrip().endswith("?")
+
+
+def _queries_equivalent(question: str, query: str) -> bool:
+    """
+    Two queries are equivalent when they reduce to the same set of keywords.
+    """
+    return set(regex_clean_tokens(question)) == set(regex_clean_tokens(query))
+
+
+def _merge_contexts(primary: list[Chunk], secondary: list[Chunk]) -> list[Chunk]:
+    """
+    Interleave two ranked lists of chunks, dropping duplicates.
+    The result is capped at the length of the longer list, so the number of
+    contexts passed to generate stays the same as for a single retrieval.
+    """
+    limit = max(len(primary), len(secondary))
+    merged = []
+    seen = set()
+    for i in range(limit):
+        for chunks in (primary, secondary):
+            if i < len(chunks) and chunks[i].id not in seen:
+                seen.add(chunks[i].id)
+                merged.append(chunks[i])
+
+    return merged[:limit]
 
 
 def build_graph(config: RagConfig, eval_mode: bool = False, **kwargs):
     if eval_mode:
         time.sleep(8)  #  prevent rate-limiting from Cohere when evaluating
 
-    query_analysis_llm, generate_llm = _build_llms(config)
-    analyze_query_prompt, generate_prompt = _build_prompts(config)
+    timings = kwargs.get("timings")
+    with timed(timings, "build_llms"):
+        query_analysis_llm, generate_llm = _build_llms(config)
+    with timed(timings, "build_prompts"):
+        analyze_query_prompt, generate_prompt = _build_prompts(config)
     retriever = _build_retriever(config, **kwargs)
+    skip_rewrite_max_words = config.nodes.analyze_query.skip_rewrite_max_words
+    speculative = config.nodes.retrieve.speculative
+    tenant_shards = config.nodes.retrieve.tenant_shards
+    batch_config = config.batch
+    deadlines = config.deadlines
+
+    def _rewrite_input(question: str):
+        if analyze_query_prompt is not None:
+            return analyze_query_prompt.invoke({"question": question})
+        return question
 
     def analyze_query(state: State):
+        if _is_keyword_query(state["question"], skip_rewrite_max_words):
+            return {"query": {"query": state["question"]}}
+
+        #  the rewrite may use the budget not reserved for retrieve and generate
+        timeout_s = remaining_s(state.get("deadline")) - (
+            deadlines.retrieve_s + deadlines.generate_s
+        )
+        if timeout_s < deadlines.rewrite_s:
+            return {
+                "query": {"query": state["question"]},
+                "degradations": ["skip_rewrite"],
+            }
         structured_llm = query_analysis_llm.with_structured_output(Search)
-        if analyze_query_prompt is not None:
-            messages = analyze_query_prompt.invoke({"question": state["question"]})
-            query = structured_llm.invoke(messages)
-        else:
-            query = structured_llm.invoke(state["question"])
+        try:
+            query = call_with_timeout(
+                structured_llm.invoke, timeout_s, _rewrite_input(state["question"])
+            )
+        except DeadlineExceeded:
+            return {
+                "query": {"query": state["question"]},
+                "degradations": ["skip_rewrite"],
+            }
 
         return {"query": query}
 
+    def _routing(state: State) -> tuple[Filters | None, str | None]:
+        """
+        The filters and tenant shard of a request. Without tenant shards, the
+        tenant becomes a tenant_id filter on the shared index.
+        """
+        filters = state.get("filters")
+        tenant_id = state.get("tenant_id")
+        if tenant_id and not tenant_shards:
+            return {**(filters or {}), "tenant_id": [tenant_id]}, None
+        return filters, tenant_id
+
+    def _retrieve(query: str, state: State) -> tuple[list[Chunk], list[str]]:
+        """
+        Pass the request's filters and tenant on to the retriever.
+        With a deadline, the search may take the budget left, but rerank must
+        leave the time reserved for generate: when it cannot, it is skipped
+        and the top chunks are taken in fused order.
+        Returns the chunks and the degradations applied.
+        """
+        filters, tenant_id = _routing(state)
+        retrieve_kwargs = {}
+        if tenant_id:
+            retrieve_kwargs["tenant_id"] = tenant_id
+        if filters:
+            retrieve_kwargs["filters"] = filters
+        deadline = state.get("deadline")
+        if deadline is None:
+            return retrieve_chunks(retriever, query, **retrieve_kwargs), []
+
+        rerank = isinstance(retriever, RerankRetriever)
+        chunks = call_with_timeout(
+            retrieve_chunks,
+            remaining_s(deadline),
+            retriever.base_retriever if rerank else retriever,
+            query,
+            **retrieve_kwargs,
+        )
+        if not rerank:
+            return chunks, []
+        timeout_s = remaining_s(deadline) - deadlines.generate_s
+        if timeout_s >= deadlines.rerank_s:
+            try:
+                return call_with_timeout(retriever.rerank, timeout_s, query, chunks), []
+            except DeadlineExceeded:
+                pass
+        return chunks[: retriever.top_n], ["skip_rerank"]
+
+    def speculative_retrieve(state: State):
+        retrieved_chunks, degradations = _retrieve(state["question"], state)
+
+        return {"speculative_chunks": retrieved_chunks, "degradations": degradations}
+
     def retrieve(state: State):
         query = state["query"]
-        retrieved_docs = retriever.invoke(query["query"])
+        speculative_chunks = state.get("speculative_chunks")
+        degradations = []
+        if speculative_chunks is None:
+            retrieved_chunks, degradations = _retrieve(query["query"], state)
+        elif _queries_equivalent(state["question"], query["query"]):
+            retrieved_chunks = speculative_chunks
+        else:
+            retrieved_chunks, degradations = _retrieve(query["query"], state)
+            retrieved_chunks = _merge_contexts(retrieved_chunks, speculative_chunks)
 
-        return {"contexts": retrieved_docs}
+        return {"chunks": retrieved_chunks, "degradations": degradations}
 
-    def generate(state: State):
-        context = "".join(doc.page_content + " " for doc in state["contexts"])
-        messages = generate_prompt.invoke(
-            {"question": state["question"], "context": context}
-        )
-        response = generate_llm.invoke(messages)
+    def _generate_input(question: str, chunks: list[Chunk]):
+        context = "".join(chunk.text + " " for chunk in chunks)
+        return generate_prompt.invoke({"question": question, "context": context})
+
+    def _answer(response, chunks: list[Chunk]) -> dict:
         metadata = {"model_name": response.response_metadata["model_name"]}
-        answer = {"answer": response.content, "metadata": metadata}
+        return {
+            "answer": response.content,
+            "metadata": metadata,
+            "contexts": to_documents(chunks),
+        }
 
-        return answer
+    def generate(state: State):
+        chunks = state["chunks"]
+        timeout_s = remaining_s(state.get("deadline"))
+        degradations = []
+        if (
+            timeout_s < deadlines.generate_s
+            and len(chunks) > deadlines.truncated_contexts
+        ):
+            #  a shorter prompt, for a faster answer
+            chunks = chunks[: deadlines.truncated_contexts]
+            degradations.append("truncate_context")
+        response = call_with_timeout(
+            generate_llm.invoke, timeout_s, _generate_input(state["question"], chunks)
+        )
 
-    graph_builder = StateGraph(State).add_sequence([analyze_query, retrieve, generate])
-    graph_builder.add_edge(START, "analyze_query")
+        return {**_answer(response, chunks), "degradations": degradations}
+
+    def answer_batch(
+        inputs: list[dict], max_concurrency: int | None = None
+    ) -> Iterator[dict]:
+        """
+        Answer several requests (question, filters, tenant_id, as for invoke),
+        yielding results as they complete, each with the index of its request:
+        {"index", "question", "answer", "metadata", "contexts"}, or
+        {"index", "question", "error"} for a request that failed.
+
+        Queries are rewritten by concurrent LLM calls, then retrieved together
+        (one embedding call, one BM25 sparse matrix product, concurrent rerank
+        calls) and answered by concurrent LLM calls, with at most
+        max_concurrency calls of each kind in flight.
+        """
+        runnable_config = {
+            "max_concurrency": max_concurrency or batch_config.max_concurrency
+        }
+
+        def error(i: int, e: Exception) -> dict:
+            return {
+                "index": i,
+                "question": inputs[i]["question"],
+                "error": f"{type(e).__name__}: {e}",
+            }
+
+        queries = {}
+        rewrites = []
+        for i, state in enumerate(inputs):
+            if _is_keyword_query(state["question"], skip_rewrite_max_words):
+                queries[i] = state["question"]
+            else:
+                rewrites.append(i)
+        if rewrites:
+            structured_llm = query_analysis_llm.with_structured_output(Search)
+            rewritten = structured_llm.batch(
+                [_rewrite_input(inputs[i]["question"]) for i in rewrites],
+                runnable_config,
+                return_exceptions=True,
+            )
+            for i, query in zip(rewrites, rewritten):
+                if isinstance(query, Exception):
+                    yield error(i, query)
+                else:
+                    queries[i] = query["query"]
+
+        #  one retrieval call per tenant shard, or for all requests
+        filters = {}
+        groups = defaultdict(list)
+        for i in queries:
+            filters[i], tenant_id = _routing(inputs[i])
+            groups[tenant_id].append(i)
+        chunks = {}
+        for tenant_id, indexes in groups.items():
+            try:
+                chunk_lists = retrieve_chunks_batch(
+                    retriever,
+                    [queries[i] for i in indexes],
+                    [filters[i] for i in indexes],
+                    **({"tenant_id": tenant_id} if tenant_id else {}),
+                )
+            except Exception as e:
+                for i in indexes:
+                    yield error(i, e)
+                continue
+            chunks.update(zip(indexes, chunk_lists))
+
+        indexes = list(chunks)
+        responses = generate_llm.batch_as_completed(
+            [_generate_input(inputs[i]["question"], chunks[i]) for i in indexes],
+            runnable_config,
+            return_exceptions=True,
+        )
+        for j, response in responses:
+            i = indexes[j]
+            if isinstance(response, Exception):
+                yield error(i, response)
+            else:
+                yield {
+                    "index": i,
+                    "question": inputs[i]["question"],
+                    **_answer(response, chunks[i]),
+                }
+
+    if speculative:
+        #  retrieval on the raw question runs alongside analyze_query,
+        #  retrieve waits for both before deciding which results to use
+        graph_builder = StateGraph(State, output_schema=Output)
+        graph_builder.add_node(analyze_query)
+        graph_builder.add_node(speculative_retrieve)
+        graph_builder.add_node(retrieve)
+        graph_builder.add_node(generate)
+        graph_builder.add_edge(START, "analyze_query")
+        graph_builder.add_edge(START, "speculative_retrieve")
+        graph_builder.add_edge(["analyze_query", "speculative_retrieve"], "retrieve")
+        graph_builder.add_edge("retrieve", "generate")
+    else:
+        graph_builder = StateGraph(State, output_schema=Output).add_sequence(
+            [analyze_query, retrieve, generate]
+        )
+        graph_builder.add_edge(START, "analyze_query")
     graph = graph_builder.compile()
+    graph.retriever = retriever
+    graph.answer_batch = answer_batch
 
     return graph
 
@@ -0,0 +1,98 @@
+"""
+Report import time and per-phase lifespan time of the API process.
+
+Usage:
+    python -m app.startup_profile [--top 15] [--imports-only]
+"""
+
+import argparse
+import asyncio
+import importlib
+import subprocess
+import sys
+import time
+
+#  optional, backend-specific packages that should only be imported when
+#  the active config selects them
+DEFERRED_MODULES = [
+    "langchain_community.vectorstores.faiss",
+    "langchain_community.vectorstores.opensearch_vector_search",
+    "opensearchpy",
+    "boto3",
+    "langchain_cohere",
+    "huggingface_hub",
+    "ftfy",
+    "url_normalize",
+    "nltk",
+    "langchain_unstructured",
+]
+
+
+def _import_times_by_package(module: str, top: int) -> list[tuple[str, float]]:
+    """
+    Import module in a fresh interpreter with -X importtime, and return the
+    slowest packages by total self time in seconds (time spent executing the
+    package's own modules, so nested imports are not double counted).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            #  header line
+            continue
+        package = name.strip().split(".")[0]
+        times[package] = times.get(package, 0) + int(self_us)
+
+    ranked = sorted(times.items(), key=lambda item: item[1], reverse=True)
+    return [(name, us / 1e6) for name, us in ranked[:top]]
+
+
+async def _run_lifespan(main_module) -> dict[str, float]:
+    async with main_module.lifespan(main_module.app):
+        pass
+    return main_module.app.state.startup_timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument(
+        "--imports-only",
+        action="store_true",
+        help="skip running the lifespan (no artifacts or API keys needed)",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    main_module = importlib.import_module("app.main")
+    import_seconds = time.perf_counter() - start
+
+    print(f"[startup_profile] import app.main: {import_seconds:.2f}s")
+    print("[startup_profile] slowest packages to import (fresh interpreter):")
+    for name, seconds in _import_times_by_package("app.main", args.top):
+        print(f"  {name:<32}{seconds:>8.2f}s")
+
+    loaded = [m for m in DEFERRED_MODULES if m in sys.modules]
+    print(f"[startup_profile] deferred modules imported eagerly: {loaded or 'none'}")
+
+    if args.imports_only:
+        return
+
+    timings = asyncio.run(_run_lifespan(main_module))
+    print("[startup_profile] lifespan phases:")
+    for phase, seconds in timings.items():
+        print(f"  {phase:<32}{seconds:>8.2f}s")
+
+    loaded = [m for m in DEFERRED_MODULES if m in sys.modules]
+    print(f"[startup_profile] deferred modules imported by lifespan: {loaded}")
+
+
+if __name__ == "__main__":
+    main()
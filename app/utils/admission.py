@@ -0,0 +1,174 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    """
+    A request turned away by admission control, to be answered with
+    status_code and a Retry-After of retry_after_s.
+    """
+
+    def __init__(self, status_code: int, reason: str, retry_after_s: int):
+        super().__init__(f"Server overloaded ({reason}), retry in {retry_after_s}s")
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionController:
+    """
+    Per-worker admission control: at most max_in_flight requests are served at
+    once, and at most max_queue wait for a slot, in arrival order.
+
+    A request is rejected right away, rather than after waiting, when the queue
+    is full (429), or when its estimated wait, from its place in the queue and
+    the average service time, exceeds queue_timeout_s (503). A request still
+    waiting after queue_timeout_s is rejected too (503). Requests that are
+    admitted therefore wait at most queue_timeout_s before being served.
+
+    Runs on the event loop of the worker, it is not thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 16,
+        max_queue: int = 64,
+        queue_timeout_s: float = 10.0,
+        service_time_s: float = 5.0,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        #  moving average of the time requests hold a slot, seeded with an estimate
+        self.service_time_s = service_time_s
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "deadline": 0, "timeout": 0}
+        self.queue_wait_s = 0.0
+        self.queued = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _estimated_wait_s(self, position: int) -> float:
+        return position * self.service_time_s / max(self.max_in_flight, 1)
+
+    def retry_after_s(self) -> int:
+        return max(1, math.ceil(self._estimated_wait_s(self.queue_depth + 1)))
+
+    def _reject(self, reason: str, status_code: int):
+        self.rejected[reason] += 1
+        raise Overloaded(status_code, reason, self.retry_after_s())
+
+    def _remove(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    async def acquire(self):
+        """
+        Wait for a slot, or raise Overloaded.
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if self.queue_depth >= self.max_queue:
+            self._reject("queue_full", 429)
+        if self._estimated_wait_s(self.queue_depth + 1) > self.queue_timeout_s:
+            self._reject("deadline", 503)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            self._remove(waiter)
+            self._reject("timeout", 503)
+        except asyncio.CancelledError:
+            #  e.g. the client went away
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._remove(waiter)
+            raise
+        self.admitted += 1
+        self.queued += 1
+        self.queue_wait_s += time.monotonic() - start
+
+    def release(self, service_time_s: float | None = None):
+        """
+        Free a slot, handing it to the longest waiting request if any.
+        service_time_s updates the average service time.
+        """
+        if service_time_s is not None:
+            self.service_time_s = 0.8 * self.service_time_s + 0.2 * service_time_s
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                #  the slot passes to the waiter, in_flight is unchanged
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def metrics(self) -> str:
+        """
+        The admission metrics in the Prometheus text format.
+        """
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append(f"# HELP rag_admission_{name} {help}")
+            lines.append(f"# TYPE rag_admission_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"rag_admission_{name}{labels} {value}")
+
+        metric("in_flight", "gauge", "Requests being served.", [("", self.in_flight)])
+        metric(
+            "queue_depth",
+            "gauge",
+            "Requests waiting for a slot.",
+            [("", self.queue_depth)],
+        )
+        metric(
+            "max_in_flight",
+            "gauge",
+            "Requests served at once.",
+            [("", self.max_in_flight)],
+        )
+        metric("admitted_total", "counter", "Requests admitted.", [("", self.admitted)])
+        metric(
+            "rejected_total",
+            "counter",
+            "Requests rejected, by reason.",
+            [(f'{{reason="{reason}"}}', n) for reason, n in self.rejected.items()],
+        )
+        metric(
+            "queue_wait_seconds",
+            "summary",
+            "Time admitted requests waited in the queue.",
+            [("_sum", round(self.queue_wait_s, 6)), ("_count", self.queued)],
+        )
+        metric(
+            "service_time_seconds",
+            "gauge",
+            "Moving average of the time requests hold a slot.",
+            [("", round(self.service_time_s, 6))],
+        )
+        return "\n".join(lines) + "\n"
@@ -1,83 +1,288 @@
+import hashlib
 import shutil
 import json
 import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from huggingface_hub import snapshot_download, HfFileSystem
 from app.config import VectorStoreConfig
-from app.utils.paths import DOC_DIR, ART_DIR, PDF_DIR, WEB_DIR
+from app.utils.paths import ART_DIR, PDF_DIR, WEB_DIR
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parents[2]
-HF_DATASET_REPO = os.getenv("HF_DATASET_REPO")
 
+SYNC_STATE_PATH = ART_DIR / ".sync_state.json"
+STAGING_DIR = ART_DIR / ".sync_staging"
+SYNC_DIR = ART_DIR / "synced"
+PARTIAL_MAX_AGE_S = 3600
+URLS_REMOTE_PATH = "source_docs/web/urls.json"
 
-def _copy_if_missing(src: Path, dst: Path) -> None:
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    if not dst.exists():
-        shutil.copy2(src, dst)
 
-
-def _check_for_pdfs(remote_fs):
+@dataclass
+class RemoteFile:
+    """
+    A file in the remote dataset repo and its content hash.
+    LFS files are hashed with sha256, other files with their git blob sha1.
     """
-    Compare local pdfs to those in the remote dataset repo.
 
-    Return a list of remote paths of pdfs missing locally
+    path: str
+    size: int
+    hash: str
+    algorithm: str
+
+
+def _remote_manifest(api, repo_id: str, revision: str) -> dict[str, RemoteFile]:
+    """
+    List every file in the remote dataset repo with its content hash,
+    in a single call to the Hub.
     """
+    from huggingface_hub.hf_api import RepoFile
 
-    local_pdf_names = [pdf.stem for pdf in PDF_DIR.glob("*")]
-    remote_pdf_files = [
-        Path(pdf)
-        for pdf in remote_fs.glob(f"datasets/{HF_DATASET_REPO}/source_docs/pdf/*")
-    ]
-    missing_pdf_paths = [
-        Path(*pdf.parts[3:])
-        for pdf in remote_pdf_files
-        if pdf.stem not in local_pdf_names
-    ]
-    return missing_pdf_paths
+    manifest = {}
+    for entry in api.list_repo_tree(
+        repo_id, recursive=True, repo_type="dataset", revision=revision
+    ):
+        if not isinstance(entry, RepoFile):
+            continue
+        if entry.lfs is not None:
+            remote_file = RemoteFile(entry.path, entry.size, entry.lfs.sha256, "sha256")
+        else:
+            remote_file = RemoteFile(entry.path, entry.size, entry.blob_id, "git-sha1")
+        manifest[entry.path] = remote_file
 
+    return manifest
 
-def _check_for_urls(remote_fs):
+
+def _snapshot_path(remote_path: str) -> Path | None:
+    """
+    Map a remote index or document file to its path inside a snapshot dir.
+    Returns None for remote files that are not part of a snapshot.
     """
-    Compare local web urls to those in the remote dataset repo.
+    parts = Path(remote_path).parts
+
+    #  only the merged index, not the per-source indexes below it
+    if parts[:2] == ("vector_stores", "faiss") and len(parts) == 3:
+        return Path("faiss", parts[2])
+    if parts[:2] == ("vector_stores", "documents") and len(parts) == 4:
+        return Path("documents", parts[2], parts[3])
 
-    Return a list of urls (str) missing locally
+    return None
+
+
+def _local_path(
+    remote_path: str, want_sources: bool, root: Path | None = None
+) -> Path | None:
+    """
+    Map a path in the remote dataset repo to its local destination.
+    Index and document files go below root (artifacts/ by default).
+    Returns None for remote files that are not synced.
     """
+    rel = _snapshot_path(remote_path)
+    if rel is not None:
+        return (root or ART_DIR) / rel
+
+    parts = Path(remote_path).parts
+    if want_sources and parts[:2] == ("source_docs", "pdf") and len(parts) == 3:
+        return PDF_DIR / parts[2]
+
+    return None
+
+
+def _git_blob_sha1(path: Path) -> str:
+    digest = hashlib.sha1(f"blob {path.stat().st_size}\0".encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_hash(path: Path, algorithm: str) -> str:
+    return _sha256(path) if algorithm == "sha256" else _git_blob_sha1(path)
+
+
+def _load_sync_state() -> dict[str, dict]:
     try:
-        with open(WEB_DIR / "urls.json", "r") as f:
-            local_urls = json.load(f)["urls"]
+        with open(SYNC_STATE_PATH, "r") as f:
+            return json.load(f)
     except FileNotFoundError:
-        local_urls = []
-    with remote_fs.open(
-        f"datasets/{HF_DATASET_REPO}/source_docs/web/urls.json", "r"
-    ) as f:
-        remote_urls = json.load(f)["urls"]
-    missing_urls = [url for url in remote_urls if url not in local_urls]
-    return missing_urls
+        return {}
+
+
+def _save_sync_state(state: dict[str, dict]) -> None:
+    SYNC_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(SYNC_STATE_PATH, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+
+def _record(state: dict[str, dict], remote_file: RemoteFile, dst: Path) -> None:
+    stat = dst.stat()
+    state[str(dst)] = {
+        "hash": remote_file.hash,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def _is_current(remote_file: RemoteFile, dst: Path, state: dict[str, dict]) -> bool:
+    """
+    Check whether the local file at dst has the same content as remote_file.
+    Files are only re-hashed when their size or mtime changed since the last sync.
+    """
+    if not dst.exists():
+        return False
 
+    stat = dst.stat()
+    if stat.st_size != remote_file.size:
+        return False
 
-def _check_for_docs(remote_fs):
+    recorded = state.get(str(dst))
+    if (
+        recorded
+        and recorded["size"] == stat.st_size
+        and recorded["mtime_ns"] == stat.st_mtime_ns
+    ):
+        return recorded["hash"] == remote_file.hash
+
+    if _file_hash(dst, remote_file.algorithm) == remote_file.hash:
+        _record(state, remote_file, dst)
+        return True
+    return False
+
+
+def _plan_sync(
+    remote_files: dict[str, RemoteFile],
+    state: dict[str, dict],
+    want_sources: bool = True,
+    root: Path | None = None,
+) -> list[tuple[RemoteFile, Path]]:
+    """
+    Return the (remote file, local destination) pairs whose content differs
+    from the remote dataset repo.
     """
-    Compare local documents to those in the remote dataset repo.
+    plan = []
+    for remote_path, remote_file in sorted(remote_files.items()):
+        dst = _local_path(remote_path, want_sources, root)
+        if dst is not None and not _is_current(remote_file, dst, state):
+            plan.append((remote_file, dst))
+
+    return plan
 
-    Return a list of remote paths of documents missing locally
+
+def _download(repo_id: str, revision: str, remote_file: RemoteFile, dst: Path):
+    """
+    Download remote_file into the staging dir and move it to dst.
+    The staging dir sits next to the artifacts, so the move is a rename rather
+    than a second copy, and readers never see a partially written file.
     """
+    from huggingface_hub import hf_hub_download
 
-    local_docs_subdirs_names = [subdir.stem for subdir in DOC_DIR.glob("*/")]
-    remote_docs_subdirs = [
-        Path(subdir)
-        for subdir in remote_fs.glob(
-            f"datasets/{HF_DATASET_REPO}/vector_stores/documents/*/"
+    staged = Path(
+        hf_hub_download(
+            repo_id=repo_id,
+            filename=remote_file.path,
+            repo_type="dataset",
+            revision=revision,
+            local_dir=STAGING_DIR,
         )
-    ]
-    missing_docs_paths = [
-        Path(*subdir.parts[3:]) / "documents.jsonl"
-        for subdir in remote_docs_subdirs
-        if subdir.stem not in local_docs_subdirs_names
-    ]
-    return missing_docs_paths
+    )
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(staged, dst)
+    except OSError:
+        #  staging dir and destination on different filesystems
+        shutil.move(staged, dst)
+
+
+def _current_snapshot() -> Path | None:
+    """
+    Resolve the snapshot dir the "current" symlink points to, if any.
+    """
+    link = SYNC_DIR / "current"
+    return SYNC_DIR / os.readlink(link) if link.exists() else None
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    """
+    Carry an unchanged file over into a new snapshot. Files of an older snapshot
+    are hard linked, as snapshots are never written to after the swap. Files of
+    the plain artifacts/ layout are copied, because local ingestion rewrites
+    them in place.
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if src.is_relative_to(SYNC_DIR):
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def _switch_current(snapshot: Path) -> None:
+    """
+    Point the "current" symlink at snapshot in a single rename, so readers see
+    either the old or the new snapshot, never a mix of both.
+    """
+    tmp_link = SYNC_DIR / f".current.{os.getpid()}"
+    tmp_link.unlink(missing_ok=True)
+    os.symlink(snapshot.name, tmp_link)
+    os.replace(tmp_link, SYNC_DIR / "current")
+
+
+def _prune_snapshots(keep: set[Path]) -> None:
+    """
+    Remove old snapshots, keeping the given ones. The previous snapshot is kept,
+    since the graph that is still serving requests may read from it. Partial
+    snapshots are only removed once they are old enough to be left behind by
+    a crashed sync rather than one still running.
+    """
+    for path in SYNC_DIR.iterdir():
+        if path.is_symlink() or not path.is_dir() or path in keep:
+            continue
+        if path.name.endswith(".partial"):
+            if time.time() - path.stat().st_mtime < PARTIAL_MAX_AGE_S:
+                continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _merge_remote_urls(repo_id: str, revision: str) -> None:
+    """
+    Add the web urls from the remote dataset repo that are missing locally.
+    """
+    from huggingface_hub import hf_hub_download
+
+    remote_urls_path = hf_hub_download(
+        repo_id=repo_id,
+        filename=URLS_REMOTE_PATH,
+        repo_type="dataset",
+        revision=revision,
+    )
+    with open(remote_urls_path, "r") as f:
+        remote_urls = json.load(f)["urls"]
+
+    try:
+        with open(WEB_DIR / "urls.json", "r") as f:
+            local_urls = json.load(f)["urls"]
+    except FileNotFoundError:
+        local_urls = []
+
+    missing_urls = [url for url in remote_urls if url not in local_urls]
+    if missing_urls:
+        WEB_DIR.mkdir(parents=True, exist_ok=True)
+        with open(WEB_DIR / "urls.json", "w") as f:
+            json.dump({"urls": local_urls + missing_urls}, f)
 
 
 def ensure_corpus_assets(
@@ -85,98 +290,103 @@ def ensure_corpus_assets(
     repo_id: str,
     revision: str = "main",
     want_sources: bool = True,
+    max_workers: int = 8,
 ) -> Path:
     """
-    Ensure FAISS index artifacts exist under artifacts/faiss/
-    (this location implies a merged vector store).
-    Ensure document artifacts exist under artifacts/documents
+    Ensure the merged FAISS index (artifacts/synced/current/faiss) and the
+    document artifacts (artifacts/synced/current/documents) match the HF
+    dataset repo.
     Optionally, ensure pdfs exist under data/pdf and web urls under data/web
 
-    If missing, download from HF dataset repo
+    Files are compared by content hash against the remote repo listing, and
+    only changed or missing files are downloaded, in parallel. Index and
+    document files are assembled into a new snapshot dir, unchanged files
+    carried over from the current one, and the "current" symlink is switched
+    to it once it is complete. The sync state is written last.
 
     Returns:
         (VS_dir, doc_dir)
     """
 
-    # if config.type != "faiss":
-    #     print(f"[artifacts] Vector store type {config.type} not supported.")
-    #     return None, None
-
     #  TODO:  decouple from FAISS, generalize to other vector stores
 
+    from huggingface_hub import HfApi
+
     faiss_dir = ART_DIR / "faiss"
-    index_faiss_path = faiss_dir / "index.faiss"
-    index_pkl_path = faiss_dir / "index.pkl"
-    manifest_path = faiss_dir / "manifest.json"
     doc_dir = ART_DIR / "documents"
 
-    # if already present, nothing to do
-    have_faiss = (
-        index_faiss_path.exists() and index_pkl_path.exists() and manifest_path.exists()
-    )
-    have_docs = doc_dir.exists()
-
-    print(f"[artifacts] have_faiss: {have_faiss}, have_docs: {have_docs}")
-
-    if have_faiss and have_docs and not want_sources:
-        return faiss_dir, doc_dir
-
-    remote_filesystem = HfFileSystem()
-
-    patterns = []
-    if not have_faiss:
-        vector_store_patterns = [
-            "vector_stores/faiss/index.faiss",
-            "vector_stores/faiss/index.pkl",
-            "vector_stores/faiss/manifest.json",
-        ]
-        patterns.extend(vector_store_patterns)
-
-    doc_patterns = [str(p) for p in _check_for_docs(remote_filesystem)]
-    if doc_patterns:
-        patterns.extend(doc_patterns)
-
-    if want_sources:
-        pdfs_to_download = [str(p) for p in _check_for_pdfs(remote_filesystem)]
-        if pdfs_to_download:
-            patterns.extend(pdfs_to_download)
-        urls_to_copy = _check_for_urls(remote_filesystem)
-        if urls_to_copy:
-            try:
-                with open(WEB_DIR / "urls.json", "r+") as f:
-                    urls = json.load(f)
-                    f.seek(0)
-                    urls["urls"].extend(urls_to_copy)
-                    json.dump(urls, f)
-            except FileNotFoundError:
-                WEB_DIR.mkdir(parents=True, exist_ok=True)
-                with open(WEB_DIR / "urls.json", "w") as f:
-                    urls = {"urls": urls_to_copy}
-                    json.dump(urls, f)
-
-    if not patterns:
+    if not repo_id:
+        print("[artifacts] No dataset repo given, using local artifacts.")
         return faiss_dir, doc_dir
 
-    print(f"[artifacts] Downloading missing assets from '{repo_id}' ({revision})...")
-
-    cache_dir = Path(
-        snapshot_download(
-            repo_id=repo_id,
-            repo_type="dataset",
-            revision=revision,
-            allow_patterns=patterns,
+    remote_files = _remote_manifest(HfApi(), repo_id, revision)
+    state = _load_sync_state()
+    #  without a snapshot yet, unchanged files are taken from artifacts/
+    previous = _current_snapshot()
+    root = previous or ART_DIR
+    plan = _plan_sync(remote_files, state, want_sources=want_sources, root=root)
+
+    if want_sources and URLS_REMOTE_PATH in remote_files:
+        urls_file = remote_files[URLS_REMOTE_PATH]
+        if state.get(URLS_REMOTE_PATH, {}).get("hash") != urls_file.hash:
+            _merge_remote_urls(repo_id, revision)
+            state[URLS_REMOTE_PATH] = {"hash": urls_file.hash}
+
+    snapshot = previous
+    if plan:
+        total_mb = sum(remote_file.size for remote_file, _ in plan) / 1e6
+        print(
+            f"[artifacts] Downloading {len(plan)} changed files ({total_mb:.1f} MB) "
+            f"from '{repo_id}' ({revision})..."
         )
-    )
-
-    cache_dirs = [cache_dir / path for path in patterns]
-    dest_dirs = [index_faiss_path, index_pkl_path, manifest_path]
-    dest_dirs.extend(
-        [DOC_DIR / f"{p.split('/')[-2]}/documents.jsonl" for p in doc_patterns]
-    )
-    dest_dirs.extend([PDF_DIR / f"{p.split('/')[-1]}" for p in pdfs_to_download])
-
-    for src, dst in zip(cache_dirs, dest_dirs):
-        _copy_if_missing(src, dst)
+        changed = {remote_file.path for remote_file, _ in plan}
+        carried = []
+        if any(_snapshot_path(path) for path in changed):
+            version = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            snapshot = SYNC_DIR / version
+            partial = SYNC_DIR / f"{version}.partial"
+            for remote_path, remote_file in remote_files.items():
+                rel = _snapshot_path(remote_path)
+                if rel is not None and remote_path not in changed:
+                    _link_or_copy(root / rel, partial / rel)
+                    carried.append(remote_file)
+            plan = [
+                (remote_file, _local_path(remote_file.path, want_sources, partial))
+                for remote_file, _ in plan
+            ]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(_download, repo_id, revision, remote_file, dst)
+                for remote_file, dst in plan
+            ]
+            for future in futures:
+                future.result()
+        shutil.rmtree(STAGING_DIR, ignore_errors=True)
+
+        if snapshot is not previous:
+            os.rename(partial, snapshot)
+            _switch_current(snapshot)
+            print(f"[artifacts] Switched to snapshot {snapshot.name}")
+            #  state of older snapshots is no longer needed to plan the next sync
+            state = {
+                path: entry
+                for path, entry in state.items()
+                if not Path(path).is_relative_to(SYNC_DIR)
+            }
+            _prune_snapshots(keep={snapshot, previous})
+
+        for remote_file in [remote_file for remote_file, _ in plan] + carried:
+            dst = _local_path(remote_file.path, want_sources, snapshot)
+            _record(state, remote_file, dst)
+    else:
+        print("[artifacts] Local artifacts are up to date.")
+
+    if snapshot is not None:
+        faiss_dir = snapshot / "faiss"
+        doc_dir = snapshot / "documents"
+
+    _save_sync_state(state)
 
     print(f"[artifacts] Ready: {faiss_dir}")
     return faiss_dir, doc_dir
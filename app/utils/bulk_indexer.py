@@ -0,0 +1,356 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from langchain_core.documents import Document
+
+#  statuses worth retrying: throttling, overloaded or unreachable cluster
+#  ("N/A" is reported for connection errors and timeouts)
+RETRY_STATUSES = {429, 502, 503, 504, "N/A"}
+REQUEST_TOO_LARGE = 413
+
+_DONE = object()
+
+
+@dataclass
+class BulkStats:
+    indexed: int = 0
+    skipped: int = 0
+    retried: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+
+class Checkpoint:
+    """
+    chunk_ids already indexed, one per line, appended as bulk items succeed,
+    so an interrupted backfill can resume where it stopped.
+    """
+
+    def __init__(self, path: Path | str, flush_every: int = 1000):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self._done = set()
+        if self.path.exists():
+            self._done = set(self.path.read_text(encoding="utf-8").splitlines())
+        self._buffer = []
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._done
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def add(self, chunk_id: str):
+        self._done.add(chunk_id)
+        self._buffer.append(chunk_id)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(self._buffer) + "\n")
+        self._buffer = []
+
+    def discard(self, chunk_ids: Iterable[str]):
+        """
+        Forget chunk_ids deleted from the index, rewriting the file.
+        """
+        self.flush()
+        self._done.difference_update(chunk_ids)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(
+            "".join(f"{chunk_id}\n" for chunk_id in sorted(self._done)),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self._done = set()
+        self._buffer = []
+        self.path.unlink(missing_ok=True)
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+class BulkIndexer:
+    """
+    Streams documents into an OpenSearch index: documents are embedded in
+    batches on a background thread while parallel_bulk uploads the previous
+    batches, with a bounded queue in between so that embedding cannot run
+    ahead of the cluster. Bulk requests are capped by size in bytes, items
+    rejected with a retryable status are retried with exponential backoff, and
+    indexed chunk_ids are written to an optional checkpoint.
+    """
+
+    def __init__(
+        self,
+        client,
+        index_name: str,
+        embeddings,
+        checkpoint: Checkpoint | None = None,
+        id_field: str | None = "chunk_id",
+        embed_batch_size: int = 256,
+        max_chunk_bytes: int = 5 * 1024 * 1024,
+        chunk_size: int = 500,
+        thread_count: int = 4,
+        queue_size: int = 4,
+        max_retries: int = 5,
+        initial_backoff: float = 2.0,
+        max_backoff: float = 60.0,
+        vector_field: str = "vector_field",
+        text_field: str = "text",
+    ):
+        self.client = client
+        self.index_name = index_name
+        self.embeddings = embeddings
+        self.checkpoint = checkpoint
+        self.id_field = id_field
+        self.embed_batch_size = embed_batch_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.chunk_size = chunk_size
+        self.thread_count = thread_count
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.vector_field = vector_field
+        self.text_field = text_field
+
+    def _action(self, doc: Document, vector: list[float]) -> dict[str, Any]:
+        action = {
+            "_op_type": "index",
+            "_index": self.index_name,
+            self.vector_field: vector,
+            self.text_field: doc.page_content,
+            "metadata": doc.metadata,
+        }
+        if self.id_field and doc.metadata.get(self.id_field):
+            #  makes retries idempotent
+            action["_id"] = doc.metadata[self.id_field]
+        return action
+
+    def _skip(self, chunk_id: str | None, stats: BulkStats) -> bool:
+        if self.checkpoint is not None and chunk_id in self.checkpoint:
+            stats.skipped += 1
+            return True
+        return False
+
+    def _pending(self, docs: Iterable[Document], stats: BulkStats):
+        for doc in docs:
+            if not self._skip(doc.metadata.get("chunk_id"), stats):
+                yield doc
+
+    def _embedded_actions(
+        self, docs: Iterable[Document], stats: BulkStats
+    ) -> Iterator[dict]:
+        batches = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def embed():
+            try:
+                for batch in batched(self._pending(docs, stats), self.embed_batch_size):
+                    vectors = self.embeddings.embed_documents(
+                        [doc.page_content for doc in batch]
+                    )
+                    actions = [self._action(d, v) for d, v in zip(batch, vectors)]
+                    if not put(actions):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            put(_DONE)
+
+        thread = threading.Thread(target=embed, name="bulk-embed", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield from item
+        finally:
+            stop.set()
+
+    def _bulk(self, actions: Iterable[dict], stats: BulkStats) -> list[dict]:
+        """
+        Send actions with parallel_bulk, returning the ones to retry.
+        """
+        from opensearchpy.helpers import parallel_bulk
+
+        #  parallel_bulk reports results in the order the actions were sent
+        sent = deque()
+
+        def track(actions):
+            for action in actions:
+                sent.append(action)
+                yield action
+
+        retry = []
+        for ok, item in parallel_bulk(
+            self.client,
+            track(actions),
+            thread_count=self.thread_count,
+            chunk_size=self.chunk_size,
+            max_chunk_bytes=self.max_chunk_bytes,
+            queue_size=self.queue_size,
+            raise_on_error=False,
+            raise_on_exception=False,
+        ):
+            action = sent.popleft()
+            if ok:
+                stats.indexed += 1
+                chunk_id = action["metadata"].get("chunk_id")
+                if self.checkpoint is not None and chunk_id:
+                    self.checkpoint.add(chunk_id)
+                continue
+
+            status = next(iter(item.values())).get("status")
+            if status == REQUEST_TOO_LARGE:
+                #  the cluster's request size limit is lower than assumed
+                self.max_chunk_bytes = max(self.max_chunk_bytes // 2, 1024 * 1024)
+                retry.append(action)
+            elif status in RETRY_STATUSES:
+                retry.append(action)
+            else:
+                stats.failed += 1
+                print(f"[bulk] failed to index {action.get('_id')}: {item}")
+
+        if self.checkpoint is not None:
+            self.checkpoint.flush()
+        return retry
+
+    def index(self, docs: Iterable[Document]) -> BulkStats:
+        stats = BulkStats()
+        return self._index(self._embedded_actions(docs, stats), stats)
+
+    def index_embedded(
+        self, embedded: Iterable[tuple[Document, list[float]]]
+    ) -> BulkStats:
+        """
+        Index documents that were already embedded, as (document, vector) pairs.
+        """
+        stats = BulkStats()
+        pending = (
+            (doc, vector)
+            for doc, vector in embedded
+            if not self._skip(doc.metadata.get("chunk_id"), stats)
+        )
+        actions = (self._action(doc, vector) for doc, vector in pending)
+        return self._index(actions, stats)
+
+    def _delete_by_id(self, chunk_ids: list[str]) -> int:
+        from opensearchpy.helpers import bulk
+
+        actions = [
+            {"_op_type": "delete", "_index": self.index_name, "_id": chunk_id}
+            for chunk_id in chunk_ids
+        ]
+        ok, errors = bulk(
+            self.client,
+            actions,
+            ignore_status=(404,),
+            raise_on_error=False,
+            max_retries=self.max_retries,
+            initial_backoff=self.initial_backoff,
+            max_backoff=self.max_backoff,
+        )
+        if errors:
+            raise RuntimeError(
+                f"{len(errors)} docs failed to delete from {self.index_name}: "
+                f"{errors[:3]}"
+            )
+        return ok
+
+    def _delete_by_query(self, chunk_ids: list[str]) -> int:
+        resp = self.client.delete_by_query(
+            index=self.index_name,
+            body={"query": {"terms": {"metadata.chunk_id.keyword": chunk_ids}}},
+            conflicts="proceed",
+            refresh=True,
+        )
+        if resp.get("failures"):
+            raise RuntimeError(
+                f"{len(resp['failures'])} docs failed to delete from "
+                f"{self.index_name}: {resp['failures'][:3]}"
+            )
+        return resp["deleted"]
+
+    def delete(self, chunk_ids: Iterable[str]) -> int:
+        """
+        Delete the documents of chunk_ids from the index and the checkpoint.
+        Returns the number of documents deleted.
+
+        Documents indexed under their chunk_id are deleted by id. With ids
+        assigned by the cluster, they are deleted by a query on chunk_id,
+        after a refresh so that documents just indexed are found, which also
+        deletes any extra copies of a chunk.
+        """
+        chunk_ids = list(chunk_ids)
+        by_id = self.id_field == "chunk_id"
+        if chunk_ids and not by_id:
+            self.client.indices.refresh(index=self.index_name)
+        deleted = 0
+        for batch in batched(chunk_ids, self.chunk_size):
+            if by_id:
+                deleted += self._delete_by_id(batch)
+            else:
+                deleted += self._delete_by_query(batch)
+
+        if self.checkpoint is not None:
+            self.checkpoint.discard(chunk_ids)
+        print(f"[bulk] deleted {deleted} docs from {self.index_name}")
+        return deleted
+
+    def _index(self, actions: Iterable[dict], stats: BulkStats) -> BulkStats:
+        start = time.perf_counter()
+
+        retry = self._bulk(actions, stats)
+        for attempt in range(self.max_retries):
+            if not retry:
+                break
+            delay = min(self.initial_backoff * 2**attempt, self.max_backoff)
+            print(f"[bulk] retrying {len(retry)} docs in {delay:.1f}s")
+            time.sleep(delay)
+            stats.retried += len(retry)
+            retry = self._bulk(retry, stats)
+        stats.failed += len(retry)
+
+        stats.seconds = time.perf_counter() - start
+        rate = stats.indexed / stats.seconds if stats.seconds else 0.0
+        print(
+            f"[bulk] indexed {stats.indexed} docs into {self.index_name} in "
+            f"{stats.seconds:.1f}s ({rate:.0f} docs/s), skipped {stats.skipped} "
+            f"already indexed, retried {stats.retried}, failed {stats.failed}"
+        )
+        if stats.failed:
+            raise RuntimeError(
+                f"{stats.failed} docs failed to index into {self.index_name}; "
+                "indexed docs are checkpointed, rerun to resume"
+            )
+        return stats
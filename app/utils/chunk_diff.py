@@ -0,0 +1,65 @@
+import hashlib
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+from langchain_core.documents import Document
+
+
+def content_chunk_id(doc_id: str, text: str) -> str:
+    """
+    Chunk id derived from the chunk text rather than its position, so chunks
+    keep their ids when other chunks of the document are added or removed.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    return f"{doc_id}::{digest}"
+
+
+@dataclass
+class ChunkDiff:
+    """
+    Added, removed and unchanged chunks of one source, compared by chunk_id
+    with the chunks indexed by its previous ingestion.
+    """
+
+    previous: set[str] = field(default_factory=set)
+    added: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    _seen: set[str] = field(default_factory=set)
+
+    def split(self, docs: Iterable[Document]) -> Iterator[Document]:
+        """
+        Pass on the chunks of the source, counting added and unchanged ones.
+        Repeated chunks (same text, so same id) are dropped.
+        """
+        for doc in docs:
+            chunk_id = doc.metadata["chunk_id"]
+            if chunk_id in self._seen:
+                self.duplicates += 1
+                continue
+            self._seen.add(chunk_id)
+            if chunk_id in self.previous:
+                self.unchanged += 1
+            else:
+                self.added += 1
+            yield doc
+
+    def is_added(self, doc: Document) -> bool:
+        return doc.metadata["chunk_id"] not in self.previous
+
+    @property
+    def removed(self) -> list[str]:
+        """
+        Chunks of the previous ingestion that are gone, complete once all
+        chunks went through split.
+        """
+        return sorted(self.previous - self._seen)
+
+    def summary(self) -> str:
+        summary = (
+            f"{self.added} added, {len(self.removed)} removed, "
+            f"{self.unchanged} unchanged"
+        )
+        if self.duplicates:
+            summary += f", {self.duplicates} duplicates dropped"
+        return summary
@@ -1,13 +1,19 @@
 from app.config import IngestionConfig
 from ingestion.db_ingestors.db_rise import RiseDBIngestor
+from ingestion.db_ingestors.sql_ingestor import SqlIngestor
 from typing import Any
 
 
+#  databases needing custom code; any other database is ingested by
+#  SqlIngestor from its entry under sources.sql.databases in config.yaml
 DB_INGESTOR_REGISTRY: dict[str, Any] = {
     "rise": RiseDBIngestor,
 }
 
 
-def get_db_ingestor(db_name: str, config: IngestionConfig) -> RiseDBIngestor:
-    ingestor = DB_INGESTOR_REGISTRY[db_name](config)
-    return ingestor
+def get_db_ingestor(db_name: str, config: IngestionConfig) -> SqlIngestor:
+    if db_name in DB_INGESTOR_REGISTRY:
+        return DB_INGESTOR_REGISTRY[db_name](config)
+    if config.sql and db_name in config.sql.databases:
+        return SqlIngestor(db_name, config.sql.databases[db_name], config)
+    raise KeyError(f"No ingestor configured for database {db_name}")
@@ -0,0 +1,72 @@
+import contextvars
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    The latency budget of a request ran out before a stage it cannot do
+    without finished.
+    """
+
+
+_pool_lock = threading.Lock()
+_pool: ThreadPoolExecutor | None = None
+#  requests in flight at once, set from admission control by configure_pool
+_max_in_flight = 16
+
+
+def configure_pool(max_in_flight: int):
+    """
+    Size the pool of timed calls for max_in_flight requests at once: each runs
+    one call at a time, and may leave as many abandoned after a timeout.
+    """
+    global _pool, _max_in_flight
+    with _pool_lock:
+        _max_in_flight = max_in_flight
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=2 * _max_in_flight, thread_name_prefix="deadline"
+            )
+        return _pool
+
+
+def remaining_s(deadline: float | None) -> float:
+    """
+    Seconds left until deadline, a time.monotonic() timestamp, or inf without one.
+    """
+    if deadline is None:
+        return math.inf
+    return deadline - time.monotonic()
+
+
+def call_with_timeout(fn, timeout_s: float, *args, **kwargs):
+    """
+    Call fn and wait at most timeout_s for its result, else raise
+    DeadlineExceeded. Without a timeout (inf), fn is called directly.
+
+    fn runs in a worker thread, with the context of the caller (tracing
+    callbacks). A call that timed out is abandoned rather than interrupted:
+    it ends at the timeout of the provider's client.
+    """
+    if timeout_s == math.inf:
+        return fn(*args, **kwargs)
+    if timeout_s <= 0:
+        raise DeadlineExceeded("No time left in the latency budget")
+    context = contextvars.copy_context()
+    future = _get_pool().submit(context.run, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout_s)
+    except TimeoutError:
+        future.cancel()
+        raise DeadlineExceeded(f"No result within {timeout_s:.2f}s")
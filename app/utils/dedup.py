@@ -0,0 +1,217 @@
+import json
+import os
+import re
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import DedupConfig
+from app.utils.paths import DEDUP_DIR
+
+_WORD = re.compile(r"\w+")
+
+
+class MinHasher:
+    """
+    MinHash signatures of word shingles. Shingles are hashed to 32 bits with
+    crc32, and each of the num_perm hash functions is a multiply-shift hash
+    ((a * x + b) mod 2**64) >> 32 with random odd a.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        max_uint64 = np.iinfo(np.uint64).max
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, max_uint64, num_perm, dtype=np.uint64) | 1
+        self._b = rng.integers(0, max_uint64, num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> set[str]:
+        words = _WORD.findall(text.lower())
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)} if words else set()
+        return {
+            " ".join(words[i : i + self.shingle_size])
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+
+    def signature(self, text: str) -> np.ndarray | None:
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        with np.errstate(over="ignore"):
+            permuted = (hashes[:, None] * self._a + self._b) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash LSH index of the chunks ingested so far, persisted under path so
+    that new sources are checked against all sources ingested before.
+
+    Signatures are split into bands; chunks sharing a band are candidates, and
+    a candidate whose estimated Jaccard similarity reaches threshold is a near
+    duplicate. Near duplicates are dropped, or with action "link" kept with a
+    duplicate_of metadata field, and are not added to the index.
+
+    For dropped chunks, the index records which sources they duplicated: when
+    such a source is removed to be ingested again, the sources that lost
+    chunks to it are added to orphaned, to be ingested again too, since the
+    text they shared may be gone.
+    """
+
+    def __init__(self, config: DedupConfig, path: Path | str = DEDUP_DIR):
+        if config.num_perm % config.bands:
+            raise ValueError("dedup num_perm must be a multiple of bands")
+        if config.action not in ("drop", "link"):
+            raise ValueError(f"Unsupported dedup action: {config.action}")
+        self.config = config
+        self.path = Path(path)
+        self.hasher = MinHasher(config.num_perm, config.shingle_size, config.seed)
+        self.rows = config.num_perm // config.bands
+        self.chunk_ids: list[str] = []
+        self.doc_ids: list[str] = []
+        self.signatures: list[np.ndarray] = []
+        self.duplicates = 0
+        #  doc_id -> doc_ids of the sources its dropped chunks duplicated
+        self.dropped: dict[str, set[str]] = {}
+        #  doc_ids of sources to ingest again, see remove_source
+        self.orphaned: set[str] = set()
+        self._buckets = defaultdict(list)
+        self._load()
+
+    def _params(self) -> dict:
+        return {
+            "num_perm": self.config.num_perm,
+            "shingle_size": self.config.shingle_size,
+            "seed": self.config.seed,
+        }
+
+    def _load(self):
+        if not (self.path / "chunks.json").exists():
+            return
+        with open(self.path / "chunks.json", "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        if chunks["params"] != self._params():
+            #  signatures computed with other hash functions
+            return
+        signatures = np.load(self.path / "signatures.npy")
+        for chunk_id, doc_id, signature in zip(
+            chunks["chunk_ids"], chunks["doc_ids"], signatures
+        ):
+            self._insert(chunk_id, doc_id, signature)
+        self.dropped = {
+            doc_id: set(sources)
+            for doc_id, sources in chunks.get("dropped", {}).items()
+        }
+
+    def save(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        signatures = (
+            np.stack(self.signatures)
+            if self.signatures
+            else np.empty((0, self.config.num_perm), dtype=np.uint32)
+        )
+        tmp_path = self.path / "signatures.tmp.npy"
+        np.save(tmp_path, signatures)
+        os.replace(tmp_path, self.path / "signatures.npy")
+        chunks = {
+            "params": self._params(),
+            "chunk_ids": self.chunk_ids,
+            "doc_ids": self.doc_ids,
+            "dropped": {
+                doc_id: sorted(sources) for doc_id, sources in self.dropped.items()
+            },
+        }
+        tmp_path = self.path / "chunks.tmp.json"
+        tmp_path.write_text(json.dumps(chunks), encoding="utf-8")
+        os.replace(tmp_path, self.path / "chunks.json")
+
+    def _bands(self, signature: np.ndarray) -> Iterator[tuple[int, bytes]]:
+        for band in range(self.config.bands):
+            start = band * self.rows
+            yield band, signature[start : start + self.rows].tobytes()
+
+    def _insert(self, chunk_id: str, doc_id: str, signature: np.ndarray):
+        position = len(self.chunk_ids)
+        self.chunk_ids.append(chunk_id)
+        self.doc_ids.append(doc_id)
+        self.signatures.append(signature)
+        for key in self._bands(signature):
+            self._buckets[key].append(position)
+
+    def remove_source(self, doc_id: str):
+        """
+        Forget the chunks of doc_id, before it is ingested again, and add the
+        sources whose chunks were dropped as near duplicates of them to
+        orphaned.
+        """
+        self.dropped.pop(doc_id, None)
+        self.orphaned.discard(doc_id)
+        self.orphaned.update(
+            source
+            for source, duplicated in self.dropped.items()
+            if doc_id in duplicated
+        )
+        keep = [i for i, d in enumerate(self.doc_ids) if d != doc_id]
+        if len(keep) == len(self.doc_ids):
+            return
+        chunk_ids, doc_ids = self.chunk_ids, self.doc_ids
+        signatures = self.signatures
+        self.chunk_ids, self.doc_ids, self.signatures = [], [], []
+        self._buckets = defaultdict(list)
+        for i in keep:
+            self._insert(chunk_ids[i], doc_ids[i], signatures[i])
+
+    def _best(self, signature: np.ndarray) -> int | None:
+        candidates = set()
+        for key in self._bands(signature):
+            candidates.update(self._buckets.get(key, ()))
+        best, best_similarity = None, self.config.threshold
+        for position in candidates:
+            similarity = float(np.mean(self.signatures[position] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = position, similarity
+        return best
+
+    def match(self, signature: np.ndarray) -> str | None:
+        """
+        chunk_id of the most similar indexed chunk at or above threshold.
+        """
+        position = self._best(signature)
+        return None if position is None else self.chunk_ids[position]
+
+    def filter(self, docs: Iterable[Document]) -> Iterator[Document]:
+        """
+        Pass on the chunks that are not near duplicates of an indexed chunk,
+        adding them to the index.
+        """
+        for doc in docs:
+            signature = self.hasher.signature(doc.page_content)
+            if signature is None:
+                yield doc
+                continue
+            position = self._best(signature)
+            if position is None:
+                self._insert(
+                    doc.metadata["chunk_id"], doc.metadata["doc_id"], signature
+                )
+                yield doc
+                continue
+            self.duplicates += 1
+            if self.config.action == "link":
+                doc.metadata["duplicate_of"] = self.chunk_ids[position]
+                yield doc
+            else:
+                self.dropped.setdefault(doc.metadata["doc_id"], set()).add(
+                    self.doc_ids[position]
+                )
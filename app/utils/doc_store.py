@@ -0,0 +1,277 @@
+import json
+import os
+from pathlib import Path
+from typing import Iterable
+
+from langchain_core.documents import Document
+
+#  documents are stored as parquet: one row per chunk, the text in
+#  page_content and one column per metadata key, prefixed with "metadata."
+DOCS_FILE = "documents.parquet"
+#  the previous format, read when no parquet file exists
+LEGACY_DOCS_FILE = "documents.jsonl"
+S3_DOCS_KEY = f"documents/{DOCS_FILE}"
+S3_LEGACY_DOCS_KEY = f"documents/{LEGACY_DOCS_FILE}"
+#  manifests of the sources in the OpenSearch index, by name
+S3_MANIFESTS_KEY = "manifests/manifests.json"
+
+METADATA_PREFIX = "metadata."
+ROW_GROUP_SIZE = 4096
+#  schema metadata listing the columns stored as json strings, for metadata
+#  keys that are not one scalar type in all chunks, or that are None in some
+_JSON_COLUMNS = b"json_columns"
+_SCALAR_TYPES = (str, int, float, bool)
+#  a metadata key a chunk does not have
+_MISSING = object()
+
+
+def documents_table(documents: Iterable[Document]):
+    """
+    Arrow table of documents, one column per metadata key. Keys missing from a
+    chunk are stored as nulls. Keys holding a single scalar type are stored as
+    that type, others (mixed types such as int and float, lists, dicts or None
+    values) as json strings, so that table_documents returns the same
+    metadata.
+    """
+    import pyarrow as pa
+
+    texts, metadatas = [], []
+    for doc in documents:
+        texts.append(doc.page_content)
+        metadatas.append(doc.metadata)
+    keys = dict.fromkeys(key for metadata in metadatas for key in metadata)
+
+    columns = {"page_content": pa.array(texts, pa.string())}
+    json_columns = []
+    for key in keys:
+        name = f"{METADATA_PREFIX}{key}"
+        values = [metadata.get(key, _MISSING) for metadata in metadatas]
+        types = {type(v) for v in values if v is not _MISSING}
+        if len(types) == 1 and types <= set(_SCALAR_TYPES):
+            try:
+                columns[name] = pa.array([None if v is _MISSING else v for v in values])
+                continue
+            except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                pass
+        columns[name] = pa.array(
+            [None if v is _MISSING else json.dumps(v) for v in values], pa.string()
+        )
+        json_columns.append(name)
+
+    table = pa.table(columns)
+    return table.replace_schema_metadata({_JSON_COLUMNS: json.dumps(json_columns)})
+
+
+def table_documents(table) -> list[Document]:
+    """
+    Documents of an Arrow table written by documents_table, or any slice of it.
+    """
+    schema_metadata = table.schema.metadata or {}
+    json_columns = set(json.loads(schema_metadata.get(_JSON_COLUMNS, b"[]")))
+
+    metadata_columns = []
+    for name in table.column_names:
+        if not name.startswith(METADATA_PREFIX):
+            continue
+        values = table.column(name).to_pylist()
+        if name in json_columns:
+            values = [_MISSING if v is None else json.loads(v) for v in values]
+        else:
+            values = [_MISSING if v is None else v for v in values]
+        metadata_columns.append((name.removeprefix(METADATA_PREFIX), values))
+
+    return [
+        Document(
+            page_content=text,
+            metadata={
+                key: values[i]
+                for key, values in metadata_columns
+                if values[i] is not _MISSING
+            },
+        )
+        for i, text in enumerate(table.column("page_content").to_pylist())
+    ]
+
+
+def write_table(table, where):
+    """
+    Write a documents table as zstd-compressed parquet, with dictionary-encoded
+    columns, to a path or a writable buffer.
+    """
+    import pyarrow.parquet as pq
+
+    pq.write_table(
+        table,
+        where,
+        compression="zstd",
+        use_dictionary=True,
+        row_group_size=ROW_GROUP_SIZE,
+    )
+
+
+def write_documents(documents: Iterable[Document], path: Path | str):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    write_table(documents_table(documents), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_table(source, columns: list[str] | None = None):
+    """
+    Read a documents table from a parquet path or bytes, optionally only some
+    columns, e.g. ["metadata.chunk_id"].
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if isinstance(source, bytes):
+        source = pa.BufferReader(source)
+    return pq.read_table(source, columns=columns)
+
+
+def read_documents(path: Path | str) -> list[Document]:
+    return table_documents(read_table(path))
+
+
+def read_jsonl_documents(lines: Iterable[str]) -> list[Document]:
+    return [Document(**json.loads(line)) for line in lines if line.strip()]
+
+
+def read_dir_documents(doc_dir: Path | str) -> list[Document]:
+    """
+    Documents of a per-source directory, in parquet or the legacy jsonl.
+    """
+    doc_dir = Path(doc_dir)
+    if (doc_dir / DOCS_FILE).exists():
+        return read_documents(doc_dir / DOCS_FILE)
+    with open(doc_dir / LEGACY_DOCS_FILE, "r", encoding="utf-8") as f:
+        return read_jsonl_documents(f)
+
+
+def read_s3_table(s3, bucket: str, columns: list[str] | None = None):
+    """
+    Documents table stored on S3, converted on the fly from the legacy jsonl if
+    it was not converted yet. None if there are no documents.
+    """
+    try:
+        resp = s3.get_object(Bucket=bucket, Key=S3_DOCS_KEY)
+        return read_table(resp["Body"].read(), columns=columns)
+    except s3.exceptions.NoSuchKey:
+        pass
+    try:
+        resp = s3.get_object(Bucket=bucket, Key=S3_LEGACY_DOCS_KEY)
+    except s3.exceptions.NoSuchKey:
+        return None
+    lines = resp["Body"].read().decode("utf-8").splitlines()
+    table = documents_table(read_jsonl_documents(lines))
+    return table.select(columns) if columns else table
+
+
+class S3Documents:
+    """
+    The documents file and the source manifests on S3, shared by the sources
+    of an ingestion run. The documents table is downloaded once, on first use,
+    the sources replaced during the run are kept in memory, and save() uploads
+    both files once, rather than once per source.
+    """
+
+    def __init__(self, s3, bucket: str):
+        self.s3 = s3
+        self.bucket = bucket
+        self._table = None
+        self._loaded = False
+        self._chunk_ids: dict[str, set[str]] | None = None
+        #  documents and manifests of the sources replaced since the last save
+        self._replaced: dict[str, list[Document]] = {}
+        self._manifests: dict[str, dict] = {}
+
+    def _load(self):
+        if not self._loaded:
+            self._table = read_s3_table(self.s3, self.bucket)
+            self._loaded = True
+        return self._table
+
+    def chunk_ids(self, doc_id: str) -> set[str]:
+        """
+        chunk_ids of the source doc_id, including replacements not saved yet.
+        """
+        if doc_id in self._replaced:
+            return {doc.metadata["chunk_id"] for doc in self._replaced[doc_id]}
+        if self._chunk_ids is None:
+            self._chunk_ids = {}
+            table = self._load()
+            if table is not None:
+                for source, chunk_id in zip(
+                    table.column("metadata.doc_id").to_pylist(),
+                    table.column("metadata.chunk_id").to_pylist(),
+                ):
+                    self._chunk_ids.setdefault(source, set()).add(chunk_id)
+        return set(self._chunk_ids.get(doc_id, ()))
+
+    def replace(
+        self,
+        doc_ids: Iterable[str],
+        documents: list[Document],
+        name: str,
+        manifest: dict,
+    ):
+        """
+        Replace the chunks of the sources doc_ids with documents, and record
+        the manifest of the source name, until save().
+        """
+        for doc_id in doc_ids:
+            self._replaced[doc_id] = []
+        for doc in documents:
+            self._replaced[doc.metadata["doc_id"]].append(doc)
+        #  sources are re-ingested in place, so the manifest is always the last one
+        self._manifests[name] = manifest
+
+    def save(self):
+        """
+        Upload the documents table and the manifests with the replaced sources.
+        """
+        if not self._replaced and not self._manifests:
+            return
+        table = self._load()
+        documents = [
+            doc
+            for doc in (table_documents(table) if table is not None else [])
+            if doc.metadata.get("doc_id") not in self._replaced
+        ]
+        for docs in self._replaced.values():
+            documents.extend(docs)
+        self.s3.put_object(
+            Body=table_bytes(documents_table(documents)),
+            Bucket=self.bucket,
+            Key=S3_DOCS_KEY,
+        )
+
+        try:
+            resp = self.s3.get_object(Bucket=self.bucket, Key=S3_MANIFESTS_KEY)
+            manifests = json.loads(resp["Body"].read().decode("utf-8"))
+        except self.s3.exceptions.NoSuchKey:
+            manifests = {}
+        manifests.update(self._manifests)
+        body = json.dumps(
+            manifests, indent=2, default=str, sort_keys=True, ensure_ascii=False
+        )
+        self.s3.put_object(
+            Body=body.encode("utf-8"), Bucket=self.bucket, Key=S3_MANIFESTS_KEY
+        )
+        print(
+            f"[doc_store] saved {len(self._replaced)} sources, "
+            f"number of docs: {len(documents)}"
+        )
+
+        self._table = documents_table(documents)
+        self._chunk_ids = None
+        self._replaced, self._manifests = {}, {}
+
+
+def table_bytes(table) -> bytes:
+    import pyarrow as pa
+
+    sink = pa.BufferOutputStream()
+    write_table(table, sink)
+    return sink.getvalue().to_pybytes()
@@ -1,26 +1,41 @@
+from itertools import count
 from langchain_core.documents import Document
 from app.config import IngestionConfig, VectorStoreConfig
 from app.utils.vector_stores import VectorStoreType
 from app.utils.urls import url_to_resource_name
-from ftfy import fix_text
+from app.utils.chunk_diff import content_chunk_id
+from app.utils.doc_store import (
+    DOCS_FILE,
+    S3Documents,
+    read_dir_documents,
+    read_s3_table,
+    table_documents,
+    write_documents,
+)
 from pathlib import Path
 from datetime import datetime, timezone
-from url_normalize import url_normalize
 import json
 import os
-import boto3
 from app.utils.paths import DOC_DIR
-from typing import Any
+from typing import Any, Iterable, Iterator
 
 
 #  TODO: add min chunk length filtering
 
 
-def process_pdf_docs(docs: list[Document], config: IngestionConfig):
+def process_pdf_docs(
+    docs: list[Document],
+    config: IngestionConfig,
+    chunk_indexes: Iterator[int] | None = None,
+):
     """
     Process a list of pdf documents:
     Clean text, remove unneeded metadata, add extra metadata for RAG
+
+    Chunk ids are derived from the chunk text (see content_chunk_id). Pass the
+    same chunk_indexes counter when processing a file in batches.
     """
+    chunk_indexes = count() if chunk_indexes is None else chunk_indexes
     processed_docs = []
     keep_fields = [
         "source",
@@ -31,7 +46,7 @@ def process_pdf_docs(docs: list[Document], config: IngestionConfig):
         "page_number",
     ]
 
-    for chunk_index, doc in enumerate(docs):
+    for doc, chunk_index in zip(docs, chunk_indexes):
         #  TODO:
         # filter by categories
         ## TableChunk -> keep text_as_html, is_continuation -> make into df
@@ -44,13 +59,15 @@ def process_pdf_docs(docs: list[Document], config: IngestionConfig):
             doc.metadata = {k: v for k, v in doc.metadata.items() if k in keep_fields}
             doc.metadata["doc_title"] = Path(doc.metadata["filename"]).stem
             doc.metadata["doc_id"] = doc.metadata["filename"]
-            doc.metadata["chunk_id"] = f"{doc.metadata['doc_id']}::{chunk_index}"
+            doc.page_content = _clean_text(doc.page_content)
+            doc.metadata["chunk_id"] = content_chunk_id(
+                doc.metadata["doc_id"], doc.page_content
+            )
             doc.metadata["chunk_index"] = chunk_index
             doc.metadata["tags"] = []
             doc.metadata["ingested_at"] = datetime.now(timezone.utc).isoformat()
-            doc.metadata["tenant_id"] = "default"
+            doc.metadata["tenant_id"] = config.tenant_id
             doc.metadata["pipeline_version"] = config.pipeline_version
-            doc.page_content = _clean_text(doc.page_content)
             processed_docs.append(doc)
 
     return processed_docs
@@ -60,15 +77,27 @@ def _clean_text(text: str):
     """
     Clean a string
     """
+    from ftfy import fix_text
+
     clean_text = fix_text(text)
     return clean_text
 
 
-def process_web_docs(docs: list[Document], config: IngestionConfig):
+def process_web_docs(
+    docs: list[Document],
+    config: IngestionConfig,
+    chunk_indexes: Iterator[int] | None = None,
+):
     """
     Process a list of web documents:
     Clean text, remove unneeded metadata, add extra metadata for RAG
+
+    Chunk ids are derived from the chunk text (see content_chunk_id). Pass the
+    same chunk_indexes counter when processing a page in batches.
     """
+    chunk_indexes = count() if chunk_indexes is None else chunk_indexes
+    from url_normalize import url_normalize
+
     #  TODO:  keep category "image_url", use for enrichment
     keep_categories = ["NarrativeText", "Title"]
     filtered_docs = [doc for doc in docs if doc.metadata["category"] in keep_categories]
@@ -80,18 +109,20 @@ def process_web_docs(docs: list[Document], config: IngestionConfig):
         "url",
     ]
 
-    for chunk_index, doc in enumerate(filtered_docs):
+    for doc, chunk_index in zip(filtered_docs, chunk_indexes):
         doc.metadata = {k: v for k, v in doc.metadata.items() if k in keep_fields}
         doc.metadata["doc_title"] = url_to_resource_name(doc.metadata["url"])
         doc.metadata["doc_id"] = url_normalize(doc.metadata["url"])
         doc.metadata["source"] = doc.metadata["doc_id"]
-        doc.metadata["chunk_id"] = f"{doc.metadata['doc_id']}::{chunk_index}"
+        doc.page_content = _clean_text(doc.page_content)
+        doc.metadata["chunk_id"] = content_chunk_id(
+            doc.metadata["doc_id"], doc.page_content
+        )
         doc.metadata["chunk_index"] = chunk_index
         doc.metadata["tags"] = []
         doc.metadata["ingested_at"] = datetime.now(timezone.utc).isoformat()
-        doc.metadata["tenant_id"] = "default"
+        doc.metadata["tenant_id"] = config.tenant_id
         doc.metadata["pipeline_version"] = config.pipeline_version
-        doc.page_content = _clean_text(doc.page_content)
         processed_docs.append(doc)
 
     return processed_docs
@@ -113,23 +144,40 @@ def load_docs(
         doc_dir = Path(kwargs.get("doc_dir", DOC_DIR))
         docs = []
         for dir in doc_dir.glob("*/"):
-            with open(dir / "documents.jsonl", "r", encoding="utf-8") as f:
-                for line in f:
-                    data = json.loads(line)
-                    docs.append(Document(**data))
+            docs.extend(read_dir_documents(dir))
 
     elif config.type == VectorStoreType.OPENSEARCH:
+        import boto3
+
         s3 = boto3.client("s3")
         bucket = os.getenv("AWS_S3_DOCS_BUCKET")
-        resp = s3.get_object(Bucket=bucket, Key="documents/documents.jsonl")
-        data = resp["Body"].read().decode("utf-8")
-        lines = data.splitlines()
-        docs = [Document(**json.loads(line)) for line in lines]
+        table = read_s3_table(s3, bucket)
+        docs = table_documents(table) if table is not None else []
 
     print(f"[load_docs] number of docs loaded: {len(docs)}")
     return docs
 
 
+def write_docs(documents: Iterable[Document], filename: str) -> Iterator[Document]:
+    """
+    Pass documents on as they are iterated, then write them to a parquet file
+    (see doc_store) once all were seen.
+    """
+    saved = []
+    for doc in documents:
+        saved.append(doc)
+        yield doc
+    write_documents(saved, filename)
+
+
+def save_manifest(manifest: dict[str, Any], path: str):
+    os.makedirs(path, exist_ok=True)
+    with open(f"{path}/manifest.json", "w") as f:
+        json.dump(
+            manifest, f, indent=2, default=str, sort_keys=True, ensure_ascii=False
+        )
+
+
 def save_docs(
     documents: list[Document],
     manifest: dict[str, Any],
@@ -137,7 +185,11 @@ def save_docs(
     **kwargs,
 ):
     """
-    Save documents to a jsonl file and manifest to ART_DIR, or save to AWS_S3_DOCS_BUCKET
+    Save documents to a parquet file and manifest to ART_DIR, or save to AWS_S3_DOCS_BUCKET
+
+    On S3, the chunks of the sources of documents are replaced. Pass doc_id and
+    the manifest name to replace a source whose chunks were all removed, and
+    the S3Documents of the run to upload the files once, when it is saved.
     """
 
     vs_type = config.type
@@ -145,76 +197,38 @@ def save_docs(
     if vs_type == VectorStoreType.FAISS:
         path = kwargs.get("doc_save_dir", None)
         path = DOC_DIR if not path else path
-        filename = f"{path}/documents.jsonl"
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-
-        with open(filename, "w", encoding="utf-8") as f:
-            for doc in documents:
-                json.dump(
-                    {"page_content": doc.page_content, "metadata": doc.metadata}, f
-                )
-                f.write("\n")
-
-        path = kwargs.get("manifest_save_dir", None)
-        with open(f"{path}/manifest.json", "w") as f:
-            json.dump(
-                manifest, f, indent=2, default=str, sort_keys=True, ensure_ascii=False
-            )
-
-    elif vs_type == VectorStoreType.OPENSEARCH:
-        s3 = boto3.client("s3")
-        bucket = os.getenv("AWS_S3_DOCS_BUCKET")
-
-        try:
-            resp = s3.get_object(
-                Bucket="rag-app-chunkated-docs-bucket", Key="documents/documents.jsonl"
-            )
-            data = resp["Body"].read().decode("utf-8")
-            lines = data.splitlines()
-            docs_loaded = [json.loads(line) for line in lines]
-
-        except s3.exceptions.NoSuchKey:
-            docs_loaded = []
+        write_documents(documents, f"{path}/{DOCS_FILE}")
 
-        doc_chunk_ids = set()
-        for doc_dict in docs_loaded:
-            doc_chunk_ids.add(doc_dict["metadata"]["chunk_id"])
+        save_manifest(manifest, kwargs.get("manifest_save_dir", None))
 
-        for doc in documents:
-            if doc.metadata["chunk_id"] not in doc_chunk_ids:
-                docs_loaded.append(
-                    {"page_content": doc.page_content, "metadata": doc.metadata}
-                )
-                doc_chunk_ids.add(doc.metadata["chunk_id"])
-
-        print(f"[save_docs] number of docs: {len(docs_loaded)}")
-
-        body = "\n".join(json.dumps(doc) for doc in docs_loaded)
-        s3.put_object(
-            Body=body.encode("utf-8"), Bucket=bucket, Key="documents/documents.jsonl"
-        )
-
-        try:
-            resp = s3.get_object(
-                Bucket="rag-app-chunkated-docs-bucket", Key="manifests/manifests.json"
+    elif vs_type == VectorStoreType.OPENSEARCH:
+        s3_documents = kwargs.get("s3_documents")
+        #  with the S3Documents of a run, the files are uploaded at its end
+        save_now = s3_documents is None
+        if save_now:
+            import boto3
+
+            s3_documents = S3Documents(
+                boto3.client("s3"), os.getenv("AWS_S3_DOCS_BUCKET")
             )
-            data = resp["Body"].read().decode("utf-8")
-            manifests = json.loads(data)
-
-        except s3.exceptions.NoSuchKey:
-            manifests = {}
 
-        filename = documents[0].metadata["doc_title"]
-        pipeline_version = documents[0].metadata["pipeline_version"]
-        previous_pipeline_version = manifests.get(filename, {}).get(
-            "pipeline_version", None
+        #  replace the chunks of the ingested sources: chunks no longer in a
+        #  source are dropped, new ones appended
+        doc_ids = {doc.metadata["doc_id"] for doc in documents}
+        if kwargs.get("doc_id"):
+            doc_ids.add(kwargs["doc_id"])
+        chunk_ids = {doc.metadata["chunk_id"] for doc in documents}
+        previous_ids = set()
+        for doc_id in doc_ids:
+            previous_ids |= s3_documents.chunk_ids(doc_id)
+        name = kwargs.get("name") or documents[0].metadata["doc_title"]
+        s3_documents.replace(doc_ids, documents, name, manifest)
+
+        print(
+            f"[save_docs] {len(chunk_ids - previous_ids)} added, "
+            f"{len(previous_ids - chunk_ids)} removed, "
+            f"{len(chunk_ids & previous_ids)} unchanged"
         )
-        if pipeline_version != previous_pipeline_version:
-            manifests[filename] = manifest
 
-        body = json.dumps(
-            manifests, indent=2, default=str, sort_keys=True, ensure_ascii=False
-        )
-        s3.put_object(
-            Body=body.encode("utf-8"), Bucket=bucket, Key="manifests/manifests.json"
-        )
+        if save_now:
+            s3_documents.save()
@@ -0,0 +1,119 @@
+from collections import defaultdict
+from typing import Any, Iterable
+import numpy as np
+
+#  chunk metadata fields that retrieval can be filtered on
+FILTER_FIELDS = ("tenant_id", "filetype", "doc_id", "tags")
+
+Filters = dict[str, str | list[str]]
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def validate_filters(filters: Filters | None) -> Filters | None:
+    """
+    Check filters only use FILTER_FIELDS, and normalize values to lists.
+    """
+    if not filters:
+        return None
+    unknown = set(filters) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(
+            f"Unsupported filter fields: {sorted(unknown)}, "
+            f"supported fields: {list(FILTER_FIELDS)}"
+        )
+    return {
+        field: [values] if isinstance(values, str) else list(values)
+        for field, values in filters.items()
+    }
+
+
+class MetadataIndex:
+    """
+    Inverted index from metadata values to the sorted positions of the chunks
+    that carry them, e.g. postings["filetype"]["pdf"] -> array([0, 1, 5, ...]).
+    Positions are those of the retriever the index was built for: the BM25 corpus
+    order, or the FAISS index ids.
+
+    Values of the same field are OR-ed, different fields are AND-ed:
+        {"tenant_id": "acme", "filetype": ["pdf", "sql"]}
+    """
+
+    def __init__(self, postings: dict[str, dict[str, np.ndarray]], size: int):
+        self.postings = postings
+        self.size = size
+
+    @classmethod
+    def from_metadata(
+        cls, metadatas: Iterable[dict[str, Any]], fields=FILTER_FIELDS
+    ) -> "MetadataIndex":
+        positions = {field: defaultdict(list) for field in fields}
+        size = 0
+        for position, metadata in enumerate(metadatas):
+            size += 1
+            for field in fields:
+                values = metadata.get(field)
+                if values is None:
+                    continue
+                if not isinstance(values, list):
+                    values = [values]
+                for value in values:
+                    positions[field][str(value)].append(position)
+
+        postings = {
+            field: {
+                value: np.asarray(value_positions, dtype=np.int64)
+                for value, value_positions in field_positions.items()
+            }
+            for field, field_positions in positions.items()
+        }
+        return cls(postings, size)
+
+    def select(self, filters: Filters | None) -> np.ndarray | None:
+        """
+        Return the sorted positions matching filters, or None when unfiltered.
+        """
+        filters = validate_filters(filters)
+        if filters is None:
+            return None
+
+        selected = None
+        for field, values in filters.items():
+            arrays = [self.postings[field].get(str(value), _EMPTY) for value in values]
+            if len(arrays) == 1:
+                ids = arrays[0]
+            else:
+                ids = np.unique(np.concatenate(arrays or [_EMPTY]))
+            if selected is None:
+                selected = ids
+            else:
+                selected = np.intersect1d(selected, ids, assume_unique=True)
+            if len(selected) == 0:
+                break
+
+        return selected
+
+    def bitmap(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Pack positions into a bitmap, bit i set for position i (faiss.IDSelectorBitmap).
+        """
+        mask = np.zeros(self.size, dtype=bool)
+        mask[ids] = True
+        return np.packbits(mask, bitorder="little")
+
+
+def opensearch_filter(filters: Filters | None) -> dict[str, Any]:
+    """
+    Translate filters into an OpenSearch bool filter on the chunk metadata.
+    """
+    filters = validate_filters(filters)
+    if filters is None:
+        return {}
+    return {
+        "bool": {
+            "filter": [
+                {"terms": {f"metadata.{field}.keyword": values}}
+                for field, values in filters.items()
+            ]
+        }
+    }
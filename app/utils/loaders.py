@@ -1,11 +1,35 @@
+import io
 from typing import Callable
-from langchain_unstructured import UnstructuredLoader
 
 LoaderBuilder = Callable[..., object]
 
+
+def _unstructured_loader(**kw):
+    from langchain_unstructured import UnstructuredLoader
+
+    return UnstructuredLoader(**kw)
+
+
+def _unstructured_pdf_loader(path, cache_dir=None, sha256=None, **kw):
+    if cache_dir is None:
+        return _unstructured_loader(file_path=path, **kw)
+
+    from app.utils.parse_cache import CachedUnstructuredLoader
+
+    return CachedUnstructuredLoader(path, cache_dir=cache_dir, sha256=sha256, **kw)
+
+
 LOADER_REGISTRY: dict[str, dict[str, LoaderBuilder]] = {
     "unstructured": {
-        "pdf": lambda path, **kw: UnstructuredLoader(file_path=path, **kw),
-        "web": lambda path, **kw: UnstructuredLoader(web_url=path, **kw),
+        #  with cache_dir, parsed elements are cached there (see parse_cache)
+        "pdf": _unstructured_pdf_loader,
+        "web": lambda path, **kw: _unstructured_loader(web_url=path, **kw),
+        #  a page already fetched, as bytes
+        "html": lambda url, content, **kw: _unstructured_loader(
+            file=io.BytesIO(content),
+            metadata_filename=url,
+            content_type="text/html",
+            **kw,
+        ),
     }
 }
@@ -1,13 +1,24 @@
-from opensearchpy import RequestsHttpConnection, AWSV4SignerAuth
 from functools import lru_cache
+from typing import Any
 import os
-import boto3
 
 AOSS_SERVICE = "aoss"
 
+#  connection pool defaults, overridden by `connection` in the opensearch
+#  vector store kwargs of config.yaml
+DEFAULT_CONNECTION = {
+    "pool_maxsize": 32,
+    "timeout": 30,
+    "max_retries": 3,
+    "retry_on_timeout": True,
+}
+
 
 @lru_cache(maxsize=1)
-def get_opensearch_auth() -> AWSV4SignerAuth:
+def get_opensearch_auth():
+    import boto3
+    from opensearchpy import AWSV4SignerAuth
+
     region = os.getenv("AWS_REGION")
     service = AOSS_SERVICE
     credentials = boto3.Session().get_credentials()
@@ -17,12 +28,71 @@ def get_opensearch_auth() -> AWSV4SignerAuth:
 
 
 @lru_cache(maxsize=1)
-def get_opensearch_langchain_kwargs() -> dict:
+def get_opensearch_async_auth():
+    import boto3
+    from opensearchpy import AWSV4SignerAsyncAuth
+
+    credentials = boto3.Session().get_credentials()
+    return AWSV4SignerAsyncAuth(credentials, os.getenv("AWS_REGION"), AOSS_SERVICE)
+
+
+def _connection_settings(connection: dict[str, Any] | None) -> dict[str, Any]:
+    settings = {**DEFAULT_CONNECTION, **(connection or {})}
+    #  only used by ingestion, see _create_opensearch
+    settings.pop("bulk_timeout", None)
+    return settings
+
+
+@lru_cache(maxsize=8)
+def get_opensearch_langchain_kwargs(**connection) -> dict:
+    """
+    Client kwargs for OpenSearchVectorSearch, with a pooled, SigV4-signed
+    connection. Keyword arguments override DEFAULT_CONNECTION.
+    """
+    from opensearchpy import RequestsHttpConnection
+
     connection_kwargs = {
         "http_auth": get_opensearch_auth(),
         "use_ssl": True,
         "verify_certs": True,
         "connection_class": RequestsHttpConnection,
-        "timeout": 300,
+        **_connection_settings(connection),
     }
     return connection_kwargs
+
+
+def build_opensearch_client(
+    url: str, connection: dict[str, Any] | None = None, aws_auth: bool = True
+):
+    """
+    Pooled OpenSearch client. Without aws_auth, requests are not signed
+    (e.g. a local OpenSearch).
+    """
+    from opensearchpy import OpenSearch, RequestsHttpConnection
+
+    auth_kwargs = {"http_auth": get_opensearch_auth()} if aws_auth else {}
+    return OpenSearch(
+        url,
+        connection_class=RequestsHttpConnection,
+        **auth_kwargs,
+        **_connection_settings(connection),
+    )
+
+
+def build_async_opensearch_client(
+    url: str, connection: dict[str, Any] | None = None, aws_auth: bool = True
+):
+    """
+    AsyncOpenSearch client on an aiohttp connection pool of pool_maxsize.
+    """
+    from opensearchpy import AsyncHttpConnection, AsyncOpenSearch
+
+    settings = _connection_settings(connection)
+    auth_kwargs = {"http_auth": get_opensearch_async_auth()} if aws_auth else {}
+    return AsyncOpenSearch(
+        url,
+        connection_class=AsyncHttpConnection,
+        maxsize=settings.pop("pool_maxsize"),
+        **auth_kwargs,
+        **settings,
+    )
@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import json
+import os
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Any, Iterator
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+from app.utils.paths import PARSE_CACHE_DIR
+
+#  loader params applied when chunking the parsed elements, all other params
+#  affect parsing and are part of the cache key
+CHUNKING_PARAMS = {
+    "chunking_strategy",
+    "max_characters",
+    "new_after_n_chars",
+    "overlap",
+    "overlap_all",
+    "combine_text_under_n_chars",
+    "multipage_sections",
+    "include_orig_elements",
+}
+
+
+def file_sha256(file_path: Path | str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _unstructured_version() -> str | None:
+    try:
+        return version("unstructured")
+    except PackageNotFoundError:
+        return None
+
+
+class CachedUnstructuredLoader(BaseLoader):
+    """
+    Unstructured file loader that caches the parsed elements, before chunking,
+    under cache_dir, keyed by the file sha256, the loader and the params that
+    affect parsing (e.g. strategy, infer_table_structure). Chunking runs on the
+    cached elements, so changing chunking params does not parse files again.
+    """
+
+    loader_type = "unstructured"
+
+    def __init__(
+        self,
+        file_path: Path | str,
+        cache_dir: Path | str = PARSE_CACHE_DIR,
+        sha256: str | None = None,
+        **params: Any,
+    ):
+        self.file_path = Path(file_path)
+        self.cache_dir = Path(cache_dir)
+        self.sha256 = sha256
+        self.partition_params = {
+            k: v for k, v in params.items() if k not in CHUNKING_PARAMS
+        }
+        self.chunking_params = {k: v for k, v in params.items() if k in CHUNKING_PARAMS}
+
+    def cache_key(self) -> str:
+        key = {
+            "sha256": self.sha256 or file_sha256(self.file_path),
+            "loader": self.loader_type,
+            "version": _unstructured_version(),
+            "params": self.partition_params,
+        }
+        encoded = json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def elements(self) -> list[dict]:
+        """
+        Parsed elements of the file, as dicts, from the cache if present.
+        """
+        path = self.cache_dir / f"{self.cache_key()}.json.gz"
+        if path.exists():
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                elements = json.load(f)
+            print(f"[parse_cache] hit {self.file_path.name}: {len(elements)} elements")
+            return elements
+
+        elements = self._partition()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(elements, f)
+        os.replace(tmp_path, path)
+        print(f"[parse_cache] parsed {self.file_path.name}: {len(elements)} elements")
+        return elements
+
+    def _partition(self) -> list[dict]:
+        from unstructured.partition.auto import partition
+        from unstructured.staging.base import elements_to_dicts
+
+        elements = partition(filename=str(self.file_path), **self.partition_params)
+        return elements_to_dicts(elements)
+
+    def _chunk(self, elements: list[dict]) -> list[dict]:
+        strategy = self.chunking_params.get("chunking_strategy")
+        if strategy is None:
+            return elements
+
+        from unstructured.chunking.basic import chunk_elements
+        from unstructured.chunking.title import chunk_by_title
+        from unstructured.staging.base import elements_from_dicts, elements_to_dicts
+
+        chunkers = {"basic": chunk_elements, "by_title": chunk_by_title}
+        if strategy not in chunkers:
+            raise ValueError(f"Unsupported chunking strategy: {strategy}")
+        params = {
+            k: v for k, v in self.chunking_params.items() if k != "chunking_strategy"
+        }
+        chunks = chunkers[strategy](elements_from_dicts(elements), **params)
+        return elements_to_dicts(chunks)
+
+    def lazy_load(self) -> Iterator[Document]:
+        #  same Documents as UnstructuredLoader
+        for element in self._chunk(self.elements()):
+            metadata = {
+                "source": str(self.file_path),
+                **element.get("metadata", {}),
+                "category": element.get("type"),
+                "element_id": element.get("element_id"),
+            }
+            yield Document(page_content=element.get("text", ""), metadata=metadata)
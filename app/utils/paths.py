@@ -4,6 +4,11 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parents[2]
 ART_DIR = BASE_DIR / "artifacts"
 DOC_DIR = BASE_DIR / "artifacts" / "documents"
+TENANT_DIR = BASE_DIR / "artifacts" / "tenants"
+CHECKPOINT_DIR = BASE_DIR / "artifacts" / "checkpoints"
+WEB_CACHE_PATH = BASE_DIR / "artifacts" / "web_cache.json"
+PARSE_CACHE_DIR = BASE_DIR / "artifacts" / "parse_cache"
+DEDUP_DIR = BASE_DIR / "artifacts" / "dedup"
 DATA_DIR = BASE_DIR / "data"
 PDF_DIR = DATA_DIR / "pdf"
 WEB_DIR = DATA_DIR / "web"
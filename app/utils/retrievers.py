@@ -0,0 +1,855 @@
+import heapq
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from operator import attrgetter, itemgetter
+from typing import Any, Iterable
+import numpy as np
+from langchain.retrievers import EnsembleRetriever
+from langchain_community.retrievers import BM25Retriever
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import RunnableConfig
+from pydantic import ConfigDict, PrivateAttr
+from app.utils.filters import Filters, MetadataIndex, opensearch_filter
+
+
+class Chunk:
+    """
+    A retrieved chunk as passed between retrieval stages: its id, the score of
+    the last stage, and the text and metadata of the stored Document, which are
+    referenced rather than copied. Documents are only built for the callers of
+    retrievers and of the graph (to_document).
+
+    score_field names the metadata field the score is returned in, e.g.
+    "relevance_score" after reranking, or None to leave it out.
+    """
+
+    __slots__ = ("id", "score", "text", "metadata", "score_field")
+
+    def __init__(
+        self,
+        id: str,
+        text: str,
+        metadata: dict[str, Any],
+        score: float = 0.0,
+        score_field: str | None = None,
+    ):
+        self.id = id
+        self.text = text
+        self.metadata = metadata
+        self.score = score
+        self.score_field = score_field
+
+    @classmethod
+    def from_document(cls, doc: Document, score: float = 0.0) -> "Chunk":
+        return cls(
+            doc.metadata.get("chunk_id") or doc.page_content,
+            doc.page_content,
+            doc.metadata,
+            score,
+        )
+
+    def to_document(self) -> Document:
+        metadata = self.metadata
+        if self.score_field is not None:
+            metadata = {**metadata, self.score_field: self.score}
+        return Document(page_content=self.text, metadata=metadata)
+
+    def __repr__(self) -> str:
+        return f"Chunk(id={self.id!r}, score={self.score!r})"
+
+
+def to_documents(chunks: Iterable[Chunk]) -> list[Document]:
+    return [chunk.to_document() for chunk in chunks]
+
+
+class ChunkRetriever(BaseRetriever):
+    """
+    Retriever returning Chunks from search_chunks, which retrievers wrapping
+    it call directly. invoke builds Documents from the Chunks.
+    """
+
+    def search_chunks(self, query: str, **kwargs: Any) -> list[Chunk]:
+        raise NotImplementedError
+
+    def search_chunks_batch(
+        self,
+        queries: list[str],
+        filters: list[Filters | None] | None = None,
+        **kwargs: Any,
+    ) -> list[list[Chunk]]:
+        """
+        Chunks of several queries, filters[i] applying to queries[i] and other
+        kwargs to all of them. Retrievers override this to share work between
+        the queries, e.g. one embedding call.
+        """
+        filters = filters or [None] * len(queries)
+        return [
+            self.search_chunks(query, filters=query_filters, **kwargs)
+            for query, query_filters in zip(queries, filters)
+        ]
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+        **kwargs: Any,
+    ) -> list[Document]:
+        return to_documents(self.search_chunks(query, **kwargs))
+
+
+def retrieve_chunks(retriever: BaseRetriever, query: str, **kwargs: Any) -> list[Chunk]:
+    """
+    Chunks retrieved by any retriever, converted from Documents when it is not
+    a ChunkRetriever (e.g. vector_store.as_retriever()).
+    """
+    if isinstance(retriever, ChunkRetriever):
+        return retriever.search_chunks(query, **kwargs)
+    return [Chunk.from_document(doc) for doc in retriever.invoke(query, **kwargs)]
+
+
+def retrieve_chunks_batch(
+    retriever: BaseRetriever,
+    queries: list[str],
+    filters: list[Filters | None] | None = None,
+    **kwargs: Any,
+) -> list[list[Chunk]]:
+    """
+    retrieve_chunks for several queries, see ChunkRetriever.search_chunks_batch.
+    """
+    if isinstance(retriever, ChunkRetriever):
+        return retriever.search_chunks_batch(queries, filters, **kwargs)
+    filters = filters or [None] * len(queries)
+    return [
+        retrieve_chunks(
+            retriever,
+            query,
+            **({"filters": query_filters} if query_filters else {}),
+            **kwargs,
+        )
+        for query, query_filters in zip(queries, filters)
+    ]
+
+
+def rescore(
+    vectors: np.ndarray,
+    candidate_ids: np.ndarray,
+    query: np.ndarray,
+    k: int,
+    inner_product: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Re-score candidate ids with the exact float32 vectors and keep the best k.
+    Candidates are read in id order, so reads from a memory-mapped file are sequential.
+    Returns (ids, scores), best first. Higher scores are better.
+    """
+    candidate_ids = np.sort(candidate_ids[candidate_ids >= 0])
+    exact = np.asarray(vectors[candidate_ids], dtype="float32")
+    return _top_k(candidate_ids, exact, query, k, inner_product)
+
+
+def _top_k(
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    query: np.ndarray,
+    k: int,
+    inner_product: bool,
+) -> tuple[np.ndarray, np.ndarray]:
+    if inner_product:
+        scores = vectors @ query
+    else:
+        scores = -((vectors - query) ** 2).sum(axis=1)
+    order = np.argsort(-scores, kind="stable")[:k]
+
+    return ids[order], scores[order]
+
+
+def _faiss_search_parameters(index, selector):
+    """
+    Search parameters restricting a search to selector, keeping the search-time
+    parameters (nprobe, efSearch) already set on the index.
+    """
+    import faiss
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexPreTransform):
+        inner = _faiss_search_parameters(index.index, selector)
+        params = faiss.SearchParametersPreTransform(index_params=inner)
+        params.referenced_objects = [inner]
+        return params
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(
+            sel=selector, nprobe=index.nprobe, max_codes=index.max_codes
+        )
+    return faiss.SearchParameters(sel=selector)
+
+
+class FAISSRetriever(ChunkRetriever):
+    """
+    Dense retrieval over a LangChain FAISS vector store.
+
+    With `vectors` (the exact float32 vectors, memory-mapped), the index is searched
+    for rescore_candidates candidates, which are re-ranked exactly (two-stage search).
+
+    With `metadata_index`, requests can pass filters, applied inside the index
+    search with a faiss.IDSelectorBitmap. For approximate indexes, which can miss
+    results of selective filters, selections of up to exact_filter_max chunks
+    are scored exactly instead.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vector_store: Any
+    k: int = 4
+    vectors: Any = None
+    rescore_candidates: int = 0
+    metadata_index: Any = None
+    exact_filter_max: int = 10_000
+
+    def _embed_queries(self, queries: list[str]) -> tuple[np.ndarray, bool]:
+        """
+        Embed queries, one row each. Several queries are embedded in one call.
+        """
+        from langchain_community.vectorstores.utils import DistanceStrategy
+
+        if len(queries) == 1:
+            vectors = [self.vector_store._embed_query(queries[0])]
+        else:
+            vectors = self.vector_store._embed_documents(queries)
+        embeddings = np.asarray(vectors, dtype="float32")
+        if self.vector_store._normalize_L2:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        inner_product = (
+            self.vector_store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+        )
+        return embeddings, inner_product
+
+    def _embed_query(self, query: str) -> tuple[np.ndarray, bool]:
+        return self._embed_queries([query])
+
+    def _selected_vectors(self, ids: np.ndarray) -> np.ndarray | None:
+        import faiss
+
+        if isinstance(faiss.downcast_index(self.vector_store.index), faiss.IndexFlat):
+            #  a filtered search of a flat index is already exact
+            return None
+        if self.vectors is not None:
+            return np.asarray(self.vectors[ids], dtype="float32")
+        try:
+            return self.vector_store.index.reconstruct_batch(ids)
+        except RuntimeError:
+            #  e.g. IVF indexes without a direct map
+            return None
+
+    def _search(
+        self,
+        embedding: np.ndarray,
+        k: int,
+        selected: np.ndarray | None,
+        inner_product: bool,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if selected is None:
+            distances, ids = self.vector_store.index.search(embedding, k)
+        else:
+            import faiss
+
+            selector = faiss.IDSelectorBitmap(self.metadata_index.bitmap(selected))
+            params = _faiss_search_parameters(self.vector_store.index, selector)
+            distances, ids = self.vector_store.index.search(embedding, k, params=params)
+
+        found = ids[0] >= 0
+        scores = distances[0] if inner_product else -distances[0]
+        return ids[0][found], scores[found]
+
+    def search_by_vector(
+        self,
+        embedding: np.ndarray,
+        inner_product: bool,
+        filters: Filters | None = None,
+    ) -> list[Chunk]:
+        """
+        Search with an embedded query. Returns chunks, best first. Higher scores
+        are better, so results of several indexes can be merged.
+        """
+        selected = None
+        if filters and self.metadata_index is not None:
+            selected = self.metadata_index.select(filters)
+
+        if selected is not None and len(selected) == 0:
+            ids, scores = selected, selected
+        elif selected is not None and len(selected) <= self.exact_filter_max:
+            selected_vectors = self._selected_vectors(selected)
+            if selected_vectors is not None:
+                ids, scores = _top_k(
+                    selected, selected_vectors, embedding[0], self.k, inner_product
+                )
+            else:
+                ids, scores = self._search(embedding, self.k, selected, inner_product)
+        elif self.vectors is not None:
+            n_candidates = max(self.rescore_candidates, self.k)
+            candidate_ids, _ = self._search(
+                embedding, n_candidates, selected, inner_product
+            )
+            ids, scores = rescore(
+                self.vectors, candidate_ids, embedding[0], self.k, inner_product
+            )
+        else:
+            ids, scores = self._search(embedding, self.k, selected, inner_product)
+
+        docstore = self.vector_store.docstore
+        docstore_ids = self.vector_store.index_to_docstore_id
+        return [
+            Chunk.from_document(docstore.search(docstore_ids[i]), score)
+            for i, score in zip(ids.tolist(), scores.tolist())
+        ]
+
+    def search_chunks(self, query: str, *, filters: Filters | None = None):
+        embedding, inner_product = self._embed_query(query)
+        return self.search_by_vector(embedding, inner_product, filters)
+
+    def search_chunks_batch(self, queries, filters=None, **kwargs):
+        embeddings, inner_product = self._embed_queries(queries)
+        filters = filters or [None] * len(queries)
+        return [
+            self.search_by_vector(embeddings[i : i + 1], inner_product, filters[i])
+            for i in range(len(queries))
+        ]
+
+
+def merge_top_k(results: Iterable[list], k: int, key=itemgetter(0)) -> list:
+    """
+    Merge per-shard result lists, each sorted best first by key (by default
+    the score of (score, item) pairs), into the best k.
+    """
+    merged = heapq.merge(*results, key=key, reverse=True)
+    return list(islice(merged, k))
+
+
+class ShardedFAISSRetriever(ChunkRetriever):
+    """
+    Scatter-gather dense retrieval over several FAISS indexes, e.g. the
+    per-source indexes written by ingestion, without merging them.
+
+    The query is embedded once, every shard is searched in a thread pool
+    (FAISS releases the GIL while searching), and the per-shard top k are
+    merged with a heap. Shards can be added or removed while serving.
+
+    The pool has a worker per shard, up to 32, unless max_workers is set, and
+    grows as shards are added.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    shards: dict[str, FAISSRetriever]
+    k: int = 4
+    max_workers: int | None = None
+    _pool: ThreadPoolExecutor = PrivateAttr()
+    _pool_size: int = PrivateAttr(default=0)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, context: Any) -> None:
+        super().model_post_init(context)
+        self._resize_pool()
+
+    def _resize_pool(self) -> None:
+        size = self.max_workers or min(32, len(self.shards) or 1)
+        if size > self._pool_size:
+            #  searches in flight finish on the previous pool, whose idle
+            #  threads exit once it is no longer referenced
+            self._pool = ThreadPoolExecutor(
+                max_workers=size, thread_name_prefix="faiss-shard"
+            )
+            self._pool_size = size
+
+    def add_shard(self, name: str, retriever: FAISSRetriever) -> None:
+        with self._lock:
+            #  replace rather than mutate, so in-flight searches keep a
+            #  consistent view
+            self.shards = {**self.shards, name: retriever}
+            self._resize_pool()
+
+    def remove_shard(self, name: str) -> None:
+        with self._lock:
+            self.shards = {
+                key: value for key, value in self.shards.items() if key != name
+            }
+
+    def _scatter_gather(self, shards, embedding, inner_product, filters):
+        results = self._pool.map(
+            lambda shard: shard.search_by_vector(embedding, inner_product, filters),
+            shards,
+        )
+        return merge_top_k(results, self.k, key=attrgetter("score"))
+
+    def search_chunks(self, query: str, *, filters: Filters | None = None):
+        shards = list(self.shards.values())
+        if not shards:
+            return []
+        embedding, inner_product = shards[0]._embed_query(query)
+        return self._scatter_gather(shards, embedding, inner_product, filters)
+
+    def search_chunks_batch(self, queries, filters=None, **kwargs):
+        shards = list(self.shards.values())
+        if not shards:
+            return [[] for _ in queries]
+        embeddings, inner_product = shards[0]._embed_queries(queries)
+        filters = filters or [None] * len(queries)
+        return [
+            self._scatter_gather(
+                shards, embeddings[i : i + 1], inner_product, filters[i]
+            )
+            for i in range(len(queries))
+        ]
+
+
+class FilteredBM25Retriever(ChunkRetriever, BM25Retriever):
+    """
+    BM25 retriever that, given filters, only scores the matching chunks.
+    """
+
+    metadata_index: Any = None
+    #  queries scored at once by search_chunks_batch, bounding the dense
+    #  queries x chunks score matrix
+    batch_block_size: int = 64
+    _term_weights: Any = PrivateAttr(default=None)
+
+    def _select(self, filters: Filters | None) -> np.ndarray | None:
+        if filters and self.metadata_index is not None:
+            return self.metadata_index.select(filters)
+        return None
+
+    def _top_chunks(self, scores: np.ndarray, selected: np.ndarray | None):
+        """
+        Best k chunks, given the scores of all chunks or of the selected ones.
+        """
+        if selected is None:
+            #  same order as BM25Okapi.get_top_n
+            top = np.argsort(scores)[::-1][: self.k]
+            positions = top
+        else:
+            top = np.argsort(-scores, kind="stable")[: self.k]
+            positions = selected[top]
+        return [
+            Chunk.from_document(self.docs[position], score)
+            for position, score in zip(positions.tolist(), scores[top].tolist())
+        ]
+
+    def search_chunks(self, query: str, *, filters: Filters | None = None):
+        tokens = self.preprocess_func(query)
+        selected = self._select(filters)
+        if selected is None:
+            return self._top_chunks(self.vectorizer.get_scores(tokens), None)
+        if len(selected) == 0:
+            return []
+        scores = self.vectorizer.get_batch_scores(tokens, selected.tolist())
+        return self._top_chunks(np.asarray(scores), selected)
+
+    def term_weights(self):
+        """
+        (vocabulary, weights): the BM25Okapi weight of every term in every chunk,
+        as a sparse terms x chunks matrix, so that the scores of queries are the
+        product of their term counts with it. Built on first use.
+        """
+        if self._term_weights is None:
+            from scipy import sparse
+
+            bm25 = self.vectorizer
+            vocabulary = {term: i for i, term in enumerate(bm25.idf)}
+            rows, cols, weights = [], [], []
+            for position, (freqs, doc_len) in enumerate(
+                zip(bm25.doc_freqs, bm25.doc_len)
+            ):
+                norm = bm25.k1 * (1 - bm25.b + bm25.b * doc_len / bm25.avgdl)
+                for term, freq in freqs.items():
+                    rows.append(vocabulary[term])
+                    cols.append(position)
+                    weights.append(
+                        bm25.idf[term] * freq * (bm25.k1 + 1) / (freq + norm)
+                    )
+            matrix = sparse.csr_matrix(
+                (weights, (rows, cols)), shape=(len(vocabulary), bm25.corpus_size)
+            )
+            self._term_weights = (vocabulary, matrix)
+        return self._term_weights
+
+    def search_chunks_batch(self, queries, filters=None, **kwargs):
+        """
+        Score blocks of queries with one sparse matrix product each, instead of
+        one pass over the corpus per query term.
+        """
+        from scipy import sparse
+
+        vocabulary, weights = self.term_weights()
+        filters = filters or [None] * len(queries)
+        results = []
+        for start in range(0, len(queries), self.batch_block_size):
+            block = queries[start : start + self.batch_block_size]
+            rows, cols = [], []
+            for row, query in enumerate(block):
+                for token in self.preprocess_func(query):
+                    if token in vocabulary:
+                        rows.append(row)
+                        cols.append(vocabulary[token])
+            #  repeated query terms add up, as in BM25Okapi.get_scores
+            counts = sparse.csr_matrix(
+                (np.ones(len(rows)), (rows, cols)),
+                shape=(len(block), len(vocabulary)),
+            )
+            scores = (counts @ weights).toarray()
+            for row, query_filters in enumerate(filters[start : start + len(block)]):
+                selected = self._select(query_filters)
+                if selected is None:
+                    results.append(self._top_chunks(scores[row], None))
+                elif len(selected) == 0:
+                    results.append([])
+                else:
+                    results.append(self._top_chunks(scores[row][selected], selected))
+        return results
+
+
+class OpenSearchRetriever(ChunkRetriever):
+    """
+    Dense retrieval over OpenSearch, with filters applied inside the kNN search.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vector_store: Any
+    search_kwargs: dict[str, Any] = {}
+
+    def search_chunks(self, query: str, *, filters: Filters | None = None):
+        search_kwargs = dict(self.search_kwargs)
+        if filters:
+            search_kwargs["efficient_filter"] = opensearch_filter(filters)
+        return [
+            Chunk.from_document(doc, score)
+            for doc, score in self.vector_store.similarity_search_with_score(
+                query, **search_kwargs
+            )
+        ]
+
+
+def weighted_rrf(
+    chunk_lists: list[list[Chunk]],
+    weights: list[float],
+    c: int = 60,
+    key=attrgetter("id"),
+) -> list[Chunk]:
+    """
+    Weighted reciprocal rank fusion, as in EnsembleRetriever, by default keyed
+    by chunk id. The fused chunks are scored with their RRF score.
+    """
+    scores = defaultdict(float)
+    chunks = {}
+    for chunk_list, weight in zip(chunk_lists, weights):
+        for rank, chunk in enumerate(chunk_list, start=1):
+            chunk_key = key(chunk)
+            scores[chunk_key] += weight / (rank + c)
+            chunks.setdefault(chunk_key, chunk)
+
+    fused = []
+    for chunk_key in sorted(scores, key=scores.get, reverse=True):
+        chunk = chunks[chunk_key]
+        chunk.score = scores[chunk_key]
+        fused.append(chunk)
+    return fused
+
+
+class OpenSearchHybridRetriever(ChunkRetriever):
+    """
+    Dense and lexical retrieval both done by OpenSearch, in one round trip,
+    so the API does not need the corpus in memory for BM25.
+
+    mode "msearch": a kNN and a match query sent in one _msearch request, fused
+    with weighted reciprocal rank fusion.
+    mode "hybrid": a single hybrid query, normalized and combined by the
+    search_pipeline configured on the cluster.
+
+    With async_client (AsyncOpenSearch), ainvoke does not block the event loop.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    client: Any
+    index_name: str
+    embeddings: Any
+    async_client: Any = None
+    k_dense: int = 10
+    k_sparse: int = 10
+    weights: list[float] = [0.5, 0.5]
+    c: int = 60
+    mode: str = "msearch"
+    search_pipeline: str | None = None
+    vector_field: str = "vector_field"
+    text_field: str = "text"
+
+    def _knn_query(self, vector: list[float], filters: Filters | None) -> dict:
+        knn = {"vector": vector, "k": self.k_dense}
+        if filters:
+            knn["filter"] = opensearch_filter(filters)
+        return {"knn": {self.vector_field: knn}}
+
+    def _match_query(self, query: str, filters: Filters | None) -> dict:
+        match = {"match": {self.text_field: query}}
+        if not filters:
+            return match
+        return {"bool": {"must": [match], **opensearch_filter(filters)["bool"]}}
+
+    def _request(self, query: str, vector: list[float], filters: Filters | None):
+        source = {"excludes": [self.vector_field]}
+        if self.mode == "hybrid":
+            return {
+                "size": max(self.k_dense, self.k_sparse),
+                "_source": source,
+                "query": {
+                    "hybrid": {
+                        "queries": [
+                            self._knn_query(vector, filters),
+                            self._match_query(query, filters),
+                        ]
+                    }
+                },
+            }
+        if self.mode == "msearch":
+            header = {"index": self.index_name}
+            return [
+                header,
+                {
+                    "size": self.k_dense,
+                    "_source": source,
+                    "query": self._knn_query(vector, filters),
+                },
+                header,
+                {
+                    "size": self.k_sparse,
+                    "_source": source,
+                    "query": self._match_query(query, filters),
+                },
+            ]
+        raise ValueError(f"Unsupported OpenSearch hybrid mode: {self.mode}")
+
+    def _to_chunks(self, response: dict) -> list[Chunk]:
+        if "error" in response:
+            raise RuntimeError(f"OpenSearch query failed: {response['error']}")
+        chunks = []
+        for hit in response["hits"]["hits"]:
+            text = hit["_source"][self.text_field]
+            metadata = hit["_source"].get("metadata", {})
+            chunks.append(
+                Chunk(
+                    metadata.get("chunk_id") or text,
+                    text,
+                    metadata,
+                    hit["_score"] or 0.0,
+                )
+            )
+        return chunks
+
+    def _fuse(self, response: dict) -> list[Chunk]:
+        if self.mode == "hybrid":
+            return self._to_chunks(response)
+        chunk_lists = [self._to_chunks(r) for r in response["responses"]]
+        return weighted_rrf(chunk_lists, self.weights, self.c)
+
+    def _search_params(self) -> dict:
+        if self.mode == "hybrid" and self.search_pipeline:
+            return {"search_pipeline": self.search_pipeline}
+        return {}
+
+    def search_chunks(self, query: str, *, filters: Filters | None = None):
+        body = self._request(query, self.embeddings.embed_query(query), filters)
+        if self.mode == "hybrid":
+            response = self.client.search(
+                index=self.index_name, body=body, params=self._search_params()
+            )
+        else:
+            response = self.client.msearch(body=body)
+        return self._fuse(response)
+
+    def search_chunks_batch(self, queries, filters=None, **kwargs):
+        """
+        Embed the queries in one call and, in msearch mode, send the searches
+        of all queries in one _msearch request.
+        """
+        filters = filters or [None] * len(queries)
+        vectors = self.embeddings.embed_documents(queries)
+        requests = [
+            self._request(query, vector, query_filters)
+            for query, vector, query_filters in zip(queries, vectors, filters)
+        ]
+        if self.mode == "hybrid":
+            return [
+                self._fuse(
+                    self.client.search(
+                        index=self.index_name, body=body, params=self._search_params()
+                    )
+                )
+                for body in requests
+            ]
+        body = [line for request in requests for line in request]
+        responses = self.client.msearch(body=body)["responses"]
+        return [
+            self._fuse({"responses": responses[2 * i : 2 * i + 2]})
+            for i in range(len(queries))
+        ]
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        filters: Filters | None = None,
+    ) -> list[Document]:
+        if self.async_client is None:
+            return await super()._aget_relevant_documents(
+                query, run_manager=run_manager, filters=filters
+            )
+        vector = await self.embeddings.aembed_query(query)
+        body = self._request(query, vector, filters)
+        if self.mode == "hybrid":
+            response = await self.async_client.search(
+                index=self.index_name, body=body, params=self._search_params()
+            )
+        else:
+            response = await self.async_client.msearch(body=body)
+        return to_documents(self._fuse(response))
+
+
+class FilteredEnsembleRetriever(ChunkRetriever, EnsembleRetriever):
+    """
+    EnsembleRetriever that passes request kwargs (e.g. filters) on to each
+    of its retrievers. The base class drops them. Results are fused as Chunks,
+    keyed by text or id_key as in the base class.
+    """
+
+    def invoke(
+        self, input: str, config: RunnableConfig | None = None, **kwargs: Any
+    ) -> list[Document]:
+        #  EnsembleRetriever.invoke calls rank_fusion directly, without kwargs
+        return BaseRetriever.invoke(self, input, config, **kwargs)
+
+    def _fusion_key(self):
+        if self.id_key is None:
+            return attrgetter("text")
+        id_key = self.id_key
+        return lambda chunk: chunk.metadata[id_key]
+
+    def search_chunks(self, query: str, **kwargs: Any) -> list[Chunk]:
+        chunk_lists = [
+            retrieve_chunks(retriever, query, **kwargs) for retriever in self.retrievers
+        ]
+        return weighted_rrf(chunk_lists, self.weights, self.c, key=self._fusion_key())
+
+    def search_chunks_batch(self, queries, filters=None, **kwargs):
+        retriever_chunks = [
+            retrieve_chunks_batch(retriever, queries, filters, **kwargs)
+            for retriever in self.retrievers
+        ]
+        key = self._fusion_key()
+        return [
+            weighted_rrf(chunk_lists, self.weights, self.c, key=key)
+            for chunk_lists in zip(*retriever_chunks)
+        ]
+
+
+def build_metadata_index(docs: list[Document]) -> MetadataIndex:
+    return MetadataIndex.from_metadata(doc.metadata for doc in docs)
+
+
+def build_faiss_metadata_index(vector_store) -> MetadataIndex:
+    """
+    Metadata index over FAISS index ids, which follow the docstore mapping
+    rather than the order of the documents on disk.
+    """
+    docstore_ids = vector_store.index_to_docstore_id
+    return MetadataIndex.from_metadata(
+        vector_store.docstore.search(docstore_ids[i]).metadata
+        for i in range(vector_store.index.ntotal)
+    )
+
+
+class TenantShardedRetriever(ChunkRetriever):
+    """
+    Route each request to the retriever of its tenant, taken from a ShardCache
+    that loads tenant shards on first use.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    shards: Any
+    default_tenant: str = "default"
+
+    def search_chunks(
+        self, query: str, *, tenant_id: str | None = None, **kwargs: Any
+    ) -> list[Chunk]:
+        shard = self.shards.get(tenant_id or self.default_tenant)
+        return retrieve_chunks(shard, query, **kwargs)
+
+    def search_chunks_batch(self, queries, filters=None, tenant_id=None, **kwargs):
+        #  one tenant for all queries, callers group queries by tenant
+        shard = self.shards.get(tenant_id or self.default_tenant)
+        return retrieve_chunks_batch(shard, queries, filters, **kwargs)
+
+
+class RerankRetriever(ChunkRetriever):
+    """
+    Rerank the chunks of base_retriever with a reranker exposing
+    rerank(documents, query) -> [{"index", "relevance_score"}], e.g. CohereRerank,
+    which keeps its top_n. Same results as ContextualCompressionRetriever with
+    the reranker as compressor, without copying Documents and their metadata.
+
+    Rerank requests take a single query, so search_chunks_batch sends those of
+    its queries concurrently, at most max_concurrency at a time.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    base_retriever: Any
+    reranker: Any
+    max_concurrency: int = 8
+
+    @property
+    def top_n(self) -> int | None:
+        return getattr(self.reranker, "top_n", None)
+
+    def rerank(self, query: str, chunks: list[Chunk]) -> list[Chunk]:
+        """
+        The top_n of chunks by relevance to query, as new records: chunks are
+        left as they were, in fused order.
+        """
+        if not chunks:
+            return []
+        reranked = []
+        for result in self.reranker.rerank([chunk.text for chunk in chunks], query):
+            chunk = chunks[result["index"]]
+            reranked.append(
+                Chunk(
+                    chunk.id,
+                    chunk.text,
+                    chunk.metadata,
+                    result["relevance_score"],
+                    "relevance_score",
+                )
+            )
+        return reranked
+
+    def search_chunks(self, query: str, **kwargs: Any) -> list[Chunk]:
+        return self.rerank(query, retrieve_chunks(self.base_retriever, query, **kwargs))
+
+    def search_chunks_batch(self, queries, filters=None, **kwargs):
+        chunk_lists = retrieve_chunks_batch(
+            self.base_retriever, queries, filters, **kwargs
+        )
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="rerank"
+        ) as pool:
+            return list(pool.map(self.rerank, queries, chunk_lists))
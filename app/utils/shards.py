@@ -0,0 +1,120 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable
+
+_TENANT_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]*")
+
+
+class UnknownTenantError(LookupError):
+    pass
+
+
+def check_tenant_id(tenant_id: str) -> str:
+    """
+    Tenant ids name directories under artifacts/tenants, so only allow
+    characters that cannot escape it.
+    """
+    if not _TENANT_ID.fullmatch(tenant_id):
+        raise UnknownTenantError(f"Invalid tenant id: {tenant_id!r}")
+    return tenant_id
+
+
+@dataclass
+class ShardStats:
+    loads: int = 0
+    hits: int = 0
+    evictions: int = 0
+    load_seconds: float = 0.0
+    size_mb: float = 0.0
+    loaded: bool = False
+    last_used: float | None = None
+
+
+class ShardCache:
+    """
+    LRU cache of loaded shards (e.g. one retriever per tenant), bounded by the
+    number of loaded shards and their total estimated size.
+
+    Shards are loaded on first use. Concurrent requests for a shard that is not
+    loaded yet wait for a single load. Evicted shards are freed once the requests
+    still using them finish.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str], Any],
+        size_mb: Callable[[str], float],
+        max_shards: int = 32,
+        max_memory_mb: float = 4096.0,
+    ):
+        self._load = load
+        self._size_mb = size_mb
+        self.max_shards = max_shards
+        self.max_memory_mb = max_memory_mb
+        self._shards: OrderedDict[str, Any] = OrderedDict()
+        self._loading: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.stats: dict[str, ShardStats] = {}
+
+    @property
+    def memory_mb(self) -> float:
+        return sum(self.stats[key].size_mb for key in self._shards)
+
+    def _hit(self, key: str):
+        self._shards.move_to_end(key)
+        self.stats[key].hits += 1
+        self.stats[key].last_used = time.time()
+        return self._shards[key]
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._shards:
+                return self._hit(key)
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._shards:
+                    return self._hit(key)
+
+            start = time.perf_counter()
+            shard = self._load(key)
+            load_seconds = time.perf_counter() - start
+            size_mb = self._size_mb(key)
+
+            with self._lock:
+                stats = self.stats.setdefault(key, ShardStats())
+                stats.loads += 1
+                stats.load_seconds += load_seconds
+                stats.size_mb = size_mb
+                stats.loaded = True
+                stats.last_used = time.time()
+                self._shards[key] = shard
+                self._evict()
+                self._loading.pop(key, None)
+
+        print(f"[shards] loaded {key} in {load_seconds:.2f}s ({size_mb:.0f}MB)")
+        return shard
+
+    def _evict(self):
+        #  always keep the most recently used shard, even if it alone is too large
+        while len(self._shards) > 1 and (
+            len(self._shards) > self.max_shards or self.memory_mb > self.max_memory_mb
+        ):
+            key, _ = self._shards.popitem(last=False)
+            self.stats[key].evictions += 1
+            self.stats[key].loaded = False
+            print(f"[shards] evicted {key}")
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": list(self._shards),
+                "memory_mb": round(self.memory_mb, 1),
+                "max_shards": self.max_shards,
+                "max_memory_mb": self.max_memory_mb,
+                "shards": {key: asdict(stats) for key, stats in self.stats.items()},
+            }
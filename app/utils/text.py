@@ -1,14 +1,102 @@
+import multiprocessing
+import re
 import string
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, Iterable
+
+QUERY_CACHE_SIZE = 4096
 
-_stopwords = set(stopwords.words("english"))
 _translator = str.maketrans("", "", string.punctuation)
+_token_pattern = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=1)
+def _get_stopwords() -> frozenset[str]:
+    """
+    Load the NLTK English stopwords on first use rather than at import time.
+    """
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words("english"))
+
+
+def _filter_tokens(tokens: Iterable[str]) -> list[str]:
+    stopwords = _get_stopwords()
+    return [t for t in tokens if t not in stopwords and len(t) > 2]
 
 
 def clean_tokens(text: str):
     """
     Tokenize and clean English text for keyword-based retrieval.
     """
+    from nltk.tokenize import word_tokenize
+
     tokens = word_tokenize(text.lower().translate(_translator))
-    return [t for t in tokens if t not in _stopwords and len(t) > 2]
+    return _filter_tokens(tokens)
+
+
+def regex_clean_tokens(text: str) -> list[str]:
+    """
+    Same as clean_tokens, but splits on a compiled regex instead of running the
+    NLTK Punkt/Treebank tokenizers.
+
+    Once punctuation is stripped the two agree on plain text. They differ only on
+    Treebank special cases, e.g. "cannot" is kept whole here instead of being
+    split into "can" and "not".
+    """
+    tokens = _token_pattern.findall(text.lower().translate(_translator))
+    return _filter_tokens(tokens)
+
+
+TOKENIZERS: dict[str, Callable[[str], list[str]]] = {
+    "nltk": clean_tokens,
+    "regex": regex_clean_tokens,
+}
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _cached_tokens(tokenizer: str, text: str) -> tuple[str, ...]:
+    return tuple(TOKENIZERS[tokenizer](text))
+
+
+def get_query_tokenizer(tokenizer: str = "regex") -> Callable[[str], list[str]]:
+    """
+    Return a tokenizer for query-side calls, memoized in a bounded LRU cache.
+    Repeated queries skip tokenization entirely.
+    """
+    if tokenizer not in TOKENIZERS:
+        raise ValueError(f"Unsupported tokenizer: {tokenizer}")
+
+    def tokenize(text: str) -> list[str]:
+        return list(_cached_tokens(tokenizer, text))
+
+    return tokenize
+
+
+def batch_clean_tokens(
+    texts: list[str],
+    tokenizer: str = "regex",
+    max_workers: int | None = None,
+    chunksize: int = 256,
+    min_parallel: int = 2000,
+) -> list[list[str]]:
+    """
+    Tokenize many documents, using a process pool when there are at least
+    min_parallel of them. Order of the output matches texts.
+
+    Workers are spawned rather than forked: the API builds BM25 indexes in
+    threads (reloads, tenant shards), and forking a multithreaded process
+    can deadlock the children.
+    """
+    if tokenizer not in TOKENIZERS:
+        raise ValueError(f"Unsupported tokenizer: {tokenizer}")
+    tokenize = TOKENIZERS[tokenizer]
+
+    if len(texts) < min_parallel or max_workers == 1:
+        return [tokenize(text) for text in texts]
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        return list(pool.map(tokenize, texts, chunksize=chunksize))
@@ -0,0 +1,20 @@
+from contextlib import contextmanager
+import time
+
+
+@contextmanager
+def timed(timings: dict[str, float] | None, phase: str):
+    """
+    Record the wall-clock duration of the enclosed block in timings[phase], in seconds.
+    Does nothing if timings is None.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[phase] = time.perf_counter() - start
+
+
+def format_timings(timings: dict[str, float]) -> str:
+    return ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in timings.items())
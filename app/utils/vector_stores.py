@@ -1,12 +1,15 @@
-from typing import Callable
-from langchain_community.vectorstores import FAISS, OpenSearchVectorSearch
+from typing import Any, Callable
 from app.config import VectorStoreConfig
-from app.utils.opensearch import get_opensearch_langchain_kwargs
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 import os
 import json
+import numpy as np
 from enum import StrEnum
-from app.utils.paths import BASE_DIR
+from itertools import chain
+from pathlib import Path
+from app.utils.paths import BASE_DIR, CHECKPOINT_DIR
+from app.utils.bulk_indexer import batched
 
 
 class VectorStoreType(StrEnum):
@@ -16,13 +19,109 @@ class VectorStoreType(StrEnum):
 
 VectorStoreBuilder = Callable[..., object]
 
+#  faiss.index_factory encodings for VectorStoreConfig.vector_dtype
+VECTOR_DTYPE_ENCODINGS = {
+    "float32": None,
+    "float16": "SQfp16",
+    "sq8": "SQ8",
+}
+
+
+class TruncatedEmbeddings(Embeddings):
+    """
+    Matryoshka truncation: keep the first `dimensions` components of each
+    embedding and re-normalize to unit length.
+    """
+
+    def __init__(self, embeddings: Embeddings, dimensions: int):
+        self.embeddings = embeddings
+        self.dimensions = dimensions
+
+    def _truncate(self, vector: list[float]) -> list[float]:
+        truncated = np.asarray(vector[: self.dimensions], dtype="float32")
+        return (truncated / np.linalg.norm(truncated)).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._truncate(v) for v in self.embeddings.embed_documents(texts)]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._truncate(self.embeddings.embed_query(text))
+
+
+def build_embeddings(
+    embedding_model: str,
+    dimensions: int | None = None,
+    dimension_mode: str = "request",
+) -> Embeddings:
+    """
+    Build the embedding function, optionally reduced to `dimensions`, either
+    requested from the API ("request") or truncated client-side ("truncate").
+    """
+    if dimensions is None:
+        return OpenAIEmbeddings(model=embedding_model)
+    if dimension_mode == "request":
+        return OpenAIEmbeddings(model=embedding_model, dimensions=dimensions)
+    if dimension_mode == "truncate":
+        return TruncatedEmbeddings(OpenAIEmbeddings(model=embedding_model), dimensions)
+    raise ValueError(f"Unsupported dimension mode: {dimension_mode}")
+
+
+def _embeddings_from_config(cfg: VectorStoreConfig) -> Embeddings:
+    return build_embeddings(cfg.embedding_model, cfg.dimensions, cfg.dimension_mode)
+
+
+def embedding_manifest(cfg: VectorStoreConfig) -> dict[str, Any]:
+    """
+    Embedding settings to record in a manifest, so loading reproduces the same
+    query-side transform independent of config.
+    """
+    return {
+        "embedding_model": cfg.embedding_model,
+        "embedding_dimensions": cfg.dimensions,
+        "dimension_mode": cfg.dimension_mode,
+        "vector_dtype": cfg.vector_dtype,
+    }
+
+
+def faiss_index_factory(cfg: VectorStoreConfig) -> str:
+    """
+    Combine the configured index_factory with the vector_dtype encoding,
+    e.g. ("Flat", "float16") -> "SQfp16", ("HNSW32", "sq8") -> "HNSW32,SQ8".
+    """
+    index_factory = cfg.kwargs.get("index_factory", "Flat")
+    if cfg.vector_dtype not in VECTOR_DTYPE_ENCODINGS:
+        raise ValueError(f"Unsupported vector dtype: {cfg.vector_dtype}")
+    encoding = VECTOR_DTYPE_ENCODINGS[cfg.vector_dtype]
+
+    if encoding is None:
+        return index_factory
+    if "PQ" in index_factory or "SQ" in index_factory:
+        raise ValueError(
+            f"vector_dtype {cfg.vector_dtype} cannot be combined with "
+            f"index_factory {index_factory}, which already compresses vectors."
+        )
+    if index_factory == "Flat":
+        return encoding
+    if index_factory.endswith(",Flat"):
+        return index_factory.removesuffix("Flat") + encoding
+    return f"{index_factory},{encoding}"
+
+
+#  backend-specific imports are deferred to the builders below, so that only
+#  the vector store selected in config.yaml is ever imported
+
 
 def _load_opensearch(cfg: VectorStoreConfig, **kwargs):
-    embeddings = OpenAIEmbeddings(model=cfg.embedding_model)
+    from langchain_community.vectorstores import OpenSearchVectorSearch
+    from app.utils.opensearch import get_opensearch_langchain_kwargs
+
+    embeddings = _embeddings_from_config(cfg)
     opensearch_url = os.getenv("OPENSEARCH_COLLECTION_ENDPOINT")
     index_name = cfg.kwargs["index_name"]
 
-    connection_kwargs = get_opensearch_langchain_kwargs()
+    connection_kwargs = get_opensearch_langchain_kwargs(
+        **cfg.kwargs.get("connection", {})
+    )
     vs_kwargs = {
         "engine": cfg.kwargs["engine"],
         **connection_kwargs,
@@ -35,38 +134,126 @@ def _load_opensearch(cfg: VectorStoreConfig, **kwargs):
     )
 
 
-def _create_opensearch(docs, cfg: VectorStoreConfig, **kwargs):
+def _opensearch_indexer(cfg: VectorStoreConfig, dimension: int | None, **kwargs):
+    """
+    Bulk indexer for the configured OpenSearch index, creating the index if
+    needed. Progress is checkpointed by chunk_id, so rerunning after a failure
+    only indexes the remaining docs.
+    """
+    from langchain_community.vectorstores import OpenSearchVectorSearch
+    from app.utils.bulk_indexer import BulkIndexer, Checkpoint
+    from app.utils.opensearch import get_opensearch_langchain_kwargs
 
-    embeddings = OpenAIEmbeddings(model=cfg.embedding_model)
+    embeddings = _embeddings_from_config(cfg)
+    index_name = cfg.kwargs["index_name"]
 
-    connection_kwargs = get_opensearch_langchain_kwargs()
+    #  bulk requests take longer than queries
+    connection = dict(cfg.kwargs.get("connection", {}))
+    connection["timeout"] = connection.pop("bulk_timeout", 300)
+    connection_kwargs = get_opensearch_langchain_kwargs(**connection)
 
-    vector_store = OpenSearchVectorSearch.from_documents(
-        docs,
-        embeddings,
+    vector_store = OpenSearchVectorSearch(
         opensearch_url=os.getenv("OPENSEARCH_COLLECTION_ENDPOINT"),
-        index_name=cfg.kwargs["index_name"],
+        index_name=index_name,
+        embedding_function=embeddings,
         engine=cfg.kwargs["engine"],
-        space_type=cfg.kwargs["space_type"],
-        ef_construction=cfg.kwargs["ef_construction"],
-        m=cfg.kwargs["m"],
-        bulk_size=6000,
         **connection_kwargs,
     )
 
+    checkpoint = Checkpoint(
+        kwargs.get("checkpoint_path") or CHECKPOINT_DIR / f"{index_name}.txt"
+    )
+    if not vector_store.index_exists(index_name):
+        dimension = dimension or len(embeddings.embed_query("dimension"))
+        vector_store.create_index(
+            dimension,
+            index_name,
+            engine=cfg.kwargs["engine"],
+            space_type=cfg.kwargs["space_type"],
+            ef_construction=cfg.kwargs["ef_construction"],
+            m=cfg.kwargs["m"],
+            http_auth=connection_kwargs["http_auth"],
+        )
+        #  a new index has none of the checkpointed docs
+        checkpoint.clear()
+
+    indexer = BulkIndexer(
+        vector_store.client,
+        index_name,
+        embeddings,
+        checkpoint=checkpoint,
+        #  serverless collections assign their own document ids
+        id_field=None,
+        **cfg.kwargs.get("bulk", {}),
+    )
+    return vector_store, indexer
+
+
+def _create_opensearch(docs, cfg: VectorStoreConfig, **kwargs):
+    """
+    Stream docs (any iterable) into the OpenSearch index.
+    """
+    vector_store, indexer = _opensearch_indexer(cfg, cfg.dimensions, **kwargs)
+    indexer.index(docs)
+
+    return vector_store
+
+
+def _write_opensearch(embedded, cfg: VectorStoreConfig, diff=None, **kwargs):
+    """
+    Stream (document, vector) pairs into the OpenSearch index, then delete the
+    chunks removed from the source according to diff (a ChunkDiff).
+    """
+    embedded = iter(embedded)
+    first = next(embedded, None)
+    removed = diff.removed if diff is not None else []
+    if first is None and not removed:
+        return None
+
+    dimension = len(first[1]) if first is not None else cfg.dimensions
+    vector_store, indexer = _opensearch_indexer(cfg, dimension, **kwargs)
+    if first is not None:
+        indexer.index_embedded(chain([first], embedded))
+    if removed:
+        indexer.delete(removed)
+
     return vector_store
 
 
+def _opensearch_chunk_ids(
+    cfg: VectorStoreConfig,
+    doc_id: str | None = None,
+    s3_documents=None,
+    **kwargs,
+) -> set[str]:
+    """
+    chunk_ids of the source doc_id in the OpenSearch index, as recorded by the
+    documents file on S3. Pass the S3Documents of the run to read the file
+    once for all sources.
+    """
+    if s3_documents is None:
+        import boto3
+        from app.utils.doc_store import S3Documents
+
+        s3_documents = S3Documents(boto3.client("s3"), os.getenv("AWS_S3_DOCS_BUCKET"))
+    return s3_documents.chunk_ids(doc_id)
+
+
 def _load_vector_store_from_manifest(cfg: VectorStoreConfig, VS_DIR):
     """
-    Load FAISS index from disk using the manifest.json to get the embedding model.
-    This keeps the embedding model in sync with the index, independent of config.
+    Load FAISS index from disk using the manifest.json to get the embedding model
+    and dimension settings. This keeps the query embeddings in sync with the index,
+    independent of config.
     """
+    from langchain_community.vectorstores import FAISS
 
     with open(VS_DIR / "manifest.json", "r") as f:
         manifest = json.load(f)
-    embedding_model = manifest["embedding_model"]
-    embeddings = OpenAIEmbeddings(model=embedding_model)
+    embeddings = build_embeddings(
+        manifest["embedding_model"],
+        manifest.get("embedding_dimensions"),
+        manifest.get("dimension_mode", "request"),
+    )
 
     if cfg.type == "faiss":
         vector_store = FAISS.load_local(
@@ -87,6 +274,7 @@ def _load_faiss(cfg: VectorStoreConfig, **kwargs):
     Load a FAISS vector store. If no path to an index is provided,
     uses the merged index at BASE_DIR / "artifacts" / "faiss".
     """
+    from langchain_community.vectorstores import FAISS
 
     FAISS_DIR = BASE_DIR / "artifacts" / "faiss"
     path = kwargs.get("path") or FAISS_DIR
@@ -94,7 +282,7 @@ def _load_faiss(cfg: VectorStoreConfig, **kwargs):
     if (path / "manifest.json").exists():
         return _load_vector_store_from_manifest(cfg, path)
     else:
-        embeddings = OpenAIEmbeddings(model=cfg.embedding_model)
+        embeddings = _embeddings_from_config(cfg)
     print(f"Manifest does not exist, returning default {cfg.type} vector store.")
 
     #  override embedding model if specified in kwargs
@@ -107,20 +295,202 @@ def _load_faiss(cfg: VectorStoreConfig, **kwargs):
 def _create_faiss(docs, cfg: VectorStoreConfig, **kwargs):
     """
     Create a FAISS index from a list of documents and an embedding model.
+    Per-source indexes are always flat float32, reduced precision is applied
+    to the merged index (see faiss_index_factory).
     """
-    embeddings = OpenAIEmbeddings(model=cfg.embedding_model)
+    from langchain_community.vectorstores import FAISS
+
+    embeddings = _embeddings_from_config(cfg)
     vector_store = FAISS.from_documents(docs, embeddings)
     save_dir = kwargs.get("save_dir", None)
     return vector_store.save_local(save_dir)
 
 
+def _load_source_faiss(cfg: VectorStoreConfig, path):
+    """
+    The per-source FAISS index at path, or None if there is none or it was
+    embedded with other settings.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    if path is None:
+        return None
+    path = Path(path)
+    if not (path / "index.faiss").exists() or not (path / "manifest.json").exists():
+        return None
+    with open(path / "manifest.json", "r") as f:
+        manifest = json.load(f)
+    settings = embedding_manifest(cfg)
+    if any(manifest.get(key, value) != value for key, value in settings.items()):
+        return None
+
+    #  only written to, so it needs no embedding function
+    return FAISS.load_local(
+        str(path),
+        None,
+        allow_dangerous_deserialization=cfg.kwargs.get(
+            "allow_dangerous_deserialization", False
+        ),
+    )
+
+
+def _faiss_chunk_ids(cfg: VectorStoreConfig, save_dir=None, **kwargs) -> set[str]:
+    """
+    chunk_ids in the per-source FAISS index at save_dir, which stores chunks
+    under their chunk_id.
+    """
+    vector_store = _load_source_faiss(cfg, save_dir)
+    if vector_store is None:
+        return set()
+    return set(vector_store.index_to_docstore_id.values())
+
+
+def _write_faiss(
+    embedded, cfg: VectorStoreConfig, batch_size: int = 1024, diff=None, **kwargs
+):
+    """
+    Write (document, vector) pairs to the flat per-source FAISS index at
+    save_dir, added in batches as they arrive. With a diff (a ChunkDiff), the
+    existing index is updated: new chunks are added and the chunks removed from
+    the source are deleted. Otherwise the index is built from scratch.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    embeddings = _embeddings_from_config(cfg)
+    save_dir = kwargs.get("save_dir", None)
+    vector_store = _load_source_faiss(cfg, save_dir) if diff is not None else None
+    changed = False
+    for batch in batched(embedded, batch_size):
+        text_embeddings = [(doc.page_content, vector) for doc, vector in batch]
+        metadatas = [doc.metadata for doc, _ in batch]
+        ids = [doc.metadata["chunk_id"] for doc, _ in batch]
+        if vector_store is None:
+            vector_store = FAISS.from_embeddings(
+                text_embeddings, embeddings, metadatas=metadatas, ids=ids
+            )
+        else:
+            vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        changed = True
+
+    if diff is not None and vector_store is not None:
+        indexed = set(vector_store.index_to_docstore_id.values())
+        removed = [chunk_id for chunk_id in diff.removed if chunk_id in indexed]
+        if removed:
+            vector_store.delete(removed)
+            changed = True
+
+    if changed:
+        vector_store.save_local(save_dir)
+    return vector_store
+
+
+#  search-time FAISS index parameters, set on the index rather than passed to
+#  similarity_search (see faiss.ParameterSpace)
+FAISS_SEARCH_PARAMS = ("nprobe", "efSearch", "quantizer_efSearch", "max_codes", "ht")
+
+
+def build_faiss_index(
+    vectors: np.ndarray,
+    index_factory: str = "Flat",
+    train_sample_size: int = 100_000,
+):
+    """
+    Build a FAISS index from a faiss.index_factory string, e.g. "Flat", "HNSW32",
+    "IVF4096,PQ64" or "OPQ64,IVF4096,PQ64". Indexes that need training are
+    trained on a random sample of at most train_sample_size vectors.
+    """
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    index = faiss.index_factory(vectors.shape[1], index_factory, faiss.METRIC_L2)
+    if not index.is_trained:
+        rng = np.random.default_rng(0)
+        sample_size = min(train_sample_size, len(vectors))
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+
+    return index
+
+
+def rebuild_faiss_index(vector_store, index_factory: str, train_sample_size: int):
+    """
+    Replace the index of a LangChain FAISS vector store with one built from
+    index_factory. Vectors keep their positions, so the docstore mapping stays valid.
+    """
+    vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+    vector_store.index = build_faiss_index(vectors, index_factory, train_sample_size)
+
+    return vector_store
+
+
+#  exact float32 vectors of the merged index, in index order, for re-scoring
+RESCORE_VECTORS_FILE = "vectors.npy"
+
+
+def save_rescore_vectors(index, vs_dir, batch_size: int = 100_000) -> None:
+    """
+    Write the full-precision vectors of a flat FAISS index to vs_dir, in batches.
+    The file is written next to the target and renamed into place, so a running
+    API that memory-maps the previous file keeps reading consistent data.
+    """
+    path = Path(vs_dir) / RESCORE_VECTORS_FILE
+    tmp_path = path.with_suffix(".tmp.npy")
+    vectors = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype="float32", shape=(index.ntotal, index.d)
+    )
+    for start in range(0, index.ntotal, batch_size):
+        n = min(batch_size, index.ntotal - start)
+        vectors[start : start + n] = index.reconstruct_n(start, n)
+    vectors.flush()
+    del vectors
+    os.replace(tmp_path, path)
+
+
+def load_rescore_vectors(vs_dir=None) -> np.ndarray | None:
+    """
+    Memory-map the full-precision vectors of the merged FAISS index, if present.
+    Pages are shared between the workers on a host through the page cache.
+    """
+    path = Path(vs_dir or BASE_DIR / "artifacts" / "faiss") / RESCORE_VECTORS_FILE
+    if not path.exists():
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+def split_faiss_search_params(
+    search_kwargs: dict[str, Any],
+) -> tuple[dict[str, Any], dict[str, Any]]:
+    """
+    Split retrieval kwargs into similarity_search kwargs and FAISS index parameters.
+    """
+    index_params = {k: v for k, v in search_kwargs.items() if k in FAISS_SEARCH_PARAMS}
+    search_kwargs = {
+        k: v for k, v in search_kwargs.items() if k not in FAISS_SEARCH_PARAMS
+    }
+
+    return search_kwargs, index_params
+
+
+def set_faiss_search_params(index, index_params: dict[str, Any]) -> None:
+    import faiss
+
+    parameter_space = faiss.ParameterSpace()
+    for name, value in index_params.items():
+        parameter_space.set_index_parameter(index, name, value)
+
+
 VS_REGISTRY: dict[str, dict[str, VectorStoreBuilder]] = {
     VectorStoreType.FAISS: {
         "create": _create_faiss,
+        "write": _write_faiss,
         "load": _load_faiss,
+        "chunk_ids": _faiss_chunk_ids,
     },
     VectorStoreType.OPENSEARCH: {
         "create": _create_opensearch,
+        "write": _write_opensearch,
         "load": _load_opensearch,
+        "chunk_ids": _opensearch_chunk_ids,
     },
 }
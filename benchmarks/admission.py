@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import random
+import time
+
+from app.utils.admission import AdmissionController, Overloaded
+
+
+class Upstream:
+    """
+    An LLM API with a concurrency limit: calls beyond it wait for a free slot,
+    as they would retrying after 429s.
+    """
+
+    def __init__(self, capacity: int, service_s: float):
+        self.slots = asyncio.Semaphore(capacity)
+        self.service_s = service_s
+
+    async def call(self):
+        async with self.slots:
+            await asyncio.sleep(self.service_s)
+
+
+async def _spike(args, admission: AdmissionController | None) -> tuple[list, int]:
+    upstream = Upstream(args.capacity, args.service_s)
+    latencies, rejected = [], 0
+
+    async def request():
+        nonlocal rejected
+        start = time.perf_counter()
+        try:
+            if admission is None:
+                await upstream.call()
+            else:
+                async with admission.slot():
+                    await upstream.call()
+        except Overloaded:
+            rejected += 1
+            return
+        latencies.append(time.perf_counter() - start)
+
+    rng = random.Random(0)
+    tasks = []
+    for _ in range(args.requests):
+        tasks.append(asyncio.create_task(request()))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    return sorted(latencies), rejected
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Latency of served requests under a spike, with and without "
+        "admission control"
+    )
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=400.0, help="arrivals/s")
+    parser.add_argument("--capacity", type=int, default=16, help="upstream slots")
+    parser.add_argument("--service-s", type=float, default=0.1)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--queue-timeout-s", type=float, default=1.0)
+    args = parser.parse_args()
+
+    rows = [("unbounded", *asyncio.run(_spike(args, None)))]
+    admission = AdmissionController(
+        max_in_flight=args.capacity,
+        max_queue=args.max_queue,
+        queue_timeout_s=args.queue_timeout_s,
+        service_time_s=args.service_s,
+    )
+    rows.append(("admission control", *asyncio.run(_spike(args, admission))))
+
+    print(
+        f"{args.requests} requests at {args.rate:.0f}/s, upstream capacity "
+        f"{args.capacity / args.service_s:.0f}/s"
+    )
+    print(f"{'mode':<20}{'served':>8}{'rejected':>10}{'p50 s':>8}{'p99 s':>8}")
+    for name, latencies, rejected in rows:
+        print(
+            f"{name:<20}{len(latencies):>8}{rejected:>10}"
+            f"{_percentile(latencies, 0.5):>8.2f}{_percentile(latencies, 0.99):>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import random
+import time
+
+from langchain_core.documents import Document
+from rank_bm25 import BM25Okapi
+
+from app.utils.retrievers import FilteredBM25Retriever
+from app.utils.text import regex_clean_tokens
+
+
+def _docs(n_docs: int, vocabulary: list[str]) -> list[Document]:
+    rng = random.Random(0)
+    return [
+        Document(
+            page_content=" ".join(rng.choices(vocabulary, k=80)),
+            metadata={"chunk_id": str(i)},
+        )
+        for i in range(n_docs)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="BM25 for a batch of queries: one at a time vs sparse product"
+    )
+    parser.add_argument("--docs", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-words", type=int, default=6)
+    parser.add_argument("--block-size", type=int, default=64)
+    args = parser.parse_args()
+
+    vocabulary = [f"word{i}" for i in range(20_000)]
+    docs = _docs(args.docs, vocabulary)
+    retriever = FilteredBM25Retriever(
+        vectorizer=BM25Okapi([regex_clean_tokens(doc.page_content) for doc in docs]),
+        docs=docs,
+        preprocess_func=regex_clean_tokens,
+        k=10,
+        batch_block_size=args.block_size,
+    )
+    rng = random.Random(1)
+    queries = [
+        " ".join(rng.choices(vocabulary, k=args.query_words))
+        for _ in range(args.queries)
+    ]
+
+    start = time.perf_counter()
+    retriever.term_weights()
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single = [retriever.search_chunks(query) for query in queries]
+    single_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = retriever.search_chunks_batch(queries)
+    batch_s = time.perf_counter() - start
+
+    same = sum(
+        [c.id for c in a] == [c.id for c in b] for a, b in zip(single, batch)
+    ) / len(queries)
+    print(
+        f"{args.docs} docs, {args.queries} queries of {args.query_words} words, "
+        f"term weights built in {build_s:.2f}s, same top 10: {same:.0%}"
+    )
+    print(f"{'scoring':<26}{'ms/query':>10}{'total s':>10}")
+    for name, seconds in [
+        ("one query at a time", single_s),
+        (f"sparse product, {args.block_size}/block", batch_s),
+    ]:
+        print(f"{name:<26}{seconds / len(queries) * 1e3:>10.2f}{seconds:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
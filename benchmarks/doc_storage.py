@@ -0,0 +1,108 @@
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+from app.utils.chunk_diff import content_chunk_id
+from app.utils.doc_store import (
+    read_dir_documents,
+    read_documents,
+    read_jsonl_documents,
+    write_documents,
+)
+from app.utils.paths import DOC_DIR
+
+
+def _synthetic_docs(n_docs: int) -> list[Document]:
+    rng = random.Random(0)
+    words = [f"word{i}" for i in range(5000)]
+    docs = []
+    for i in range(n_docs):
+        doc_id = f"report{i // 200}.pdf"
+        text = " ".join(rng.choices(words, k=120))
+        docs.append(
+            Document(
+                page_content=text,
+                metadata={
+                    "source": f"data/pdfs/{doc_id}",
+                    "filetype": "application/pdf",
+                    "languages": ["eng"],
+                    "filename": doc_id,
+                    "page_number": i % 40 + 1,
+                    "doc_id": doc_id,
+                    "chunk_id": content_chunk_id(doc_id, text),
+                    "chunk_index": i % 200,
+                    "source_type": "pdf",
+                    "tenant_id": "default",
+                },
+            )
+        )
+    return docs
+
+
+def _local_docs() -> list[Document]:
+    docs = []
+    for doc_dir in sorted(DOC_DIR.glob("*/")):
+        docs.extend(read_dir_documents(doc_dir))
+    return docs
+
+
+def _timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Document storage: jsonl vs zstd parquet size and load time"
+    )
+    parser.add_argument("--docs", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    docs = _local_docs() or _synthetic_docs(args.docs)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jsonl_path = Path(tmp) / "documents.jsonl"
+        parquet_path = Path(tmp) / "documents.parquet"
+        with open(jsonl_path, "w", encoding="utf-8") as f:
+            for doc in docs:
+                json.dump(
+                    {"page_content": doc.page_content, "metadata": doc.metadata}, f
+                )
+                f.write("\n")
+        write_documents(docs, parquet_path)
+
+        def load_jsonl():
+            with open(jsonl_path, "r", encoding="utf-8") as f:
+                return read_jsonl_documents(f)
+
+        rows = [
+            (
+                "jsonl",
+                jsonl_path.stat().st_size,
+                _timed(load_jsonl, args.repeat),
+            ),
+            (
+                "parquet (zstd, dictionary)",
+                parquet_path.stat().st_size,
+                _timed(lambda: read_documents(parquet_path), args.repeat),
+            ),
+        ]
+
+    print(f"{len(docs)} documents")
+    print(f"{'format':<30}{'size MB':>10}{'load s':>10}")
+    for name, size, load_s in rows:
+        print(f"{name:<30}{size / 1e6:>10.2f}{load_s:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import numpy as np
+from app.config import VectorStoreConfig
+from app.utils.vector_stores import build_faiss_index, faiss_index_factory
+from vector_data import (
+    exact_neighbours,
+    index_mb,
+    load_vectors,
+    recall_at_k,
+    split_queries,
+)
+
+
+def _truncate(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    truncated = np.ascontiguousarray(vectors[:, :dimensions])
+    return truncated / np.linalg.norm(truncated, axis=1, keepdims=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Recall vs memory of truncated dimensions and reduced precision"
+    )
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index-factory", default="Flat")
+    parser.add_argument(
+        "--dims",
+        type=int,
+        nargs="+",
+        help="truncated dimensions to benchmark, defaults to full, 1/2 and 1/4",
+    )
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.vectors, args.dim)
+    base, queries = split_queries(vectors, args.queries)
+    #  ground truth is always exact search over the full float32 vectors
+    truth = exact_neighbours(base, queries, args.k)
+
+    full_dim = base.shape[1]
+    dims = args.dims or [full_dim, full_dim // 2, full_dim // 4]
+
+    print(f"{'dims':>6}{'dtype':>9}{'index':>22}{'memory MB':>11}{'recall':>9}")
+    for dimensions in dims:
+        base_d = _truncate(base, dimensions)
+        queries_d = _truncate(queries, dimensions)
+        for vector_dtype in ("float32", "float16", "sq8"):
+            cfg = VectorStoreConfig(
+                type="faiss",
+                embedding_model="",
+                vector_dtype=vector_dtype,
+                kwargs={"index_factory": args.index_factory},
+            )
+            factory = faiss_index_factory(cfg)
+            index = build_faiss_index(base_d, factory)
+            found = index.search(queries_d, args.k)[1]
+            print(
+                f"{dimensions:>6}{vector_dtype:>9}{factory:>22}"
+                f"{index_mb(index):>11.1f}{recall_at_k(found, truth):>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import time
+from app.utils.vector_stores import build_faiss_index, set_faiss_search_params
+from vector_data import (
+    exact_neighbours,
+    index_mb,
+    load_vectors,
+    recall_at_k,
+    search_latency_ms,
+    split_queries,
+)
+
+
+def _default_configs(n: int, d: int) -> list[tuple[str, dict]]:
+    nlist = max(int(4 * n**0.5) // 64 * 64, 64)
+    m = max(d // 16, 8)
+    return [
+        ("Flat", {}),
+        ("HNSW32", {"efSearch": 64}),
+        ("HNSW32", {"efSearch": 256}),
+        (f"IVF{nlist},Flat", {"nprobe": 8}),
+        (f"IVF{nlist},Flat", {"nprobe": 32}),
+        (f"IVF{nlist},PQ{m}", {"nprobe": 32}),
+        (f"OPQ{m},IVF{nlist},PQ{m}", {"nprobe": 32}),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Recall vs latency vs memory of FAISS index types against Flat"
+    )
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--factory",
+        action="append",
+        help="index factory string to benchmark (repeatable), e.g. HNSW32",
+    )
+    args = parser.parse_args()
+
+    import faiss
+
+    faiss.omp_set_num_threads(1)
+
+    vectors = load_vectors(args.vectors, args.dim)
+    base, queries = split_queries(vectors, args.queries)
+    truth = exact_neighbours(base, queries, args.k)
+
+    if args.factory:
+        configs = [(factory, {}) for factory in args.factory]
+    else:
+        configs = _default_configs(len(base), base.shape[1])
+
+    print(
+        f"{'index':<26}{'params':<16}{'build s':>9}{'memory MB':>11}"
+        f"{'ms/query':>10}{f'recall@{args.k}':>11}"
+    )
+    built = {}
+    for factory, params in configs:
+        if factory not in built:
+            start = time.perf_counter()
+            built[factory] = (
+                build_faiss_index(base, factory),
+                time.perf_counter() - start,
+            )
+        index, build_s = built[factory]
+        set_faiss_search_params(index, params)
+
+        latency, found = search_latency_ms(
+            lambda q, k: index.search(q, k)[1], queries, args.k
+        )
+        params_str = ",".join(f"{k}={v}" for k, v in params.items()) or "-"
+        print(
+            f"{factory:<26}{params_str:<16}{build_s:>9.2f}{index_mb(index):>11.1f}"
+            f"{latency:>10.3f}{recall_at_k(found, truth):>11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
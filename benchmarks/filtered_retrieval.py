@@ -0,0 +1,79 @@
+import argparse
+import time
+import numpy as np
+from rank_bm25 import BM25Okapi
+from app.utils.filters import MetadataIndex
+from app.utils.retrievers import _faiss_search_parameters, _top_k
+from app.utils.vector_stores import build_faiss_index
+from vector_data import load_vectors
+
+
+def _ms_per_query(search, n_queries: int) -> float:
+    start = time.perf_counter()
+    for i in range(n_queries):
+        search(i)
+    return 1000 * (time.perf_counter() - start) / n_queries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Latency of filtered vs unfiltered BM25 and FAISS retrieval"
+    )
+    parser.add_argument("--docs", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index-factory", default="Flat")
+    args = parser.parse_args()
+
+    import faiss
+
+    faiss.omp_set_num_threads(1)
+
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(5_000)]
+    corpus = [list(rng.choice(vocabulary, size=60)) for _ in range(args.docs)]
+    queries = [list(rng.choice(vocabulary, size=4)) for _ in range(args.queries)]
+    bm25 = BM25Okapi(corpus)
+
+    vectors = load_vectors(args.docs, args.dim)
+    query_vectors = vectors[rng.choice(len(vectors), args.queries)]
+    index = build_faiss_index(vectors, args.index_factory)
+
+    #  1 in `n_tenants` chunks belongs to each tenant
+    selectivities = (1.0, 0.1, 0.01)
+    metadata_index = MetadataIndex.from_metadata(
+        {"tenant_id": [f"1/{int(1 / s)}" for s in selectivities if i % int(1 / s) == 0]}
+        for i in range(len(vectors))
+    )
+
+    print(f"{'selected':>9}{'bm25 ms':>10}{'faiss ms':>10}{'exact ms':>10}")
+    for selectivity in selectivities:
+        selected = metadata_index.select({"tenant_id": f"1/{int(1 / selectivity)}"})
+        if selectivity == 1.0:
+            bm25_ms = _ms_per_query(lambda i: bm25.get_scores(queries[i]), args.queries)
+            faiss_ms = _ms_per_query(
+                lambda i: index.search(query_vectors[i : i + 1], args.k), args.queries
+            )
+        else:
+            bm25_ms = _ms_per_query(
+                lambda i: bm25.get_batch_scores(queries[i], selected.tolist()),
+                args.queries,
+            )
+            selector = faiss.IDSelectorBitmap(metadata_index.bitmap(selected))
+            params = _faiss_search_parameters(index, selector)
+            faiss_ms = _ms_per_query(
+                lambda i: index.search(query_vectors[i : i + 1], args.k, params=params),
+                args.queries,
+            )
+        exact_ms = _ms_per_query(
+            lambda i: _top_k(
+                selected, vectors[selected], query_vectors[i], args.k, False
+            ),
+            args.queries,
+        )
+        print(f"{len(selected):>9}{bm25_ms:>10.2f}{faiss_ms:>10.3f}{exact_ms:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
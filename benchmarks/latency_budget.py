@@ -0,0 +1,145 @@
+import argparse
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.config import DeadlineConfig, load_config
+from app.rag_pipeline import build_graph
+from app.utils.deadline import DeadlineExceeded
+from app.utils.retrievers import RerankRetriever
+
+
+class SlowProvider:
+    """
+    Sleeps for a lognormal time around median_s, and for stall_s with
+    probability stall_p, as an API with a heavy tail.
+    """
+
+    def __init__(self, median_s: float, stall_p: float, stall_s: float, seed: int):
+        self.median_s = median_s
+        self.stall_p = stall_p
+        self.stall_s = stall_s
+        self.rng = random.Random(seed)
+
+    def sleep(self):
+        if self.rng.random() < self.stall_p:
+            time.sleep(self.stall_s)
+        else:
+            time.sleep(self.median_s * self.rng.lognormvariate(0, 0.5))
+
+
+class FakeRerank:
+    top_n = 4
+
+    def __init__(self, provider: SlowProvider):
+        self.provider = provider
+
+    def rerank(self, documents, query):
+        self.provider.sleep()
+        return [
+            {"index": i, "relevance_score": 1.0 / (i + 1)}
+            for i in range(min(self.top_n, len(documents)))
+        ]
+
+
+class FakeRetriever:
+    def invoke(self, query, **kwargs):
+        return [
+            Document(page_content=f"chunk {i} for {query}", metadata={"chunk_id": i})
+            for i in range(20)
+        ]
+
+
+def _build(args):
+    rewrite = SlowProvider(args.rewrite_s, args.stall_p, args.stall_s, seed=1)
+    rerank = SlowProvider(args.rerank_s, args.stall_p, args.stall_s, seed=2)
+    generate = SlowProvider(args.generate_s, args.stall_p, args.stall_s, seed=3)
+
+    class QueryLLM:
+        def with_structured_output(self, schema):
+            return RunnableLambda(
+                lambda question: rewrite.sleep() or {"query": question}
+            )
+
+    def answer(context):
+        generate.sleep()
+        return AIMessage(content="answer", response_metadata={"model_name": "fake"})
+
+    retriever = RerankRetriever(
+        base_retriever=FakeRetriever(), reranker=FakeRerank(rerank)
+    )
+    config = load_config()
+    config.rag.nodes.analyze_query.skip_rewrite_max_words = 0
+    #  about twice the median time of each stage
+    config.rag.deadlines = DeadlineConfig(
+        rewrite_s=2 * args.rewrite_s,
+        retrieve_s=0.05,
+        rerank_s=2 * args.rerank_s,
+        generate_s=2 * args.generate_s,
+    )
+    with patch("app.rag_pipeline._build_retriever", return_value=retriever), patch(
+        "app.rag_pipeline._build_llms",
+        return_value=(QueryLLM(), RunnableLambda(answer)),
+    ), patch(
+        "app.rag_pipeline._build_prompts",
+        return_value=(None, RunnableLambda(lambda x: x["context"])),
+    ):
+        return build_graph(config.rag)
+
+
+def _run(graph, args, budget_s: float | None):
+    def request(i):
+        inputs = {"question": f"question {i}?"}
+        start = time.monotonic()
+        if budget_s is not None:
+            inputs["deadline"] = start + budget_s
+        try:
+            result = graph.invoke(inputs)
+            outcome = ",".join(result["degradations"]) or "full"
+        except DeadlineExceeded:
+            outcome = "504"
+        return time.monotonic() - start, outcome
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(request, range(args.requests)))
+    latencies = sorted(latency for latency, _ in results)
+    return latencies, Counter(outcome for _, outcome in results)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="/ask latency with slow providers, with and without a budget"
+    )
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--budget-s", type=float, default=1.5)
+    parser.add_argument("--rewrite-s", type=float, default=0.15)
+    parser.add_argument("--rerank-s", type=float, default=0.1)
+    parser.add_argument("--generate-s", type=float, default=0.4)
+    parser.add_argument("--stall-p", type=float, default=0.03)
+    parser.add_argument("--stall-s", type=float, default=3.0)
+    args = parser.parse_args()
+
+    graph = _build(args)
+    print(
+        f"{args.requests} requests, {args.concurrency} concurrent, each provider "
+        f"call stalls {args.stall_s:.0f}s with p={args.stall_p}"
+    )
+    print(f"{'budget':<10}{'p50 s':>8}{'p99 s':>8}{'max s':>8}  outcomes")
+    for budget_s in (None, args.budget_s):
+        latencies, outcomes = _run(graph, args, budget_s)
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(0.99 * (len(latencies) - 1))]
+        name = "none" if budget_s is None else f"{budget_s}s"
+        summary = ", ".join(f"{k} {v}" for k, v in outcomes.most_common())
+        print(f"{name:<10}{p50:>8.2f}{p99:>8.2f}{latencies[-1]:>8.2f}  {summary}")
+
+
+if __name__ == "__main__":
+    main()
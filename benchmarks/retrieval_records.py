@@ -0,0 +1,242 @@
+import argparse
+import random
+import time
+import tracemalloc
+from copy import deepcopy
+
+from langchain.retrievers import ContextualCompressionRetriever, EnsembleRetriever
+from langchain_community.retrievers import BM25Retriever
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import BaseDocumentCompressor, Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from rank_bm25 import BM25Okapi
+
+from app.utils.retrievers import (
+    FAISSRetriever,
+    FilteredBM25Retriever,
+    FilteredEnsembleRetriever,
+    OpenSearchHybridRetriever,
+    RerankRetriever,
+    build_faiss_metadata_index,
+    build_metadata_index,
+    retrieve_chunks,
+    to_documents,
+)
+from app.utils.text import regex_clean_tokens
+
+
+class FakeRerank(BaseDocumentCompressor):
+    """
+    Scores by text length instead of calling Cohere. compress_documents copies
+    the Documents as CohereRerank does.
+    """
+
+    top_n: int = 5
+
+    def rerank(self, documents, query):
+        texts = [d if isinstance(d, str) else d.page_content for d in documents]
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        return [
+            {"index": i, "relevance_score": 1.0 / (rank + 1)}
+            for rank, i in enumerate(order[: self.top_n])
+        ]
+
+    def compress_documents(self, documents, query, callbacks=None):
+        compressed = []
+        for res in self.rerank(documents, query):
+            doc = documents[res["index"]]
+            doc_copy = Document(doc.page_content, metadata=deepcopy(doc.metadata))
+            doc_copy.metadata["relevance_score"] = res["relevance_score"]
+            compressed.append(doc_copy)
+        return compressed
+
+
+def _docs(n_docs: int) -> list[Document]:
+    rng = random.Random(0)
+    words = [f"word{i}" for i in range(2000)]
+    return [
+        Document(
+            page_content=" ".join(rng.choices(words, k=60)),
+            metadata={
+                "doc_id": f"report{i // 100}.pdf",
+                "chunk_id": f"report{i // 100}.pdf::{i:016x}",
+                "page_number": i % 30 + 1,
+                "filetype": "pdf",
+                "tenant_id": "default",
+                "languages": ["eng"],
+            },
+        )
+        for i in range(n_docs)
+    ]
+
+
+class StubOpenSearch:
+    """
+    Answers every _msearch with the same kNN and match hits.
+    """
+
+    def __init__(self, docs: list[Document], k: int):
+        def hits(offset):
+            return {
+                "hits": {
+                    "hits": [
+                        {
+                            "_id": str(i),
+                            "_score": 1.0,
+                            "_source": {
+                                "text": doc.page_content,
+                                "metadata": doc.metadata,
+                            },
+                        }
+                        for i, doc in enumerate(docs[offset : offset + k])
+                    ]
+                }
+            }
+
+        self.response = {"responses": [hits(0), hits(k // 2)]}
+
+    def msearch(self, body):
+        #  a fresh copy, as if parsed from the response body
+        return deepcopy(self.response)
+
+
+def _opensearch_documents(client, embeddings, ensemble, reranker):
+    """
+    Hits turned into Documents, fused and reranked as Documents.
+    """
+
+    def search(query):
+        embeddings.embed_query(query)
+        doc_lists = [
+            [
+                Document(
+                    page_content=hit["_source"]["text"],
+                    metadata=hit["_source"]["metadata"],
+                )
+                for hit in response["hits"]["hits"]
+            ]
+            for response in client.msearch(body=None)["responses"]
+        ]
+        fused = ensemble.weighted_reciprocal_rank(doc_lists)
+        return reranker.compress_documents(fused, query)
+
+    return search
+
+
+def _measure(fn, queries: list[str]) -> tuple[float, float]:
+    """
+    Microseconds per request and KB allocated at the peak of one request.
+    """
+    for query in queries[:10]:
+        fn(query)
+
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    us = (time.perf_counter() - start) / len(queries) * 1e6
+
+    tracemalloc.start()
+    peaks = []
+    for query in queries[:50]:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(query)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return us, sum(peaks) / len(peaks) / 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Retrieval hot path: Documents vs Chunks between stages"
+    )
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    docs = _docs(args.docs)
+    embeddings = DeterministicFakeEmbedding(size=64)
+    vector_store = FAISS.from_documents(docs, embeddings)
+    tokenized = [regex_clean_tokens(doc.page_content) for doc in docs]
+    reranker = FakeRerank(top_n=args.top_n)
+
+    baseline = ContextualCompressionRetriever(
+        base_compressor=reranker,
+        base_retriever=EnsembleRetriever(
+            retrievers=[
+                vector_store.as_retriever(search_kwargs={"k": args.k}),
+                BM25Retriever(
+                    vectorizer=BM25Okapi(tokenized),
+                    docs=docs,
+                    preprocess_func=regex_clean_tokens,
+                    k=args.k,
+                ),
+            ],
+            weights=[0.5, 0.5],
+        ),
+    )
+    chunked = RerankRetriever(
+        reranker=reranker,
+        base_retriever=FilteredEnsembleRetriever(
+            retrievers=[
+                FAISSRetriever(
+                    vector_store=vector_store,
+                    k=args.k,
+                    metadata_index=build_faiss_metadata_index(vector_store),
+                ),
+                FilteredBM25Retriever(
+                    vectorizer=BM25Okapi(tokenized),
+                    docs=docs,
+                    preprocess_func=regex_clean_tokens,
+                    metadata_index=build_metadata_index(docs),
+                    k=args.k,
+                ),
+            ],
+            weights=[0.5, 0.5],
+        ),
+    )
+
+    rng = random.Random(1)
+    queries = [
+        f"word{rng.randrange(2000)} word{rng.randrange(2000)}"
+        for _ in range(args.requests)
+    ]
+
+    client = StubOpenSearch(docs, args.k)
+    opensearch = RerankRetriever(
+        reranker=reranker,
+        base_retriever=OpenSearchHybridRetriever(
+            client=client, index_name="docs", embeddings=embeddings
+        ),
+    )
+
+    def chunks(retriever):
+        #  as the graph does: Documents only for the contexts returned
+        return lambda query: to_documents(retrieve_chunks(retriever, query))
+
+    rows = [
+        ("FAISS + BM25", "Documents", _measure(baseline.invoke, queries)),
+        ("FAISS + BM25", "Chunks", _measure(chunks(chunked), queries)),
+        (
+            "OpenSearch hybrid",
+            "Documents",
+            _measure(
+                _opensearch_documents(
+                    client, embeddings, baseline.base_retriever, reranker
+                ),
+                queries,
+            ),
+        ),
+        ("OpenSearch hybrid", "Chunks", _measure(chunks(opensearch), queries)),
+    ]
+
+    print(f"{args.docs} docs, k={args.k} per retriever, rerank top {args.top_n}")
+    print(f"{'retrieval':<20}{'records':<12}{'us/request':>12}{'peak KB':>10}")
+    for retrieval, records, (us, peak_kb) in rows:
+        print(f"{retrieval:<20}{records:<12}{us:>12.0f}{peak_kb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
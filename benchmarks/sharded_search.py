@@ -0,0 +1,80 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from app.utils.retrievers import merge_top_k
+from app.utils.vector_stores import build_faiss_index
+from vector_data import (
+    exact_neighbours,
+    load_vectors,
+    recall_at_k,
+    search_latency_ms,
+    split_queries,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Scatter-gather over per-source shards vs one merged index"
+    )
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--shards", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--index-factory", default="Flat")
+    args = parser.parse_args()
+
+    import faiss
+
+    #  one thread per search, parallelism comes from searching shards concurrently
+    faiss.omp_set_num_threads(1)
+
+    vectors = load_vectors(args.vectors, args.dim)
+    base, queries = split_queries(vectors, args.queries)
+    truth = exact_neighbours(base, queries, args.k)
+
+    start = time.perf_counter()
+    merged = build_faiss_index(base, args.index_factory)
+    merge_s = time.perf_counter() - start
+    latency, found = search_latency_ms(
+        lambda q, k: merged.search(q, k)[1], queries, args.k
+    )
+    print(f"{'shards':>7}{'build s':>9}{'ms/query':>10}{f'recall@{args.k}':>11}")
+    print(
+        f"{'merged':>7}{merge_s:>9.2f}{latency:>10.3f}{recall_at_k(found, truth):>11.3f}"
+    )
+
+    for n_shards in args.shards:
+        bounds = np.linspace(0, len(base), n_shards + 1, dtype=int)
+        start = time.perf_counter()
+        shards = [
+            (lo, build_faiss_index(base[lo:hi], args.index_factory))
+            for lo, hi in zip(bounds[:-1], bounds[1:])
+        ]
+        build_s = time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=min(32, n_shards)) as pool:
+
+            def search_shard(shard, query, k):
+                offset, index = shard
+                distances, ids = index.search(query, k)
+                return [
+                    (-float(d), int(i) + offset)
+                    for d, i in zip(distances[0], ids[0])
+                    if i >= 0
+                ]
+
+            def search(query, k):
+                results = pool.map(lambda shard: search_shard(shard, query, k), shards)
+                return np.array([[i for _, i in merge_top_k(results, k)]])
+
+            latency, found = search_latency_ms(search, queries, args.k)
+        print(
+            f"{n_shards:>7}{build_s:>9.2f}{latency:>10.3f}"
+            f"{recall_at_k(found, truth):>11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+from langchain_core.documents import Document
+from sqlalchemy import create_engine
+
+from app.config import load_config
+from ingestion.db_ingestors.db_rise import RISE_TABLE
+from ingestion.db_ingestors.sql_ingestor import SqlIngestor
+
+
+def _make_db(path: Path, n_rows: int) -> str:
+    rng = random.Random(0)
+    frame = pd.DataFrame(
+        {
+            "FoodCat3Name": [f"food {rng.randrange(2000)}" for _ in range(n_rows)],
+            "GHGTotalValue": [
+                f"{rng.uniform(0, 50):.2f}".replace(".", ",") for _ in range(n_rows)
+            ],
+            "RegionName": [
+                rng.choice(["Sweden", "Brazil", "Spain"]) for _ in range(n_rows)
+            ],
+            "ProductionTypeEng": [
+                rng.choice(["organic", "conventional"]) for _ in range(n_rows)
+            ],
+        }
+    )
+    url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    frame.to_sql("rise_co2", engine, index=False)
+    engine.dispose()
+    return url
+
+
+def _iterrows(url: str, config) -> int:
+    """
+    The previous ingestor: the whole table in memory, one Python iteration and
+    one datetime.now() per row.
+    """
+    df = pd.read_sql_query(RISE_TABLE.query, create_engine(url))
+    docs = []
+    for i, row in df.iterrows():
+        text = (
+            f"Foods or ingredients of type {row['FoodCat3Name']}, "
+            f"when sourced from {row['RegionName']} "
+            f"and produced with {row['ProductionTypeEng']} methods, "
+            f"produce approximately {row['GHGTotalValue'].replace(',', '.')} kg "
+            "of CO2 per kg."
+        )
+        metadata = {
+            "chunk_id": f"db:rise.db::chunk-{i}",
+            "chunk_index": i,
+            "ingested_at": datetime.now(timezone.utc).isoformat(),
+            "tenant_id": config.tenant_id,
+        }
+        docs.append(Document(page_content=text, metadata=metadata))
+    return len(docs)
+
+
+def _vectorized(url: str, config, chunksize: int) -> int:
+    """
+    SqlIngestor, with the documents consumed as they are produced, as by the
+    ingestion pipeline.
+    """
+    table = replace(RISE_TABLE, file=None, url=url, chunksize=chunksize)
+    return sum(1 for _ in SqlIngestor("rise", table, config).iter_documents())
+
+
+def _measure(fn) -> tuple[float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    n = fn()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n / seconds, peak / 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="RISE DB ingestion: iterrows vs vectorized chunked reads"
+    )
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunksize", type=int, default=10_000)
+    args = parser.parse_args()
+
+    config = load_config().ingestion
+    with tempfile.TemporaryDirectory() as tmp:
+        url = _make_db(Path(tmp) / "rise.db", args.rows)
+        rows = [
+            ("iterrows, whole table", _measure(lambda: _iterrows(url, config))),
+            (
+                f"vectorized, chunksize={args.chunksize}",
+                _measure(lambda: _vectorized(url, config, args.chunksize)),
+            ),
+        ]
+
+    print(f"{'ingestor':<34}{'rows/s':>12}{'peak MB':>10}")
+    for name, (rate, peak_mb) in rows:
+        print(f"{name:<34}{rate:>12,.0f}{peak_mb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import random
+import time
+from app.utils.doc_store import read_dir_documents
+from app.utils.paths import DOC_DIR
+from app.utils.text import (
+    batch_clean_tokens,
+    clean_tokens,
+    get_query_tokenizer,
+    regex_clean_tokens,
+)
+
+_VOCAB = (
+    "beef cheese emissions greenhouse gas methane land use water footprint "
+    "organic conventional production sweden region kg CO2-equivalents per "
+    "the of and a to in is for on with that by as from at this are"
+).split()
+
+
+def _load_texts(n_docs: int) -> list[str]:
+    """
+    Use chunk texts from artifacts/documents if present, otherwise synthetic text.
+    """
+    texts = []
+    for path in DOC_DIR.glob("*/"):
+        texts.extend(doc.page_content for doc in read_dir_documents(path))
+    if texts:
+        return (texts * (n_docs // len(texts) + 1))[:n_docs]
+
+    rng = random.Random(0)
+    return [
+        " ".join(rng.choice(_VOCAB) for _ in range(80)) + "." for _ in range(n_docs)
+    ]
+
+
+def _throughput(fn, texts: list[str]) -> float:
+    start = time.perf_counter()
+    fn(texts)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tokenizer throughput benchmark")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    texts = _load_texts(args.docs)
+    queries = [text[:60] for text in texts[:200]] * 50
+    cached = get_query_tokenizer("regex")
+
+    rows = [
+        ("nltk", _throughput(lambda ts: [clean_tokens(t) for t in ts], texts)),
+        ("regex", _throughput(lambda ts: [regex_clean_tokens(t) for t in ts], texts)),
+        (
+            "regex batch (process pool)",
+            _throughput(
+                lambda ts: batch_clean_tokens(ts, max_workers=args.workers), texts
+            ),
+        ),
+        (
+            "regex query (LRU, 200 distinct)",
+            _throughput(lambda ts: [cached(t) for t in ts], queries),
+        ),
+    ]
+
+    print(f"{'tokenizer':<34}{'texts/s':>14}{'speedup':>10}")
+    baseline = rows[0][1]
+    for name, rate in rows:
+        print(f"{name:<34}{rate:>14,.0f}{rate / baseline:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
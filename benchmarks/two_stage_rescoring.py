@@ -0,0 +1,72 @@
+import argparse
+import tempfile
+from pathlib import Path
+import numpy as np
+from app.utils.retrievers import rescore
+from app.utils.vector_stores import build_faiss_index, set_faiss_search_params
+from vector_data import (
+    exact_neighbours,
+    index_mb,
+    load_vectors,
+    recall_at_k,
+    search_latency_ms,
+    split_queries,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Recall and latency of a compressed index with exact re-scoring"
+    )
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index-factory", default="SQ4")
+    parser.add_argument("--nprobe", type=int)
+    parser.add_argument(
+        "--candidates", type=int, nargs="+", default=[10, 20, 50, 100, 200]
+    )
+    args = parser.parse_args()
+
+    import faiss
+
+    faiss.omp_set_num_threads(1)
+
+    vectors = load_vectors(args.vectors, args.dim)
+    base, queries = split_queries(vectors, args.queries)
+    truth = exact_neighbours(base, queries, args.k)
+
+    index = build_faiss_index(base, args.index_factory)
+    if args.nprobe:
+        set_faiss_search_params(index, {"nprobe": args.nprobe})
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "vectors.npy"
+        np.save(path, base)
+        exact_vectors = np.load(path, mmap_mode="r")
+        print(
+            f"[benchmark] {args.index_factory}: {index_mb(index):.1f} MB in memory, "
+            f"{path.stat().st_size / 1e6:.1f} MB memory-mapped for re-scoring"
+        )
+
+        print(f"{'candidates':>11}{'ms/query':>10}{f'recall@{args.k}':>11}")
+        latency, found = search_latency_ms(
+            lambda q, k: index.search(q, k)[1], queries, args.k
+        )
+        print(f"{'none':>11}{latency:>10.3f}{recall_at_k(found, truth):>11.3f}")
+
+        for n_candidates in args.candidates:
+
+            def search(query, k):
+                candidate_ids = index.search(query, max(n_candidates, k))[1][0]
+                return rescore(exact_vectors, candidate_ids, query[0], k)[0][None, :]
+
+            latency, found = search_latency_ms(search, queries, args.k)
+            print(
+                f"{n_candidates:>11}{latency:>10.3f}{recall_at_k(found, truth):>11.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
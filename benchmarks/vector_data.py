@@ -0,0 +1,78 @@
+"""
+Shared helpers for the dense retrieval benchmarks.
+"""
+
+import time
+import numpy as np
+from app.utils.paths import ART_DIR
+
+MERGED_INDEX_PATH = ART_DIR / "faiss" / "index.faiss"
+
+
+def load_vectors(n: int, d: int, seed: int = 0) -> np.ndarray:
+    """
+    Use the vectors of the merged FAISS index if present, otherwise synthetic
+    clustered, unit-norm vectors (like OpenAI embeddings).
+    """
+    import faiss
+
+    if MERGED_INDEX_PATH.exists():
+        index = faiss.read_index(str(MERGED_INDEX_PATH))
+        print(
+            f"[benchmark] using {min(n, index.ntotal)} vectors from {MERGED_INDEX_PATH}"
+        )
+        return index.reconstruct_n(0, min(n, index.ntotal))
+
+    print(f"[benchmark] using {n} synthetic vectors of dimension {d}")
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n // 100, 1), d)).astype("float32")
+    vectors = centers[rng.integers(len(centers), size=n)]
+    vectors += 0.3 * rng.normal(size=(n, d)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def split_queries(
+    vectors: np.ndarray, n_queries: int, seed: int = 1
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Hold out n_queries vectors as queries, perturbed so they are not exact matches.
+    """
+    rng = np.random.default_rng(seed)
+    held_out = rng.choice(len(vectors), n_queries, replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[held_out] = False
+    queries = vectors[held_out] + 0.05 * rng.normal(
+        size=(n_queries, vectors.shape[1])
+    ).astype("float32")
+    return np.ascontiguousarray(vectors[mask]), np.ascontiguousarray(queries)
+
+
+def exact_neighbours(base: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    import faiss
+
+    index = faiss.IndexFlatL2(base.shape[1])
+    index.add(base)
+    return index.search(queries, k)[1]
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def index_mb(index) -> float:
+    import faiss
+
+    return len(faiss.serialize_index(index)) / 1e6
+
+
+def search_latency_ms(search, queries: np.ndarray, k: int) -> tuple[float, np.ndarray]:
+    """
+    Run one query at a time, as the API does. Returns (mean ms per query, ids).
+    """
+    ids = []
+    start = time.perf_counter()
+    for query in queries:
+        ids.append(search(query[None, :], k))
+    elapsed = time.perf_counter() - start
+    return 1000 * elapsed / len(queries), np.vstack(ids)
@@ -1,25 +1,19 @@
-from langchain_core.documents import Document
 from app.utils.vector_stores import VS_REGISTRY
 from app.config import get_settings
+from app.utils.doc_store import read_dir_documents
 from app.utils.paths import DOC_DIR
-from langchain_openai import OpenAIEmbeddings
-import json
 
 
-docs = []
+def iter_local_docs():
+    """
+    Yield the documents saved under DOC_DIR one source at a time, so the bulk
+    indexer can embed and upload them without loading the corpus into memory.
+    """
+    for dir in DOC_DIR.iterdir():
+        yield from read_dir_documents(dir)
 
-i = 0
 
-for dir in DOC_DIR.iterdir():
-    with open(dir / "documents.jsonl", "r") as f:
-        for line in f:
-            doc_dir = json.loads(line)
-            doc = Document(**doc_dir)
-            docs.append(doc)
-            i += 1
-
-config = get_settings().rag.vector_stores["opensearch"]
-embeddings = OpenAIEmbeddings(model=config.embedding_model)
-opensearch_vs = VS_REGISTRY["opensearch"]["create"]
-opensearch_vs(docs, config)
-print(f"Loaded {i} documents into opensearch")
+if __name__ == "__main__":
+    config = get_settings().rag.vector_stores["opensearch"]
+    opensearch_vs = VS_REGISTRY["opensearch"]["create"]
+    opensearch_vs(iter_local_docs(), config)
@@ -0,0 +1,145 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from string import Formatter
+from typing import Iterator
+
+import pandas as pd
+from langchain_core.documents import Document
+from sqlalchemy import create_engine, text
+
+from app.config import IngestionConfig, SqlTableConfig
+from app.utils.chunk_diff import content_chunk_id
+from app.utils.doc_store import S3Documents
+from app.utils.paths import ART_DIR, DATA_DIR, DOC_DIR
+from app.utils.vector_stores import embedding_manifest
+from ingestion.pipeline import ingest_stream
+
+
+def render_template(template: str, frame: pd.DataFrame) -> pd.Series:
+    """
+    Render template for every row of frame, column by column rather than
+    row by row.
+    """
+    texts = pd.Series("", index=frame.index, dtype=object)
+    for literal, field_name, format_spec, conversion in Formatter().parse(template):
+        texts = texts + literal
+        if field_name is None:
+            continue
+        if format_spec or conversion:
+            raise ValueError(f"Unsupported format in SQL template: {{{field_name}}}")
+        texts = texts + frame[field_name].astype(str)
+    return texts
+
+
+class SqlIngestor:
+    """
+    Ingest the rows of a SQL query as chunks, one per row. The query result is
+    read chunksize rows at a time and streamed into embedding, so tables of any
+    size can be ingested without loading them into memory.
+    """
+
+    def __init__(self, name: str, table: SqlTableConfig, config: IngestionConfig):
+        self.name = name
+        self.table = table
+        self.config = config
+
+    @property
+    def source_name(self) -> str:
+        return self.table.file or self.name
+
+    @property
+    def doc_id(self) -> str:
+        return f"db:{self.source_name}"
+
+    def _url(self) -> str:
+        if self.table.url:
+            return self.table.url
+        return f"sqlite:///{DATA_DIR / 'sql' / self.table.file}"
+
+    def read_chunks(self) -> Iterator[pd.DataFrame]:
+        engine = create_engine(self._url())
+        try:
+            #  server-side cursor where the driver supports it
+            with engine.connect().execution_options(stream_results=True) as conn:
+                yield from pd.read_sql_query(
+                    text(self.table.query), conn, chunksize=self.table.chunksize
+                )
+        finally:
+            engine.dispose()
+
+    def to_documents(
+        self, frame: pd.DataFrame, offset: int, ingested_at: str
+    ) -> list[Document]:
+        frame = frame.astype({column: str for column in self.table.decimal_comma})
+        for column in self.table.decimal_comma:
+            frame[column] = frame[column].str.replace(",", ".", regex=False)
+        texts = render_template(self.table.template, frame).tolist()
+
+        metadata = {
+            "doc_id": self.doc_id,
+            "source": self.source_name,
+            "filetype": "sql",
+            "filename": self.source_name,
+            "language": "en",
+            "ingested_at": ingested_at,
+            "tenant_id": self.config.tenant_id,
+            "pipeline_version": self.config.pipeline_version,
+            "doc_title": Path(self.source_name).stem,
+        }
+        return [
+            Document(
+                page_content=page_content,
+                metadata={
+                    **metadata,
+                    "chunk_id": content_chunk_id(self.doc_id, page_content),
+                    "chunk_index": chunk_index,
+                    "tags": [],
+                },
+            )
+            for chunk_index, page_content in enumerate(texts, start=offset)
+        ]
+
+    def iter_documents(self) -> Iterator[Document]:
+        ingested_at = datetime.now(timezone.utc).isoformat()
+        offset = 0
+        for frame in self.read_chunks():
+            yield from self.to_documents(frame, offset, ingested_at)
+            offset += len(frame)
+
+    def ingest(self, s3_documents: S3Documents | None = None):
+        """
+        Create and store a vector store index for the query results, along with
+        the corresponding Documents and a manifest.
+        """
+
+        VS_DIR = ART_DIR / self.config.vector_store.type
+
+        resource_name = Path(self.source_name).stem
+        art_dest_dir = f"{VS_DIR}/{resource_name}"
+        doc_dest_dir = f"{DOC_DIR}/{resource_name}"
+
+        manifest = {
+            "vector_store": self.config.vector_store.type,
+            **embedding_manifest(self.config.vector_store),
+            "tenant_id": self.config.tenant_id,
+            "loader_name": self.config.sql.loader.type,
+            "source_file": self.source_name,
+            "query": self.table.query,
+            "last_indexed": datetime.now(timezone.utc).isoformat(),
+        }
+
+        num_docs = ingest_stream(
+            self.iter_documents(),
+            None,
+            manifest,
+            self.config,
+            doc_dest_dir=doc_dest_dir,
+            art_dest_dir=art_dest_dir,
+            doc_id=self.doc_id,
+            s3_documents=s3_documents,
+        )
+
+        print(
+            f"[{self.source_name}_ingestor] Saved {self.config.vector_store.type} "
+            f"vector store to {VS_DIR}, number of docs: {num_docs}"
+        )
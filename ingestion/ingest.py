@@ -1,18 +1,29 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
 from pathlib import Path
 from dotenv import load_dotenv
 import json
 import os
 from app.config import IngestionConfig
-from app.utils.opensearch import get_opensearch_langchain_kwargs
-from opensearchpy import OpenSearch
-import boto3
-from app.utils.vector_stores import VS_REGISTRY, VectorStoreType
+from app.utils.vector_stores import (
+    VS_REGISTRY,
+    RESCORE_VECTORS_FILE,
+    VectorStoreType,
+    embedding_manifest,
+    faiss_index_factory,
+    rebuild_faiss_index,
+    save_rescore_vectors,
+)
 from datetime import datetime, timezone
+from app.utils.dedup import NearDuplicateIndex
+from app.utils.doc_store import S3Documents
+from app.utils.parse_cache import file_sha256
+from app.utils.timing import format_timings, timed
 from app.utils.urls import url_to_resource_name
 from ingestion.pdf_ingestor import ingest_pdf
+from ingestion.web_cache import WebFetchCache
 from ingestion.web_ingestor import ingest_web
-from app.utils.db_ingestors import get_db_ingestor
-from app.utils.paths import ART_DIR, DATA_DIR
+from app.utils.paths import ART_DIR, DATA_DIR, TENANT_DIR
 
 # local fallback
 load_dotenv()
@@ -23,38 +34,69 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 #  TODO:  update remote repo too
 
 
-def _check_for_vs(file_name, config: IngestionConfig):
+@dataclass
+class IngestTask:
+    kind: str  #  "pdf", "web" or "sql"
+    name: str  #  resource name, as recorded by the existing indexes
+    source: Path | str  #  file path, url or database name
+    #  doc_id of its chunks
+    doc_id: str | None = None
+    #  indexed, but changed since
+    changed: bool = False
+    #  page fetched while checking it for changes
+    content: bytes | None = None
+
+
+@dataclass
+class IngestPlan:
+    pending: list[IngestTask] = field(default_factory=list)
+    indexed: list[IngestTask] = field(default_factory=list)
+    timings: dict[str, float] = field(default_factory=dict)
+    web_cache: WebFetchCache | None = None
+    #  the OpenSearch index is missing: its S3 manifests are stale, and are
+    #  deleted when the plan runs
+    stale_manifests: bool = False
+
+
+def _existing_sources(config: IngestionConfig, plan: IngestPlan) -> dict[str, dict]:
+    """
+    Manifests of the sources already indexed, by name, looked up once per run:
+    from the per-source FAISS directories, or the S3 manifests of the
+    OpenSearch index. Nothing is changed, a missing OpenSearch index is only
+    recorded in plan.stale_manifests.
+    """
 
     if config.vector_store.type == VectorStoreType.FAISS:
 
         VS_DIR = ART_DIR / config.vector_store.type
 
+        manifests = {}
         for vs_path in Path(VS_DIR).glob("*"):
-            if vs_path.stem == file_name:
-                index_faiss_path = vs_path / "index.faiss"
-                index_pkl_path = vs_path / "index.pkl"
-                manifest_path = vs_path / "manifest.json"
-                return all(
-                    p.exists()
-                    for p in [index_faiss_path, index_pkl_path, manifest_path]
-                )
+            if all(
+                (vs_path / name).exists()
+                for name in ["index.faiss", "index.pkl", "manifest.json"]
+            ):
+                with open(vs_path / "manifest.json", "r") as f:
+                    manifests[vs_path.stem] = json.load(f)
+        return manifests
 
     elif config.vector_store.type == VectorStoreType.OPENSEARCH:
+        import boto3
+        from app.utils.opensearch import build_opensearch_client
 
         endpoint = os.environ["OPENSEARCH_COLLECTION_ENDPOINT"]
-        client = OpenSearch(endpoint, **get_opensearch_langchain_kwargs())
+        client = build_opensearch_client(
+            endpoint, config.vector_store.kwargs.get("connection")
+        )
         index_exists = client.indices.exists(
             index=config.vector_store.kwargs.get("index_name")
         )
 
-        s3 = boto3.client("s3")
-
         if not index_exists:
-            s3.delete_object(
-                Bucket=os.environ["AWS_S3_DOCS_BUCKET"],
-                Key="manifests/manifests.json",
-            )
-            return False
+            plan.stale_manifests = True
+            return {}
+
+        s3 = boto3.client("s3")
 
         try:
             resp = s3.get_object(
@@ -62,23 +104,238 @@ def _check_for_vs(file_name, config: IngestionConfig):
                 Key="manifests/manifests.json",
             )
         except s3.exceptions.NoSuchKey:
-            return False
+            return {}
 
         data = resp["Body"].read().decode("utf-8")
-        manifests = json.loads(data)
-        if file_name in manifests:
-            print(f"[update_vectorstores] {file_name} already indexed.")
-            return True
+        return json.loads(data)
+
+    return {}
+
+
+def _list_sources(config: IngestionConfig) -> list[IngestTask]:
+    """
+    PDFs and web pages under DATA_DIR, and the databases configured under
+    sources.sql.databases, read from a file under DATA_DIR/sql or from a url.
+    """
+    tasks = []
+    data_subdirs = [path for path in Path(DATA_DIR).iterdir() if path.is_dir()]
+
+    for dir in data_subdirs:
+        if dir.stem == "pdf":
+            for file_path in dir.iterdir():
+                tasks.append(
+                    IngestTask("pdf", file_path.stem, file_path, file_path.name)
+                )
+        if dir.stem == "web":
+            from url_normalize import url_normalize
+
+            # get each url and transform to resource name
+            with open(dir / "urls.json", "r") as f:
+                urls = json.load(f)["urls"]
+            for url in urls:
+                tasks.append(
+                    IngestTask(
+                        "web", url_to_resource_name(url), url, url_normalize(url)
+                    )
+                )
+
+    databases = config.sql.databases if config.sql else {}
+    for name, table in databases.items():
+        if table.file and not (Path(DATA_DIR) / "sql" / table.file).exists():
+            print(f"[ingest] skipping database {name}: no file {table.file}")
+            continue
+        #  named like the indexes of SqlIngestor, by file stem
+        source_name = table.file or name
+        tasks.append(
+            IngestTask("sql", Path(source_name).stem, name, f"db:{source_name}")
+        )
+
+    return tasks
+
+
+def plan_ingestion(config: IngestionConfig) -> IngestPlan:
+    """
+    Split the sources under DATA_DIR and the configured databases into those
+    still to ingest and those already indexed. Indexed PDFs and web pages that changed since are
+    ingested again.
+    """
+    plan = IngestPlan()
+    with timed(plan.timings, "list_sources"):
+        tasks = _list_sources(config)
+    with timed(plan.timings, "existing_sources"):
+        existing = _existing_sources(config, plan)
+
+    for task in tasks:
+        if task.name in existing:
+            plan.indexed.append(task)
+        else:
+            plan.pending.append(task)
+
+    if config.pdf and config.pdf.check_changes:
+        with timed(plan.timings, "pdf_changes"):
+            _check_pdf_changes(plan, existing, config)
+    if config.web and config.web.check_changes:
+        plan.web_cache = WebFetchCache()
+        with timed(plan.timings, "web_changes"):
+            _check_web_changes(plan)
+    return plan
+
+
+def _mark_changed(plan: IngestPlan, task: IngestTask):
+    task.changed = True
+    plan.indexed.remove(task)
+    plan.pending.append(task)
+
+
+def _check_pdf_changes(
+    plan: IngestPlan, manifests: dict[str, dict], config: IngestionConfig
+):
+    """
+    Move indexed PDFs whose content hash or loader params differ from the ones
+    recorded in their manifest to the pending tasks. PDFs indexed before hashes
+    were recorded are left as they are.
+    """
+    for task in [task for task in plan.indexed if task.kind == "pdf"]:
+        manifest = manifests[task.name]
+        if not manifest.get("source_sha256"):
+            continue
+        loader_params = manifest.get("loader_params", config.pdf.loader.params)
+        if loader_params != config.pdf.loader.params or manifest[
+            "source_sha256"
+        ] != file_sha256(task.source):
+            _mark_changed(plan, task)
 
-    return False
+
+def _check_web_changes(plan: IngestPlan):
+    """
+    Move indexed web pages that changed since they were last fetched to the
+    pending tasks, with the fetched page.
+    """
+    for task in [task for task in plan.indexed if task.kind == "web"]:
+        result = plan.web_cache.fetch(task.source)
+        #  "new": indexed before pages were cached, the current version is
+        #  recorded with the unchanged pages once the plan runs
+        if result.changed and result.status != "new":
+            task.content = result.content
+            _mark_changed(plan, task)
+
+
+def _delete_stale_manifests():
+    import boto3
+
+    boto3.client("s3").delete_object(
+        Bucket=os.environ["AWS_S3_DOCS_BUCKET"],
+        Key="manifests/manifests.json",
+    )
+
+
+def _print_plan(plan: IngestPlan):
+    print(
+        f"[ingest] {len(plan.pending)} sources to ingest, "
+        f"{len(plan.indexed)} already indexed ({format_timings(plan.timings)})"
+    )
+    for task in plan.pending:
+        changed = " (changed)" if task.changed else ""
+        print(f"[ingest]   {task.kind}: {task.name}{changed}")
+
+
+def _run_task(
+    task: IngestTask,
+    config: IngestionConfig,
+    web_cache: WebFetchCache | None,
+    dedup: NearDuplicateIndex | None,
+    s3_documents: S3Documents | None,
+):
+    if task.kind == "pdf":
+        ingest_pdf(
+            file_path=task.source,
+            config=config,
+            dedup=dedup,
+            s3_documents=s3_documents,
+        )
+    elif task.kind == "web":
+        ingest_web(
+            url=task.source,
+            config=config,
+            content=task.content,
+            cache=web_cache,
+            dedup=dedup,
+            s3_documents=s3_documents,
+        )
+    elif task.kind == "sql":
+        #  imported here, the database ingestors need pandas
+        from app.utils.db_ingestors import get_db_ingestor
+
+        db_ingestor = get_db_ingestor(task.source, config)
+        db_ingestor.ingest(s3_documents=s3_documents)
+
+
+def _ingest_orphaned(
+    plan: IngestPlan,
+    config: IngestionConfig,
+    dedup: NearDuplicateIndex,
+    s3_documents: S3Documents | None,
+    timings: dict[str, float],
+):
+    """
+    Ingest again the indexed sources that lost chunks as near duplicates of
+    chunks of the sources just ingested, as the text they shared may be gone.
+    Each is ingested at most once per run.
+    """
+    done = set()
+    while orphaned := [
+        task
+        for task in plan.indexed
+        if task.doc_id in dedup.orphaned and task.doc_id not in done
+    ]:
+        for task in orphaned:
+            done.add(task.doc_id)
+            dedup.orphaned.discard(task.doc_id)
+            print(f"[ingest] re-ingesting {task.kind}: {task.name}, near duplicates")
+            with timed(timings, f"{task.kind}:{task.name}"):
+                _run_task(task, config, plan.web_cache, dedup, s3_documents)
+
+
+def _merge_and_save(vector_stores: list, save_dir: Path, config: IngestionConfig):
+    """
+    Merge per-source FAISS indexes into one index at save_dir.
+    Returns the index factory the merged index was built with.
+    """
+    main_vs = vector_stores[0]
+    for vs in vector_stores[1:]:
+        main_vs.merge_from(vs)
+
+    #  per-source indexes are flat, the merged index is rebuilt with the
+    #  configured index type, trained on a sample of the merged vectors
+    index_factory = faiss_index_factory(config.vector_store)
+    rescore_path = Path(save_dir) / RESCORE_VECTORS_FILE
+    Path(save_dir).mkdir(parents=True, exist_ok=True)
+    if index_factory != "Flat":
+        #  keep the exact vectors on disk for two-stage retrieval
+        save_rescore_vectors(main_vs.index, save_dir)
+        rebuild_faiss_index(
+            main_vs,
+            index_factory,
+            config.vector_store.kwargs.get("train_sample_size", 100_000),
+        )
+    elif rescore_path.exists():
+        rescore_path.unlink()
+    main_vs.save_local(save_dir)
+
+    return index_factory
 
 
 def _merge_vector_stores(config: IngestionConfig):
+    """
+    Merge the per-source indexes into the index served by the API: a single
+    index under artifacts/faiss, or with shard_by_tenant, one index per tenant
+    under artifacts/tenants/<tenant_id>.
+    """
 
     VS_DIR = ART_DIR / config.vector_store.type
 
-    vector_stores = []
-    file_names = []
+    vector_stores = defaultdict(list)
+    file_names = defaultdict(list)
 
     for vs_path in Path(VS_DIR).glob("*/"):
         with open(vs_path / "manifest.json", "r") as f:
@@ -89,7 +346,13 @@ def _merge_vector_stores(config: IngestionConfig):
         embedding_model = manifest.get(
             "embedding_model", config.vector_store.embedding_model
         )
-        file_names.append(source)
+        embedding_settings = {
+            key: manifest.get(key, default)
+            for key, default in embedding_manifest(config.vector_store).items()
+        }
+        tenant_id = manifest.get("tenant_id", "default")
+        shard = tenant_id if config.shard_by_tenant else None
+        file_names[shard].append(source)
 
         vs_builder = VS_REGISTRY[config.vector_store.type]["load"]
         vector_store = vs_builder(
@@ -97,59 +360,88 @@ def _merge_vector_stores(config: IngestionConfig):
             path=vs_path,
             embedding_model=embedding_model,
         )
-        vector_stores.append(vector_store)
+        vector_stores[shard].append(vector_store)
 
-    main_vs = vector_stores[0]
-    for vs in vector_stores[1:]:
-        main_vs.merge_from(vs)
-    main_vs.save_local(VS_DIR)
+    for shard, shard_vector_stores in vector_stores.items():
+        save_dir = VS_DIR if shard is None else TENANT_DIR / shard
+        index_factory = _merge_and_save(shard_vector_stores, save_dir, config)
 
-    manifest = {
-        "embedding_model": embedding_model,
-        "vector_store": vector_store_name,
-        "loader_name": config.pdf.loader.type,
-        "loader_params": config.pdf.loader.params,
-        "source_files": file_names,
-        "last_indexed": datetime.now(timezone.utc).isoformat(),
-    }
-    with open(Path(VS_DIR) / "manifest.json", "w") as f:
-        json.dump(manifest, f, indent=2)
+        manifest = {
+            **embedding_settings,
+            "vector_store": vector_store_name,
+            "index_factory": index_factory,
+            "vector_dtype": config.vector_store.vector_dtype,
+            "loader_name": config.pdf.loader.type,
+            "loader_params": config.pdf.loader.params,
+            "source_files": file_names[shard],
+            "last_indexed": datetime.now(timezone.utc).isoformat(),
+        }
+        if shard is not None:
+            manifest["tenant_id"] = shard
+            print(
+                f"[ingest] merged {len(shard_vector_stores)} indexes for tenant {shard}"
+            )
+        with open(Path(save_dir) / "manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
 
 
-def ingest(config: IngestionConfig):
+def ingest(config: IngestionConfig, dry_run: bool = False) -> IngestPlan:
+    """
+    Ingest the sources under DATA_DIR that are not indexed yet, then merge the
+    FAISS indexes. With dry_run, only print the plan.
+    """
 
-    added_vs = False
-    data_subdirs = [path for path in Path(DATA_DIR).iterdir() if path.is_dir()]
+    plan = plan_ingestion(config)
+    _print_plan(plan)
+    if dry_run:
+        return plan
 
-    for dir in data_subdirs:
-        if dir.stem == "pdf":
-            for file_path in dir.iterdir():
-                pdf_name = file_path.stem
-                has_vs = _check_for_vs(pdf_name, config=config)
-                if not has_vs:
-                    ingest_pdf(file_path=file_path, config=config)
-                    added_vs = True
-        if dir.stem == "web":
-            # get each url and transform to resource name
-            with open(dir / "urls.json", "r") as f:
-                urls = json.load(f)["urls"]
-            resource_names = [url_to_resource_name(url) for url in urls]
-            for url, resource_name in zip(urls, resource_names):
-                has_vs = _check_for_vs(resource_name, config=config)
-                if not has_vs:
-                    ingest_web(url=url, config=config)
-                    added_vs = True
-        if dir.stem == "sql":
-            for file_path in dir.iterdir():
-                db_name = file_path.stem
-                has_vs = _check_for_vs(db_name, config=config)
-                if not has_vs:
-                    db_ingestor = get_db_ingestor(db_name, config)
-                    db_ingestor.ingest()
-                    added_vs = True
-
-    if added_vs and config.vector_store.type == VectorStoreType.FAISS:
-        _merge_vector_stores(config)
+    if plan.stale_manifests:
+        _delete_stale_manifests()
+    if plan.web_cache is not None:
+        #  indexed pages already match the fetched version
+        plan.web_cache.commit(
+            *[task.source for task in plan.indexed if task.kind == "web"]
+        )
+    timings = {}
+    dedup = None
+    if config.dedup.enabled and plan.pending:
+        with timed(timings, "load_dedup"):
+            dedup = NearDuplicateIndex(config.dedup)
+    s3_documents = None
+    if config.vector_store.type == VectorStoreType.OPENSEARCH and plan.pending:
+        import boto3
+
+        #  the documents file on S3 is read and written once for all sources
+        s3_documents = S3Documents(boto3.client("s3"), os.getenv("AWS_S3_DOCS_BUCKET"))
+    try:
+        for task in plan.pending:
+            with timed(timings, f"{task.kind}:{task.name}"):
+                _run_task(task, config, plan.web_cache, dedup, s3_documents)
+        if dedup is not None:
+            _ingest_orphaned(plan, config, dedup, s3_documents, timings)
+    finally:
+        if s3_documents is not None:
+            #  the sources ingested so far, also when a later one failed
+            with timed(timings, "save_documents"):
+                s3_documents.save()
+    added_vs = bool(plan.pending)
+    if dedup is not None:
+        print(f"[ingest] near-duplicate chunks suppressed: {dedup.duplicates}")
+
+    if (
+        added_vs
+        and config.vector_store.type == VectorStoreType.FAISS
+        and config.merge_indexes
+    ):
+        with timed(timings, "merge"):
+            _merge_vector_stores(config)
         print("Merged existing vector stores.")
+    elif added_vs and config.vector_store.type == VectorStoreType.FAISS:
+        print("Added new vector stores, merging is disabled.")
     else:
         print("No new documents to add.")
+
+    if timings:
+        print(f"[ingest] timings: {format_timings(timings)}")
+    return plan
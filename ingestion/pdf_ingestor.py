@@ -1,12 +1,16 @@
 from app.config import IngestionConfig
-from app.utils.docs import process_pdf_docs, save_docs
-from app.utils.vector_stores import VS_REGISTRY
+from app.utils.dedup import NearDuplicateIndex
+from app.utils.doc_store import S3Documents
+from app.utils.docs import process_pdf_docs
+from app.utils.vector_stores import embedding_manifest
+from ingestion.pipeline import ingest_stream
 from app.utils.loaders import LOADER_REGISTRY
+from app.utils.parse_cache import file_sha256
 import os
 from pathlib import Path
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-from app.utils.paths import ART_DIR, DOC_DIR
+from app.utils.paths import ART_DIR, DOC_DIR, PARSE_CACHE_DIR
 
 
 load_dotenv()
@@ -14,44 +18,52 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 
-def ingest_pdf(file_path: Path, config: IngestionConfig):
+def ingest_pdf(
+    file_path: Path,
+    config: IngestionConfig,
+    dedup: NearDuplicateIndex | None = None,
+    s3_documents: S3Documents | None = None,
+):
     """
     Create and store a vector store index for the PDF file_path, along with
-    the corresponding Documents and a manifest.
+    the corresponding Documents and a manifest. When a changed file is
+    re-ingested, only the chunks that changed are embedded and indexed.
     """
 
     VS_DIR = ART_DIR / config.vector_store.type
 
+    sha256 = file_sha256(file_path)
     loader_builder = LOADER_REGISTRY[config.pdf.loader.type]["pdf"]
-    loader = loader_builder(file_path, **config.pdf.loader.params)
+    cache_kwargs = {}
+    if config.pdf.parse_cache:
+        cache_kwargs = {"cache_dir": PARSE_CACHE_DIR, "sha256": sha256}
+    loader = loader_builder(file_path, **cache_kwargs, **config.pdf.loader.params)
 
-    docs = []
-    for doc in loader.lazy_load():
-        docs.append(doc)
-
-    processed_docs = process_pdf_docs(docs, config)
     art_dest_dir = f"{VS_DIR}/{file_path.stem}"
     doc_dest_dir = f"{DOC_DIR}/{file_path.stem}"
 
     manifest = {
         "vector_store": config.vector_store.type,
-        "embedding_model": config.vector_store.embedding_model,
+        **embedding_manifest(config.vector_store),
+        "tenant_id": config.tenant_id,
         "loader_name": config.pdf.loader.type,
         "loader_params": config.pdf.loader.params,
         "source_file": file_path.name,
+        "source_sha256": sha256,
         "last_indexed": datetime.now(timezone.utc).isoformat(),
     }
 
-    save_docs(
-        processed_docs,
+    num_docs = ingest_stream(
+        loader.lazy_load(),
+        process_pdf_docs,
         manifest,
-        config.vector_store,
-        doc_save_dir=doc_dest_dir,
-        manifest_save_dir=art_dest_dir,
+        config,
+        doc_dest_dir=doc_dest_dir,
+        art_dest_dir=art_dest_dir,
+        doc_id=file_path.name,
+        dedup=dedup,
+        s3_documents=s3_documents,
     )
 
-    vs_builder = VS_REGISTRY[config.vector_store.type]["create"]
-    vs_builder(processed_docs, config.vector_store, save_dir=art_dest_dir)
-
     print(f"[pdf_ingestor] Saved {config.vector_store.type} vector store to {VS_DIR}")
-    print(f"[pdf_ingestor] number of pdf docs: {len(processed_docs)}")
+    print(f"[pdf_ingestor] number of pdf docs: {num_docs}")
@@ -0,0 +1,262 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from itertools import count
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+from langchain_core.documents import Document
+
+from app.config import IngestionConfig
+from app.utils.bulk_indexer import batched
+from app.utils.chunk_diff import ChunkDiff
+from app.utils.dedup import NearDuplicateIndex
+from app.utils.doc_store import DOCS_FILE, S3Documents
+from app.utils.docs import save_docs, save_manifest, write_docs
+from app.utils.vector_stores import VS_REGISTRY, VectorStoreType, build_embeddings
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+@dataclass
+class StageStats:
+    items: int = 0
+    #  time spent in the stage itself, excluding waits on its neighbours
+    busy_seconds: float = 0.0
+    #  time blocked on an empty input queue or a full output queue
+    wait_seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+
+class Pipeline:
+    """
+    Runs a source and a chain of stages concurrently, one thread per stage,
+    connected by queues of at most queue_size items. A stage is a function
+    from an iterator of items to an iterator of items. A full queue blocks the
+    stage feeding it, so memory depends on queue_size rather than on the size
+    of the source. The sink runs in the calling thread, and the first error
+    in any stage stops the pipeline and is raised by run().
+    """
+
+    def __init__(self, queue_size: int = 512):
+        self.queue_size = queue_size
+        self.stats: dict[str, StageStats] = {}
+        self._stop = threading.Event()
+
+    def _get(self, q: queue.Queue, stats: StageStats) -> Iterator:
+        while True:
+            start = time.perf_counter()
+            while True:
+                try:
+                    item = q.get(timeout=0.1)
+                    break
+                except queue.Empty:
+                    if self._stop.is_set():
+                        return
+            stats.wait_seconds += time.perf_counter() - start
+            if item is _DONE:
+                return
+            if isinstance(item, _Failed):
+                raise item.error
+            yield item
+
+    def _put(self, q: queue.Queue, item, stats: StageStats) -> bool:
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                stats.wait_seconds += time.perf_counter() - start
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(
+        self,
+        name: str,
+        stage: Callable,
+        input_queue: queue.Queue | None,
+        output_queue: queue.Queue,
+    ):
+        stats = self.stats[name]
+        inputs = None if input_queue is None else self._get(input_queue, stats)
+        start = time.perf_counter()
+        try:
+            for item in stage(inputs):
+                stats.items += 1
+                if not self._put(output_queue, item, stats):
+                    return
+        except BaseException as e:
+            self._put(output_queue, _Failed(e), stats)
+        else:
+            self._put(output_queue, _DONE, stats)
+        finally:
+            stats.busy_seconds = time.perf_counter() - start - stats.wait_seconds
+
+    def run(
+        self,
+        source: tuple[str, Iterable],
+        stages: list[tuple[str, Callable[[Iterator], Iterator]]],
+        sink: tuple[str, Callable[[Iterator], Any]],
+    ) -> Any:
+        """
+        Feed the source through the stages into the sink, returning the
+        sink's result. Each of source, stages and sink is named in stats.
+        """
+        source_name, items = source
+        stages = [(source_name, lambda _: iter(items)), *stages]
+
+        threads = []
+        input_queue = None
+        for name, stage in stages:
+            self.stats[name] = StageStats()
+            output_queue = queue.Queue(maxsize=self.queue_size)
+            threads.append(
+                threading.Thread(
+                    target=self._worker,
+                    args=(name, stage, input_queue, output_queue),
+                    name=f"pipeline-{name}",
+                    daemon=True,
+                )
+            )
+            input_queue = output_queue
+
+        sink_name, consume = sink
+        stats = self.stats[sink_name] = StageStats()
+
+        def inputs():
+            for item in self._get(input_queue, stats):
+                stats.items += 1
+                yield item
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            return consume(inputs())
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            stats.busy_seconds = time.perf_counter() - start - stats.wait_seconds
+
+    def report(self) -> str:
+        return ", ".join(
+            f"{name}={stats.items} in {stats.busy_seconds:.2f}s ({stats.rate:.0f}/s)"
+            for name, stats in self.stats.items()
+        )
+
+
+def ingest_stream(
+    raw_docs: Iterable[Document],
+    process: Callable[..., list[Document]] | None,
+    manifest: dict[str, Any],
+    config: IngestionConfig,
+    doc_dest_dir: str,
+    art_dest_dir: str,
+    doc_id: str,
+    dedup: NearDuplicateIndex | None = None,
+    s3_documents: S3Documents | None = None,
+) -> int:
+    """
+    Ingest one source as a stream: raw chunks from the loader are processed
+    in batches with process (process_pdf_docs or process_web_docs, or None if
+    they are ready as they are), written to the documents file, embedded in
+    batches and written to the vector store. Returns the number of chunks
+    ingested.
+
+    Chunks are compared by chunk_id with the chunks already indexed for the
+    source doc_id: only added chunks are embedded and indexed, and removed
+    ones are deleted from the index, so re-ingesting a source costs time in
+    proportion to what changed.
+
+    With dedup, chunks that are near duplicates of chunks of other sources, or
+    of earlier chunks of this one, are dropped after processing.
+
+    For OpenSearch, s3_documents holds the documents file of the run, read
+    once for all sources and uploaded once, when the run saves it.
+
+    The manifest is saved last, so a source only counts as indexed once its
+    index is complete. It is saved even when no chunks are left, as the
+    removed ones were deleted from the index.
+    """
+    vs_config = config.vector_store
+    streaming = config.streaming
+    chunk_indexes = count()
+    saved_docs = []
+    chunk_ids = VS_REGISTRY[vs_config.type]["chunk_ids"]
+    diff = ChunkDiff(
+        chunk_ids(
+            vs_config, save_dir=art_dest_dir, doc_id=doc_id, s3_documents=s3_documents
+        )
+    )
+
+    def process_stage(docs):
+        for batch in batched(docs, streaming.process_batch_size):
+            yield from process(batch, config, chunk_indexes)
+
+    def save_stage(docs):
+        if vs_config.type == VectorStoreType.FAISS:
+            yield from write_docs(docs, f"{doc_dest_dir}/{DOCS_FILE}")
+        else:
+            #  the S3 documents file is rewritten as a whole by save_docs
+            for doc in docs:
+                saved_docs.append(doc)
+                yield doc
+
+    def embed_stage(docs):
+        embeddings = build_embeddings(
+            vs_config.embedding_model, vs_config.dimensions, vs_config.dimension_mode
+        )
+        added = (doc for doc in docs if diff.is_added(doc))
+        for batch in batched(added, streaming.embed_batch_size):
+            vectors = embeddings.embed_documents([doc.page_content for doc in batch])
+            yield from zip(batch, vectors)
+
+    def index_sink(embedded):
+        vs_writer = VS_REGISTRY[vs_config.type]["write"]
+        return vs_writer(embedded, vs_config, diff=diff, save_dir=art_dest_dir)
+
+    stages = [("diff", diff.split), ("save", save_stage), ("embed", embed_stage)]
+    if dedup is not None:
+        dedup.remove_source(doc_id)
+        duplicates = dedup.duplicates
+        stages.insert(0, ("dedup", dedup.filter))
+    if process is not None:
+        stages.insert(0, ("process", process_stage))
+
+    pipeline = Pipeline(streaming.queue_size)
+    pipeline.run(("load", raw_docs), stages, ("index", index_sink))
+    print(f"[pipeline] {pipeline.report()}")
+    print(f"[pipeline] chunks: {diff.summary()}")
+    if dedup is not None:
+        print(f"[pipeline] near duplicates: {dedup.duplicates - duplicates}")
+
+    num_docs = pipeline.stats["save"].items
+    if not num_docs and not diff.previous:
+        print("[pipeline] no chunks to index")
+        return 0
+
+    if vs_config.type == VectorStoreType.FAISS:
+        save_manifest(manifest, art_dest_dir)
+    else:
+        save_docs(
+            saved_docs,
+            manifest,
+            vs_config,
+            doc_id=doc_id,
+            name=Path(art_dest_dir).name,
+            s3_documents=s3_documents,
+        )
+    if dedup is not None:
+        dedup.save()
+    return num_docs
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.utils.paths import WEB_CACHE_PATH
+
+
+@dataclass
+class FetchResult:
+    #  "new" (not fetched before), "changed" or "unchanged"
+    status: str
+    content: bytes | None = None
+    sha256: str | None = None
+
+    @property
+    def changed(self) -> bool:
+        return self.status != "unchanged"
+
+
+class WebFetchCache:
+    """
+    ETag, Last-Modified and content hash of every fetched URL, so pages are
+    fetched with conditional requests and only re-parsed when they changed.
+
+    Fetched validators are held back until commit(url), called once the page
+    has been ingested (or found indexed and unchanged, in a run that is not a
+    dry run), so a failed ingestion is retried next run and a dry run writes
+    nothing.
+    """
+
+    def __init__(self, path: Path | str = WEB_CACHE_PATH, timeout: float = 30.0):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.entries: dict[str, dict] = {}
+        if self.path.exists():
+            self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+        self._pending: dict[str, dict] = {}
+
+    def fetch(self, url: str, conditional: bool = True) -> FetchResult:
+        import requests
+
+        entry = self.entries.get(url)
+        headers = {}
+        if conditional and entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = requests.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return FetchResult("unchanged")
+        response.raise_for_status()
+
+        sha256 = hashlib.sha256(response.content).hexdigest()
+        new_entry = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256": sha256,
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+        }
+        if entry is None:
+            status = "new"
+        elif conditional and entry.get("sha256") == sha256:
+            status = "unchanged"
+        else:
+            status = "changed"
+
+        self._pending[url] = new_entry
+        return FetchResult(status, response.content, sha256)
+
+    def commit(self, *urls: str):
+        urls = [url for url in urls if url in self._pending]
+        if not urls:
+            return
+        for url in urls:
+            self.entries[url] = self._pending.pop(url)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.entries, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.path)
@@ -1,7 +1,11 @@
 from app.config import IngestionConfig
-from app.utils.docs import process_web_docs, save_docs
+from app.utils.dedup import NearDuplicateIndex
+from app.utils.doc_store import S3Documents
+from app.utils.docs import process_web_docs
 from app.utils.urls import url_to_resource_name
-from app.utils.vector_stores import VS_REGISTRY
+from app.utils.vector_stores import embedding_manifest
+from ingestion.pipeline import ingest_stream
+from ingestion.web_cache import WebFetchCache
 from app.utils.loaders import LOADER_REGISTRY
 import os
 from datetime import datetime, timezone
@@ -13,22 +17,40 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 
-def ingest_web(url, config: IngestionConfig):
+def _with_url(docs, url: str):
+    #  pages are parsed from the fetched bytes, which carry no url
+    for doc in docs:
+        doc.metadata["url"] = url
+        yield doc
+
+
+def ingest_web(
+    url,
+    config: IngestionConfig,
+    content: bytes | None = None,
+    cache: WebFetchCache | None = None,
+    dedup: NearDuplicateIndex | None = None,
+    s3_documents: S3Documents | None = None,
+):
     """
     Create and store a vector store index for the web page at url, along with
     the corresponding Documents and a manifest.
+
+    Pass content if the page was already fetched, e.g. when checking it for
+    changes. When a page is re-ingested, only the chunks that changed are
+    embedded and indexed.
     """
 
     VS_DIR = ART_DIR / config.vector_store.type
 
-    loader_builder = LOADER_REGISTRY[config.web.loader.type]["web"]
-    loader = loader_builder(url, **config.web.loader.params)
+    from url_normalize import url_normalize
 
-    docs = []
-    for doc in loader.lazy_load():
-        docs.append(doc)
+    cache = cache or WebFetchCache()
+    if content is None:
+        content = cache.fetch(url, conditional=False).content
 
-    processed_docs = process_web_docs(docs, config)
+    loader_builder = LOADER_REGISTRY[config.web.loader.type]["html"]
+    loader = loader_builder(url, content, **config.web.loader.params)
 
     resource_name = url_to_resource_name(url)
     art_dest_dir = f"{VS_DIR}/{resource_name}"
@@ -36,23 +58,26 @@ def ingest_web(url, config: IngestionConfig):
 
     manifest = {
         "vector_store": config.vector_store.type,
-        "embedding_model": config.vector_store.embedding_model,
+        **embedding_manifest(config.vector_store),
+        "tenant_id": config.tenant_id,
         "loader_name": config.web.loader.type,
         "loader_params": config.web.loader.params,
         "source_url": url,
         "last_indexed": datetime.now(timezone.utc).isoformat(),
     }
 
-    save_docs(
-        processed_docs,
+    num_docs = ingest_stream(
+        _with_url(loader.lazy_load(), url),
+        process_web_docs,
         manifest,
-        config.vector_store,
-        doc_save_dir=doc_dest_dir,
-        manifest_save_dir=art_dest_dir,
+        config,
+        doc_dest_dir=doc_dest_dir,
+        art_dest_dir=art_dest_dir,
+        doc_id=url_normalize(url),
+        dedup=dedup,
+        s3_documents=s3_documents,
     )
-
-    vs_builder = VS_REGISTRY[config.vector_store.type]["create"]
-    vs_builder(processed_docs, config.vector_store, save_dir=art_dest_dir)
+    cache.commit(url)
 
     print(f"[web_ingestor] Saved {config.vector_store.type} vector store to {VS_DIR}")
-    print(f"[web_ingestor] number of web docs: {len(processed_docs)}")
+    print(f"[web_ingestor] number of web docs: {num_docs}")
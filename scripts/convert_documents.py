@@ -0,0 +1,67 @@
+import argparse
+import os
+from pathlib import Path
+
+from app.utils.doc_store import (
+    DOCS_FILE,
+    LEGACY_DOCS_FILE,
+    S3_DOCS_KEY,
+    read_jsonl_documents,
+    read_s3_table,
+    table_bytes,
+    write_documents,
+)
+from app.utils.paths import DOC_DIR
+
+
+def convert_local(doc_dir: Path, remove: bool):
+    """
+    Convert every documents.jsonl under doc_dir to documents.parquet.
+    """
+    for jsonl_path in sorted(doc_dir.glob(f"*/{LEGACY_DOCS_FILE}")):
+        parquet_path = jsonl_path.with_name(DOCS_FILE)
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            docs = read_jsonl_documents(f)
+        write_documents(docs, parquet_path)
+        print(
+            f"[convert] {jsonl_path.parent.name}: {len(docs)} docs, "
+            f"{jsonl_path.stat().st_size / 1e6:.2f} MB -> "
+            f"{parquet_path.stat().st_size / 1e6:.2f} MB"
+        )
+        if remove:
+            jsonl_path.unlink()
+
+
+def convert_s3():
+    """
+    Convert documents/documents.jsonl in AWS_S3_DOCS_BUCKET to parquet. The
+    jsonl is left in place, parquet is read first.
+    """
+    import boto3
+
+    s3 = boto3.client("s3")
+    bucket = os.environ["AWS_S3_DOCS_BUCKET"]
+    table = read_s3_table(s3, bucket)
+    if table is None:
+        print("[convert] no documents on S3")
+        return
+    body = table_bytes(table)
+    s3.put_object(Body=body, Bucket=bucket, Key=S3_DOCS_KEY)
+    print(f"[convert] s3: {table.num_rows} docs, {len(body) / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert documents.jsonl files to the parquet document format"
+    )
+    parser.add_argument(
+        "--remove", action="store_true", help="delete the jsonl files once converted"
+    )
+    parser.add_argument(
+        "--s3", action="store_true", help="also convert the OpenSearch documents on S3"
+    )
+    args = parser.parse_args()
+
+    convert_local(DOC_DIR, args.remove)
+    if args.s3:
+        convert_s3()
@@ -1,6 +1,15 @@
+import argparse
 from ingestion.ingest import ingest
 from app.config import get_settings
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest new sources under data/")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only print the sources that would be ingested, with lookup timings",
+    )
+    args = parser.parse_args()
+
     cfg = get_settings().ingestion
-    ingest(cfg)
+    ingest(cfg, dry_run=args.dry_run)
@@ -0,0 +1,54 @@
+def test_admission_queues_in_order_and_sheds_past_deadline():
+    """Waiting requests are served in arrival order, the rest rejected early or on timeout"""
+    import asyncio
+    import pytest
+    from app.utils.admission import AdmissionController, Overloaded
+
+    async def scenario():
+        admission = AdmissionController(
+            max_in_flight=1, max_queue=2, queue_timeout_s=0.2, service_time_s=0.05
+        )
+        served = []
+
+        async def request(name, hold_s):
+            async with admission.slot():
+                served.append(name)
+                await asyncio.sleep(hold_s)
+
+        first = asyncio.create_task(request("first", 0.05))
+        await asyncio.sleep(0)
+        queued = [asyncio.create_task(request(n, 0.01)) for n in ("second", "third")]
+        await asyncio.sleep(0)
+        assert admission.queue_depth == 2
+
+        #  queue full: rejected at once
+        with pytest.raises(Overloaded) as full:
+            await admission.acquire()
+        assert full.value.status_code == 429
+        assert full.value.retry_after_s >= 1
+
+        await asyncio.gather(first, *queued)
+        assert served == ["first", "second", "third"]
+        assert admission.in_flight == 0
+
+        #  the slot is held past queue_timeout_s: the waiter gives up
+        holder = asyncio.create_task(request("holder", 0.5))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as timeout:
+            await admission.acquire()
+        assert timeout.value.status_code == 503
+        assert admission.queue_depth == 0
+
+        #  an estimated wait beyond queue_timeout_s is rejected without waiting
+        admission.service_time_s = 10.0
+        with pytest.raises(Overloaded) as deadline:
+            await admission.acquire()
+        assert deadline.value.status_code == 503
+        await holder
+
+        return admission
+
+    admission = asyncio.run(scenario())
+    assert admission.admitted == 4
+    assert admission.rejected == {"queue_full": 1, "deadline": 1, "timeout": 1}
+    assert admission.queued == 2
@@ -0,0 +1,309 @@
+from unittest.mock import MagicMock, patch
+
+ADMIN_HEADERS = {"X-Admin-Token": "secret"}
+
+
+def test_reload_swaps_graph_and_reports():
+    """Test the admin reload endpoint swaps in a newly built graph"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    old_graph, new_graph = MagicMock(), MagicMock()
+    new_graph.invoke.return_value = {"answer": "from new graph"}
+
+    with patch("app.main._build_app_graph", side_effect=[old_graph, new_graph]), patch(
+        "app.main.ADMIN_TOKEN", "secret"
+    ):
+        with TestClient(app) as client:
+            assert app.state.graph is old_graph
+
+            response = client.post("/admin/reload", headers=ADMIN_HEADERS)
+
+            assert response.status_code == 200
+            report = response.json()
+            assert report["reload_seconds"] >= 0
+            assert report["rss_peak_mb"] >= report["rss_before_mb"] > 0
+            assert app.state.graph is new_graph
+
+            response = client.post("/ask", json={"question": "test"})
+            assert response.json() == {"answer": "from new graph"}
+
+
+def test_failed_reload_keeps_current_graph():
+    """Test a failing rebuild leaves the current graph serving"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    old_graph = MagicMock()
+
+    with patch(
+        "app.main._build_app_graph", side_effect=[old_graph, RuntimeError("boom")]
+    ), patch("app.main.ADMIN_TOKEN", "secret"):
+        with TestClient(app) as client:
+            response = client.post("/admin/reload", headers=ADMIN_HEADERS)
+
+            assert response.status_code == 500
+            assert app.state.graph is old_graph
+
+
+def test_admin_endpoints_fail_closed():
+    """Test /admin/* answer 403 without ADMIN_TOKEN or with a wrong token"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    graph = MagicMock()
+
+    with patch("app.main._build_app_graph", return_value=graph) as build:
+        with TestClient(app) as client:
+            with patch("app.main.ADMIN_TOKEN", None):
+                assert client.post("/admin/reload").status_code == 403
+                response = client.get("/admin/shards", headers=ADMIN_HEADERS)
+                assert response.status_code == 403
+            with patch("app.main.ADMIN_TOKEN", "secret"):
+                response = client.post(
+                    "/admin/reload", headers={"X-Admin-Token": "wrong"}
+                )
+                assert response.status_code == 403
+                assert client.get("/admin/shards").status_code == 403
+
+    #  built at startup only
+    assert build.call_count == 1
+
+
+def test_ask_passes_filters_and_rejects_unknown_fields():
+    """Test /ask forwards filters to the graph and validates the filter fields"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    graph = MagicMock()
+    graph.invoke.return_value = {"answer": "filtered"}
+
+    with patch("app.main._build_app_graph", return_value=graph):
+        with TestClient(app) as client:
+            response = client.post(
+                "/ask", json={"question": "test", "filters": {"tenant_id": "acme"}}
+            )
+            assert response.status_code == 200
+            graph.invoke.assert_called_once_with(
+                {"question": "test", "filters": {"tenant_id": ["acme"]}}
+            )
+
+            response = client.post(
+                "/ask", json={"question": "test", "filters": {"page_number": "1"}}
+            )
+            assert response.status_code == 422
+
+
+def test_ask_batch_streams_ndjson():
+    """Test /ask/batch streams one JSON line per result from the graph"""
+    import json
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    graph = MagicMock()
+    graph.answer_batch.return_value = iter(
+        [{"index": 1, "answer": "b"}, {"index": 0, "answer": "a"}]
+    )
+
+    with patch("app.main._build_app_graph", return_value=graph):
+        with TestClient(app) as client:
+            response = client.post(
+                "/ask/batch",
+                json={
+                    "questions": [
+                        {"question": "first"},
+                        {"question": "second", "tenant_id": "acme"},
+                    ]
+                },
+            )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [{"index": 1, "answer": "b"}, {"index": 0, "answer": "a"}]
+    graph.answer_batch.assert_called_once_with(
+        [{"question": "first"}, {"question": "second", "tenant_id": "acme"}]
+    )
+
+
+def test_ask_sheds_load_when_saturated():
+    """Test /ask answers 429 with Retry-After when no slot or queue place is free"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.utils.admission import AdmissionController
+
+    graph = MagicMock()
+    graph.invoke.return_value = {"answer": "ok"}
+
+    with patch("app.main._build_app_graph", return_value=graph):
+        with TestClient(app) as client:
+            #  opt-in
+            assert app.state.admission is None
+            app.state.admission = AdmissionController(max_in_flight=1, max_queue=0)
+            assert client.post("/ask", json={"question": "test"}).status_code == 200
+            assert app.state.admission.admitted == 1
+
+            #  every slot busy and no room to wait
+            app.state.admission.in_flight = 1
+            response = client.post("/ask", json={"question": "test"})
+            batch_response = client.post(
+                "/ask/batch", json={"questions": [{"question": "test"}]}
+            )
+            metrics = client.get("/metrics").text
+
+    assert response.status_code == batch_response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert graph.invoke.call_count == 1
+    graph.answer_batch.assert_not_called()
+    assert 'rag_admission_rejected_total{reason="queue_full"} 2' in metrics
+    assert "rag_admission_in_flight 1" in metrics
+
+
+def test_ask_batch_releases_slot_when_it_fails_to_start():
+    """Test /ask/batch gives its slot back when the batch fails before streaming"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.utils.admission import AdmissionController
+
+    graph = MagicMock()
+    graph.answer_batch.side_effect = RuntimeError("boom")
+
+    with patch("app.main._build_app_graph", return_value=graph):
+        with TestClient(app, raise_server_exceptions=False) as client:
+            app.state.admission = AdmissionController(max_in_flight=1, max_queue=0)
+            for _ in range(2):
+                response = client.post(
+                    "/ask/batch", json={"questions": [{"question": "test"}]}
+                )
+                assert response.status_code == 500
+            assert app.state.admission.in_flight == 0
+            assert app.state.admission.admitted == 2
+
+
+def test_ask_latency_budget_sets_deadline_and_times_out():
+    """Test /ask turns latency_budget_s into a deadline and a missed one into a 504"""
+    import time
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.utils.deadline import DeadlineExceeded
+
+    graph = MagicMock()
+    graph.invoke.side_effect = [{"answer": "in time"}, DeadlineExceeded("generate")]
+
+    with patch("app.main._build_app_graph", return_value=graph):
+        with TestClient(app) as client:
+            start = time.monotonic()
+            response = client.post(
+                "/ask", json={"question": "test", "latency_budget_s": 2.5}
+            )
+            assert response.status_code == 200
+            deadline = graph.invoke.call_args.args[0]["deadline"]
+            assert start + 2.5 <= deadline <= time.monotonic() + 2.5
+
+            response = client.post(
+                "/ask", json={"question": "test", "latency_budget_s": 2.5}
+            )
+            assert response.status_code == 504
+
+
+def test_ask_batch_rejects_latency_budget():
+    """Test /ask/batch answers 422 to a latency_budget_s rather than ignoring it"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    graph = MagicMock()
+
+    with patch("app.main._build_app_graph", return_value=graph):
+        with TestClient(app) as client:
+            response = client.post(
+                "/ask/batch",
+                json={"questions": [{"question": "test", "latency_budget_s": 2.5}]},
+            )
+
+    assert response.status_code == 422
+    graph.answer_batch.assert_not_called()
+
+
+def test_ask_serializes_real_graph_output():
+    """Test /ask returns the output of a real graph, with mocked LLMs and retriever"""
+    from fastapi.testclient import TestClient
+    from langchain_core.documents import Document
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+    from app.config import get_settings
+    from app.main import app
+    from app.rag_pipeline import build_graph
+
+    retriever = MagicMock()
+    retriever.invoke.side_effect = lambda q, **kwargs: [
+        Document(page_content=f"result for {q}", metadata={"chunk_id": "c1"})
+    ]
+    query_llm = MagicMock()
+    query_llm.with_structured_output.return_value.invoke.return_value = {
+        "query": "beef emissions"
+    }
+    generate_llm = RunnableLambda(
+        lambda context: AIMessage(
+            content="answer", response_metadata={"model_name": "fake"}
+        )
+    )
+
+    with patch("app.rag_pipeline._build_retriever", return_value=retriever), patch(
+        "app.rag_pipeline._build_llms", return_value=(query_llm, generate_llm)
+    ), patch(
+        "app.rag_pipeline._build_prompts",
+        return_value=(None, RunnableLambda(lambda x: x["context"])),
+    ), patch(
+        "app.main._build_app_graph",
+        side_effect=lambda cfg, timings=None: build_graph(get_settings().rag),
+    ):
+        with TestClient(app) as client:
+            response = client.post("/ask", json={"question": "How bad is beef?"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["answer"] == "answer"
+    assert body["query"] == {"query": "beef emissions"}
+    assert body["contexts"][0]["page_content"] == "result for beef emissions"
+    assert "chunks" not in body
+
+
+def test_manifest_watcher_reloads_without_syncing_artifacts():
+    """Test a reload on a local manifest change serves the local index, unsynced"""
+    import asyncio
+    from types import SimpleNamespace
+    from unittest.mock import AsyncMock
+    from app.config import load_config
+    from app.main import _build_app_graph, _watch_manifest
+    from app.utils.paths import ART_DIR, DOC_DIR
+
+    cfg = load_config()
+    cfg.init.download_index = True
+    cfg.rag.nodes.retrieve.dense_vector_store_key = "faiss"
+
+    with patch("app.main.ensure_corpus_assets") as sync, patch(
+        "app.main.build_graph"
+    ) as build:
+        _build_app_graph(cfg, sync_artifacts=False)
+        sync.assert_not_called()
+        assert build.call_args.kwargs["vs_dir"] == ART_DIR / "faiss"
+        assert build.call_args.kwargs["doc_dir"] == DOC_DIR
+
+    async def watch():
+        app = SimpleNamespace(
+            state=SimpleNamespace(manifest_mtime=1, reload_lock=asyncio.Lock())
+        )
+        task = asyncio.create_task(_watch_manifest(app, interval_s=0.01))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        return app
+
+    with patch("app.main.get_settings", return_value=cfg), patch(
+        "app.main._manifest_mtime", return_value=2
+    ), patch("app.main.reload_graph", new_callable=AsyncMock) as reload:
+        reload.side_effect = lambda app, **kwargs: setattr(
+            app.state, "manifest_mtime", 2
+        )
+        app = asyncio.run(watch())
+
+    reload.assert_awaited_once_with(app, sync_artifacts=False)
@@ -0,0 +1,142 @@
+import hashlib
+
+
+def _remote(path, content, lfs=False):
+    from app.utils.artifacts import RemoteFile
+
+    if lfs:
+        return RemoteFile(
+            path, len(content), hashlib.sha256(content).hexdigest(), "sha256"
+        )
+    header = f"blob {len(content)}\0".encode()
+    return RemoteFile(
+        path, len(content), hashlib.sha1(header + content).hexdigest(), "git-sha1"
+    )
+
+
+def _use_tmp_dirs(monkeypatch, tmp_path):
+    import app.utils.artifacts as artifacts
+
+    monkeypatch.setattr(artifacts, "ART_DIR", tmp_path / "artifacts")
+    monkeypatch.setattr(artifacts, "PDF_DIR", tmp_path / "data" / "pdf")
+    monkeypatch.setattr(artifacts, "SYNC_DIR", tmp_path / "artifacts" / "synced")
+    monkeypatch.setattr(
+        artifacts, "SYNC_STATE_PATH", tmp_path / "artifacts" / ".sync_state.json"
+    )
+    monkeypatch.setattr(
+        artifacts, "STAGING_DIR", tmp_path / "artifacts" / ".sync_staging"
+    )
+
+
+def test_git_blob_sha1_matches_git(tmp_path):
+    """Test local hashing matches git's blob ids for non-LFS files"""
+    from app.utils.artifacts import _git_blob_sha1
+
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"hello\n")
+
+    # git hash-object of "hello\n"
+    assert _git_blob_sha1(path) == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_plan_sync_downloads_only_changed_files(monkeypatch, tmp_path):
+    """Test files are compared by content hash, not by name"""
+    from app.utils.artifacts import _plan_sync
+
+    _use_tmp_dirs(monkeypatch, tmp_path)
+    faiss_dir = tmp_path / "artifacts" / "faiss"
+    faiss_dir.mkdir(parents=True)
+    (faiss_dir / "index.faiss").write_bytes(b"same index")
+    (faiss_dir / "index.pkl").write_bytes(b"old docstore")
+
+    remote_files = {
+        f.path: f
+        for f in [
+            _remote("vector_stores/faiss/index.faiss", b"same index", lfs=True),
+            _remote("vector_stores/faiss/index.pkl", b"new docstore", lfs=True),
+            _remote("vector_stores/faiss/manifest.json", b"{}"),
+            _remote("vector_stores/faiss/report/index.faiss", b"per-source"),
+            _remote("vector_stores/documents/report/documents.jsonl", b"{}\n"),
+            _remote("source_docs/pdf/report.pdf", b"%PDF"),
+        ]
+    }
+
+    state = {}
+    plan = _plan_sync(remote_files, state, want_sources=False)
+
+    assert sorted(remote_file.path for remote_file, _ in plan) == [
+        "vector_stores/documents/report/documents.jsonl",
+        "vector_stores/faiss/index.pkl",
+        "vector_stores/faiss/manifest.json",
+    ]
+    assert state[str(faiss_dir / "index.faiss")]["hash"] == (
+        remote_files["vector_stores/faiss/index.faiss"].hash
+    )
+
+    plan = _plan_sync(remote_files, state, want_sources=True)
+    assert "source_docs/pdf/report.pdf" in [remote_file.path for remote_file, _ in plan]
+
+
+def test_sync_swaps_the_whole_snapshot(monkeypatch, tmp_path):
+    """Test a failed sync leaves the served snapshot untouched and a complete one replaces it"""
+    import pytest
+    import app.utils.artifacts as artifacts
+
+    _use_tmp_dirs(monkeypatch, tmp_path)
+    contents = {
+        "vector_stores/faiss/index.faiss": b"index v1",
+        "vector_stores/faiss/index.pkl": b"docstore v1",
+        "vector_stores/documents/report/documents.jsonl": b"{}\n",
+    }
+    failing = set()
+
+    def fake_download(repo_id, revision, remote_file, dst):
+        if remote_file.path in failing:
+            raise OSError("connection reset")
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        dst.write_bytes(contents[remote_file.path])
+
+    monkeypatch.setattr(
+        artifacts,
+        "_remote_manifest",
+        lambda api, repo_id, revision: {
+            path: _remote(path, content) for path, content in contents.items()
+        },
+    )
+    monkeypatch.setattr(artifacts, "_download", fake_download)
+
+    faiss_v1, doc_v1 = artifacts.ensure_corpus_assets(None, "repo", want_sources=False)
+    assert (faiss_v1 / "index.pkl").read_bytes() == b"docstore v1"
+    assert (doc_v1 / "report" / "documents.jsonl").exists()
+    state_v1 = artifacts.SYNC_STATE_PATH.read_text()
+
+    contents["vector_stores/faiss/index.faiss"] = b"index v2"
+    contents["vector_stores/faiss/index.pkl"] = b"docstore v2"
+    failing.add("vector_stores/faiss/index.pkl")
+    with pytest.raises(OSError):
+        artifacts.ensure_corpus_assets(None, "repo", want_sources=False)
+
+    current = artifacts.SYNC_DIR / "current"
+    assert (current / "faiss" / "index.faiss").read_bytes() == b"index v1"
+    assert (current / "faiss" / "index.pkl").read_bytes() == b"docstore v1"
+    assert artifacts.SYNC_STATE_PATH.read_text() == state_v1
+
+    failing.clear()
+    faiss_v2, doc_v2 = artifacts.ensure_corpus_assets(None, "repo", want_sources=False)
+    assert faiss_v2 != faiss_v1
+    assert (current / "faiss" / "index.faiss").read_bytes() == b"index v2"
+    assert (current / "faiss" / "index.pkl").read_bytes() == b"docstore v2"
+    #  unchanged files are hard linked from the previous snapshot
+    assert (doc_v2 / "report" / "documents.jsonl").samefile(
+        doc_v1 / "report" / "documents.jsonl"
+    )
+    #  the previous snapshot stays readable for the graph still serving
+    assert (faiss_v1 / "index.pkl").read_bytes() == b"docstore v1"
+
+    state = artifacts.json.loads(artifacts.SYNC_STATE_PATH.read_text())
+    assert str(faiss_v2 / "index.pkl") in state
+    assert str(faiss_v1 / "index.pkl") not in state
+    assert artifacts.ensure_corpus_assets(None, "repo", want_sources=False) == (
+        faiss_v2,
+        doc_v2,
+    )
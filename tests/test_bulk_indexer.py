@@ -0,0 +1,132 @@
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@contextmanager
+def _stub_bulk(reject_once=()):
+    """
+    Local HTTP server answering _bulk, throttling the docs in reject_once with a
+    429 the first time they are sent.
+    """
+    indexed = []
+    requests = []
+    rejected = set()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            lines = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+            items = []
+            with lock:
+                requests.append(len(lines) // 2)
+                for source in lines[1::2]:
+                    chunk_id = source["metadata"]["chunk_id"]
+                    if chunk_id in reject_once and chunk_id not in rejected:
+                        rejected.add(chunk_id)
+                        items.append({"index": {"status": 429, "error": "throttled"}})
+                    else:
+                        indexed.append(chunk_id)
+                        items.append({"index": {"status": 201}})
+            payload = json.dumps({"took": 1, "errors": False, "items": items})
+            payload = payload.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}", indexed, requests
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _docs(n):
+    from langchain_core.documents import Document
+
+    for i in range(n):
+        yield Document(page_content=f"chunk {i}", metadata={"chunk_id": f"doc::{i}"})
+
+
+def _indexer(url, checkpoint):
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from app.utils.bulk_indexer import BulkIndexer
+    from app.utils.opensearch import build_opensearch_client
+
+    return BulkIndexer(
+        build_opensearch_client(url, aws_auth=False),
+        "docs",
+        DeterministicFakeEmbedding(size=8),
+        checkpoint=checkpoint,
+        embed_batch_size=3,
+        chunk_size=4,
+        thread_count=2,
+        queue_size=2,
+        initial_backoff=0.01,
+    )
+
+
+def test_bulk_indexer_retries_throttled_docs(tmp_path):
+    """Docs rejected with a 429 are retried, all docs end up indexed once"""
+    from app.utils.bulk_indexer import Checkpoint
+
+    checkpoint = Checkpoint(tmp_path / "docs.txt")
+    with _stub_bulk(reject_once={"doc::2", "doc::7"}) as (url, indexed, requests):
+        stats = _indexer(url, checkpoint).index(_docs(10))
+
+    assert sorted(indexed) == sorted(f"doc::{i}" for i in range(10))
+    assert (stats.indexed, stats.retried, stats.failed) == (10, 2, 0)
+    #  3 requests of at most 4 docs, then one retry request
+    assert requests == [4, 4, 2, 2]
+    assert len(Checkpoint(tmp_path / "docs.txt")) == 10
+
+
+def test_bulk_indexer_resumes_from_checkpoint(tmp_path):
+    """Checkpointed chunk_ids are not embedded or sent again"""
+    from app.utils.bulk_indexer import Checkpoint
+
+    path = tmp_path / "docs.txt"
+    path.write_text("doc::0\ndoc::1\ndoc::2\n", encoding="utf-8")
+
+    with _stub_bulk() as (url, indexed, _):
+        stats = _indexer(url, Checkpoint(path)).index(_docs(5))
+
+    assert indexed == ["doc::3", "doc::4"]
+    assert (stats.indexed, stats.skipped) == (2, 3)
+    assert len(Checkpoint(path)) == 5
+
+
+def test_bulk_indexer_deletes_cluster_ids_by_query(tmp_path):
+    """With ids assigned by the cluster, chunks are deleted by a chunk_id query"""
+    from unittest.mock import MagicMock
+    from app.utils.bulk_indexer import BulkIndexer, Checkpoint
+
+    client = MagicMock()
+    #  a chunk indexed twice is deleted twice
+    client.delete_by_query.side_effect = [{"deleted": 3}, {"deleted": 1}]
+    path = tmp_path / "docs.txt"
+    path.write_text("doc::0\ndoc::1\ndoc::2\ndoc::3\n", encoding="utf-8")
+    indexer = BulkIndexer(
+        client, "docs", None, checkpoint=Checkpoint(path), id_field=None, chunk_size=2
+    )
+
+    assert indexer.delete(["doc::0", "doc::1", "doc::2"]) == 4
+
+    client.indices.refresh.assert_called_once_with(index="docs")
+    queries = [call.kwargs for call in client.delete_by_query.call_args_list]
+    assert [q["body"]["query"]["terms"] for q in queries] == [
+        {"metadata.chunk_id.keyword": ["doc::0", "doc::1"]},
+        {"metadata.chunk_id.keyword": ["doc::2"]},
+    ]
+    assert all(q["refresh"] for q in queries)
+    assert len(Checkpoint(path)) == 1
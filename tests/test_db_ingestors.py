@@ -0,0 +1,133 @@
+def _rise_db(path, rows):
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE rise_co2 (FoodCat3Name TEXT, GHGTotalValue TEXT, "
+                "RegionName TEXT, ProductionTypeEng TEXT)"
+            )
+        )
+        conn.execute(
+            text("INSERT INTO rise_co2 VALUES (:food, :ghg, :region, :production)"),
+            rows,
+        )
+    engine.dispose()
+
+
+def test_sql_ingestor_streams_rows_as_chunks(tmp_path):
+    """Rows are read in chunks and rendered column-wise, numbered continuously"""
+    from dataclasses import replace
+    from app.config import load_config
+    from app.utils.chunk_diff import content_chunk_id
+    from ingestion.db_ingestors.db_rise import RISE_TABLE
+    from ingestion.db_ingestors.sql_ingestor import SqlIngestor
+
+    rows = [
+        {
+            "food": f"food {i}",
+            "ghg": f"{i},5",
+            "region": "Sweden",
+            "production": "organic",
+        }
+        for i in range(5)
+    ]
+    _rise_db(tmp_path / "rise.db", rows)
+    table = replace(
+        RISE_TABLE, file=None, url=f"sqlite:///{tmp_path / 'rise.db'}", chunksize=2
+    )
+    ingestor = SqlIngestor("rise", table, load_config().ingestion)
+
+    assert [len(frame) for frame in ingestor.read_chunks()] == [2, 2, 1]
+
+    docs = list(ingestor.iter_documents())
+    assert docs[3].page_content == (
+        "Foods or ingredients of type food 3, when sourced from Sweden "
+        "and produced with organic methods, produce approximately 3.5 kg of "
+        "CO2 per kg."
+    )
+    assert [doc.metadata["chunk_index"] for doc in docs] == list(range(5))
+    assert docs[3].metadata["chunk_id"] == content_chunk_id(
+        "db:rise", docs[3].page_content
+    )
+    assert len({doc.metadata["ingested_at"] for doc in docs}) == 1
+
+
+def test_get_db_ingestor_uses_configured_tables():
+    """Databases without custom code are ingested from their config entry"""
+    import pytest
+    from dataclasses import replace
+    from app.config import SqlTableConfig, load_config
+    from app.utils.db_ingestors import get_db_ingestor
+    from ingestion.db_ingestors.db_rise import RiseDBIngestor
+    from ingestion.db_ingestors.sql_ingestor import SqlIngestor
+
+    config = load_config().ingestion
+    table = SqlTableConfig(
+        query="SELECT name FROM farms", template="Farm {name}", file="farms.db"
+    )
+    config = replace(
+        config,
+        sql=replace(config.sql, databases={"farms": table, **config.sql.databases}),
+    )
+
+    assert isinstance(get_db_ingestor("rise", config), RiseDBIngestor)
+    farms = get_db_ingestor("farms", config)
+    assert type(farms) is SqlIngestor and farms.table is table
+    with pytest.raises(KeyError):
+        get_db_ingestor("unknown", config)
+    with pytest.raises(ValueError):
+        SqlTableConfig(query="SELECT name FROM farms", template="Farm {name}")
+
+
+def test_ingest_plans_and_ingests_url_databases(monkeypatch, tmp_path):
+    """Databases are planned from config, including ones with only a url"""
+    from dataclasses import replace
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    import app.utils.vector_stores as vector_stores
+    import ingestion.db_ingestors.sql_ingestor as sql_ingestor
+    import ingestion.ingest as ingest_module
+    import ingestion.pipeline as pipeline_module
+    from app.config import load_config
+    from ingestion.db_ingestors.db_rise import RISE_TABLE
+
+    rows = [
+        {"food": f"food {i}", "ghg": "1", "region": "Sweden", "production": "organic"}
+        for i in range(3)
+    ]
+    _rise_db(tmp_path / "remote.db", rows)
+    embeddings = DeterministicFakeEmbedding(size=8)
+    monkeypatch.setattr(pipeline_module, "build_embeddings", lambda *a: embeddings)
+    monkeypatch.setattr(vector_stores, "_embeddings_from_config", lambda c: embeddings)
+    (tmp_path / "data").mkdir()
+    monkeypatch.setattr(ingest_module, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(ingest_module, "ART_DIR", tmp_path / "artifacts")
+    monkeypatch.setattr(sql_ingestor, "ART_DIR", tmp_path / "artifacts")
+    monkeypatch.setattr(sql_ingestor, "DOC_DIR", tmp_path / "documents")
+
+    config = load_config()
+    remote = replace(RISE_TABLE, file=None, url=f"sqlite:///{tmp_path / 'remote.db'}")
+    config = replace(
+        config.ingestion,
+        vector_store=config.rag.vector_stores["faiss"],
+        web=replace(config.ingestion.web, check_changes=False),
+        #  the file of the rise entry is missing, so it is skipped
+        sql=replace(
+            config.ingestion.sql,
+            databases={"remote": remote, **config.ingestion.sql.databases},
+        ),
+        dedup=replace(config.ingestion.dedup, enabled=False),
+        merge_indexes=False,
+    )
+
+    plan = ingest_module.ingest(config)
+
+    assert [(task.kind, task.name) for task in plan.pending] == [("sql", "remote")]
+    index = FAISS.load_local(
+        str(tmp_path / "artifacts" / "faiss" / "remote"),
+        embeddings,
+        allow_dangerous_deserialization=True,
+    )
+    assert index.index.ntotal == 3
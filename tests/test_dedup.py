@@ -0,0 +1,93 @@
+def _chunk(doc_id, text):
+    from langchain_core.documents import Document
+    from app.utils.chunk_diff import content_chunk_id
+
+    return Document(
+        page_content=text,
+        metadata={"doc_id": doc_id, "chunk_id": content_chunk_id(doc_id, text)},
+    )
+
+
+def _paragraph(topic, n=120):
+    return " ".join(f"{topic}{i}" for i in range(n))
+
+
+def test_near_duplicates_are_dropped_across_sources(tmp_path):
+    """A chunk differing by a word from an ingested one is dropped, persistently"""
+    from app.config import DedupConfig
+    from app.utils.dedup import NearDuplicateIndex
+
+    boilerplate = _paragraph("legal")
+    edited = boilerplate.replace("legal60", "disclaimer")
+
+    index = NearDuplicateIndex(DedupConfig(), tmp_path)
+    kept = list(index.filter([_chunk("a.pdf", boilerplate), _chunk("a.pdf", "beef")]))
+    assert len(kept) == 2
+    index.save()
+
+    #  a new run checks against the sources ingested before
+    index = NearDuplicateIndex(DedupConfig(), tmp_path)
+    kept = list(
+        index.filter([_chunk("b.pdf", edited), _chunk("b.pdf", _paragraph("farm"))])
+    )
+    assert [doc.page_content for doc in kept] == [_paragraph("farm")]
+    assert index.duplicates == 1
+
+    #  re-ingesting a source does not match its own previous chunks
+    index.remove_source("a.pdf")
+    assert len(list(index.filter([_chunk("a.pdf", boilerplate)]))) == 1
+
+
+def test_near_duplicates_are_linked(tmp_path):
+    """With action "link", near duplicates are kept and point to the original"""
+    from app.config import DedupConfig
+    from app.utils.dedup import NearDuplicateIndex
+
+    original = _chunk("a.pdf", _paragraph("report"))
+    copy = _chunk("web", _paragraph("report").replace("report7 ", "summary "))
+
+    index = NearDuplicateIndex(DedupConfig(action="link"), tmp_path)
+    kept = list(index.filter([original, copy]))
+
+    assert len(kept) == 2
+    assert kept[1].metadata["duplicate_of"] == original.metadata["chunk_id"]
+    assert "duplicate_of" not in kept[0].metadata
+
+
+def test_removed_source_orphans_sources_that_duplicated_it(monkeypatch, tmp_path):
+    """Sources with chunks dropped against a removed source are re-ingested"""
+    from app.config import DedupConfig
+    from app.utils.dedup import NearDuplicateIndex
+    from ingestion.ingest import IngestPlan, IngestTask
+    import ingestion.ingest as ingest_module
+
+    shared = _paragraph("shared")
+    index = NearDuplicateIndex(DedupConfig(), tmp_path)
+    list(index.filter([_chunk("a.pdf", shared)]))
+    list(index.filter([_chunk("b.pdf", shared), _chunk("b.pdf", "beef")]))
+    index.save()
+
+    #  a.pdf is edited: the text b.pdf shared with it may be gone
+    index = NearDuplicateIndex(DedupConfig(), tmp_path)
+    index.remove_source("a.pdf")
+    assert index.orphaned == {"b.pdf"}
+
+    ingested = []
+
+    def run_task(task, config, web_cache, dedup, s3_documents):
+        ingested.append(task.doc_id)
+        dedup.remove_source(task.doc_id)
+        list(dedup.filter([_chunk(task.doc_id, shared)]))
+
+    plan = IngestPlan(
+        indexed=[
+            IngestTask("pdf", "b", tmp_path / "b.pdf", "b.pdf"),
+            IngestTask("pdf", "c", tmp_path / "c.pdf", "c.pdf"),
+        ]
+    )
+    monkeypatch.setattr(ingest_module, "_run_task", run_task)
+    ingest_module._ingest_orphaned(plan, None, index, None, {})
+
+    assert ingested == ["b.pdf"]
+    assert index.orphaned == set()
+    assert len(list(index.filter([_chunk("c.pdf", shared)]))) == 0
@@ -97,3 +97,39 @@ def test_process_web_docs_filters_and_enriches():
 
     # URLs should be normalized
     assert doc.metadata["doc_id"].startswith("https://")
+
+
+def test_parse_cache_skips_parsing_for_chunking_changes(tmp_path):
+    """Parsed elements are reused unless the file or parsing params change"""
+    from app.utils.parse_cache import CachedUnstructuredLoader
+
+    parsed = []
+
+    class Loader(CachedUnstructuredLoader):
+        def _partition(self):
+            parsed.append(self.partition_params)
+            return [
+                {
+                    "type": "CompositeElement",
+                    "element_id": "e1",
+                    "text": self.file_path.read_text(),
+                    "metadata": {"filename": self.file_path.name, "page_number": 1},
+                }
+            ]
+
+    pdf = tmp_path / "report.pdf"
+    pdf.write_text("beef")
+    cache_dir = tmp_path / "cache"
+
+    docs = Loader(pdf, cache_dir, strategy="hi_res", max_characters=500).load()
+    Loader(pdf, cache_dir, strategy="hi_res", max_characters=200, overlap=50).load()
+    assert parsed == [{"strategy": "hi_res"}]
+    assert docs[0].page_content == "beef"
+    assert docs[0].metadata["category"] == "CompositeElement"
+    assert docs[0].metadata["source"] == str(pdf)
+
+    Loader(pdf, cache_dir, strategy="fast", max_characters=500).load()
+    pdf.write_text("lamb")
+    docs = Loader(pdf, cache_dir, strategy="hi_res", max_characters=500).load()
+    assert len(parsed) == 3
+    assert docs[0].page_content == "lamb"
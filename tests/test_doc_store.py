@@ -0,0 +1,138 @@
+def test_documents_round_trip_through_parquet(tmp_path):
+    """Metadata of mixed sources survives parquet: types, None values, lists"""
+    from langchain_core.documents import Document
+    from app.utils.doc_store import read_documents, write_documents
+
+    pdf = [
+        Document(
+            page_content=f"chunk {i}",
+            metadata={
+                "doc_id": "report.pdf",
+                "chunk_index": i,
+                "page_number": i if i % 2 else str(i),
+                "score": 1.5,
+                **({"languages": ["eng"]} if i == 3 else {}),
+            },
+        )
+        for i in range(5)
+    ]
+    sql = Document(
+        page_content="Beef, 27.0 kg",
+        metadata={"doc_id": "db:rise.db", "chunk_index": 0, "score": 2, "url": None},
+    )
+    web = Document(
+        page_content="Page",
+        metadata={"doc_id": "https://example.com", "url": "https://example.com"},
+    )
+    docs = [*pdf, sql, web]
+    write_documents(docs, tmp_path / "documents.parquet")
+
+    loaded = read_documents(tmp_path / "documents.parquet")
+    assert loaded == docs
+    #  an int next to floats stays an int, an int column with gaps keeps ints
+    assert type(loaded[5].metadata["score"]) is int
+    assert type(loaded[5].metadata["chunk_index"]) is int
+    assert "chunk_index" not in loaded[6].metadata
+
+
+def test_load_docs_reads_parquet_and_legacy_jsonl(tmp_path):
+    """Sources not converted yet are still read from documents.jsonl"""
+    import json
+    from langchain_core.documents import Document
+    from app.config import load_config
+    from app.utils.doc_store import write_documents
+    from app.utils.docs import load_docs
+
+    config = load_config()
+    converted = Document(page_content="new", metadata={"doc_id": "a.pdf"})
+    legacy = Document(page_content="old", metadata={"doc_id": "b.pdf"})
+    write_documents([converted], tmp_path / "a" / "documents.parquet")
+    (tmp_path / "b").mkdir()
+    (tmp_path / "b" / "documents.jsonl").write_text(
+        json.dumps({"page_content": "old", "metadata": {"doc_id": "b.pdf"}}) + "\n"
+    )
+
+    docs = load_docs(config.rag.vector_stores["faiss"], doc_dir=tmp_path)
+
+    assert sorted(docs, key=lambda doc: doc.page_content) == [converted, legacy]
+
+
+def test_s3_documents_read_once_per_run():
+    """The S3 documents file is downloaded once for all the sources of a run"""
+    import io
+    from unittest.mock import MagicMock
+    from langchain_core.documents import Document
+    from app.utils.doc_store import S3Documents, documents_table, table_bytes
+
+    body = table_bytes(
+        documents_table(
+            Document(
+                page_content=f"chunk {i}",
+                metadata={"doc_id": f"{i % 2}.pdf", "chunk_id": f"{i % 2}.pdf::{i}"},
+            )
+            for i in range(4)
+        )
+    )
+    s3 = MagicMock()
+    s3.get_object.side_effect = lambda **kwargs: {"Body": io.BytesIO(body)}
+
+    documents = S3Documents(s3, "docs")
+
+    assert documents.chunk_ids("0.pdf") == {"0.pdf::0", "0.pdf::2"}
+    assert documents.chunk_ids("1.pdf") == {"1.pdf::1", "1.pdf::3"}
+    assert documents.chunk_ids("2.pdf") == set()
+    s3.get_object.assert_called_once()
+
+
+def test_save_docs_uploads_s3_documents_once_per_run():
+    """The sources of a run are replaced in memory and uploaded together"""
+    import io
+    import json
+    from unittest.mock import MagicMock
+    from langchain_core.documents import Document
+    from app.config import load_config
+    from app.utils.doc_store import (
+        S3_DOCS_KEY,
+        S3Documents,
+        documents_table,
+        read_table,
+        table_bytes,
+        table_documents,
+    )
+    from app.utils.docs import save_docs
+
+    def doc(doc_id, text):
+        return Document(
+            page_content=text,
+            metadata={"doc_id": doc_id, "chunk_id": f"{doc_id}::{text}"},
+        )
+
+    objects = {
+        S3_DOCS_KEY: table_bytes(
+            documents_table([doc("a", "old"), doc("b", "kept"), doc("c", "gone")])
+        )
+    }
+    s3 = MagicMock()
+    s3.exceptions.NoSuchKey = KeyError
+    s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(objects[Key])}
+    s3.put_object.side_effect = lambda Body, Bucket, Key: objects.update({Key: Body})
+    config = load_config().rag.vector_stores["opensearch"]
+    documents = S3Documents(s3, "docs")
+
+    save_docs([doc("a", "new")], {"v": 1}, config, name="a", s3_documents=documents)
+    save_docs([], {"v": 2}, config, doc_id="c", name="c", s3_documents=documents)
+    s3.put_object.assert_not_called()
+    assert documents.chunk_ids("a") == {"a::new"}
+
+    documents.save()
+
+    saved = table_documents(read_table(objects[S3_DOCS_KEY]))
+    assert sorted(d.page_content for d in saved) == ["kept", "new"]
+    manifests = json.loads(objects["manifests/manifests.json"])
+    assert manifests == {"a": {"v": 1}, "c": {"v": 2}}
+    #  one download of the documents, one upload of each file
+    assert s3.put_object.call_count == 2
+    assert [call.kwargs["Key"] for call in s3.get_object.call_args_list] == [
+        S3_DOCS_KEY,
+        "manifests/manifests.json",
+    ]
@@ -0,0 +1,101 @@
+def _faiss_ingestion_config():
+    from dataclasses import replace
+    from app.config import load_config
+
+    config = load_config()
+    return replace(config.ingestion, vector_store=config.rag.vector_stores["faiss"])
+
+
+def test_plan_ingestion_skips_indexed_sources(monkeypatch, tmp_path):
+    """
+    Sources with a complete FAISS index are skipped unless they changed, a dry
+    run ingests nothing
+    """
+    import json
+    import ingestion.ingest as ingest_module
+    from app.utils.parse_cache import file_sha256
+    from app.utils.urls import url_to_resource_name
+
+    data_dir = tmp_path / "data"
+    (data_dir / "pdf").mkdir(parents=True)
+    for name in ["indexed", "edited", "new"]:
+        (data_dir / "pdf" / f"{name}.pdf").write_bytes(f"%PDF {name}".encode())
+    (data_dir / "web").mkdir()
+    (data_dir / "web" / "urls.json").write_text(
+        json.dumps({"urls": ["https://example.com/page"]})
+    )
+
+    art_dir = tmp_path / "artifacts"
+    for name, files in [
+        ("indexed", ["index.faiss", "index.pkl"]),
+        ("edited", ["index.faiss", "index.pkl"]),
+        ("new", ["index.faiss"]),
+    ]:
+        (art_dir / "faiss" / name).mkdir(parents=True)
+        for file in files:
+            (art_dir / "faiss" / name / file).touch()
+    #  edited.pdf was indexed with other content
+    for name, sha256 in [
+        ("indexed", file_sha256(data_dir / "pdf" / "indexed.pdf")),
+        ("edited", "0" * 64),
+    ]:
+        (art_dir / "faiss" / name / "manifest.json").write_text(
+            json.dumps({"source_sha256": sha256})
+        )
+
+    monkeypatch.setattr(ingest_module, "DATA_DIR", data_dir)
+    monkeypatch.setattr(ingest_module, "ART_DIR", art_dir)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("dry run must not ingest")
+
+    monkeypatch.setattr(ingest_module, "ingest_pdf", fail)
+    monkeypatch.setattr(ingest_module, "ingest_web", fail)
+
+    plan = ingest_module.ingest(_faiss_ingestion_config(), dry_run=True)
+
+    assert [task.name for task in plan.indexed] == ["indexed"]
+    assert sorted((task.kind, task.name) for task in plan.pending) == [
+        ("pdf", "edited"),
+        ("pdf", "new"),
+        ("web", url_to_resource_name("https://example.com/page")),
+    ]
+    assert [task.name for task in plan.pending if task.changed] == ["edited"]
+    assert set(plan.timings) == {
+        "list_sources",
+        "existing_sources",
+        "pdf_changes",
+        "web_changes",
+    }
+
+
+def test_stale_opensearch_manifests_deleted_only_by_a_real_run(monkeypatch, tmp_path):
+    """Without an OpenSearch index, a dry run leaves the S3 manifests in place"""
+    from dataclasses import replace
+    from unittest.mock import MagicMock, patch
+    import ingestion.ingest as ingest_module
+    from app.config import load_config
+
+    config = load_config()
+    config = replace(
+        config.ingestion, vector_store=config.rag.vector_stores["opensearch"]
+    )
+    (tmp_path / "data").mkdir()
+    monkeypatch.setattr(ingest_module, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setenv("OPENSEARCH_COLLECTION_ENDPOINT", "https://search.local")
+    monkeypatch.setenv("AWS_S3_DOCS_BUCKET", "docs")
+    client = MagicMock()
+    client.indices.exists.return_value = False
+    s3 = MagicMock()
+
+    with patch(
+        "app.utils.opensearch.build_opensearch_client", return_value=client
+    ), patch("boto3.client", return_value=s3):
+        plan = ingest_module.ingest(config, dry_run=True)
+        assert plan.stale_manifests
+        s3.delete_object.assert_not_called()
+
+        ingest_module.ingest(config)
+        s3.delete_object.assert_called_once_with(
+            Bucket="docs", Key="manifests/manifests.json"
+        )
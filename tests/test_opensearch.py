@@ -0,0 +1,123 @@
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _hits(ids):
+    return {
+        "hits": {
+            "hits": [
+                {
+                    "_id": i,
+                    "_score": 1.0,
+                    "_source": {"text": f"chunk {i}", "metadata": {"chunk_id": i}},
+                }
+                for i in ids
+            ]
+        }
+    }
+
+
+@contextmanager
+def _stub_opensearch(responses):
+    """
+    Local HTTP server answering _msearch with canned responses and recording
+    the request bodies.
+    """
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            requests.append((self.path, body.decode("utf-8")))
+            payload = json.dumps({"responses": responses}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}", requests
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _retriever(**kwargs):
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from app.utils.retrievers import OpenSearchHybridRetriever
+
+    return OpenSearchHybridRetriever(
+        index_name="docs",
+        embeddings=DeterministicFakeEmbedding(size=8),
+        k_dense=3,
+        k_sparse=3,
+        **kwargs,
+    )
+
+
+def test_opensearch_hybrid_msearch_fuses_in_one_request():
+    """kNN and match queries go out in one _msearch, results are fused by RRF"""
+    from app.utils.opensearch import build_opensearch_client
+
+    responses = [_hits(["a", "b", "c"]), _hits(["c", "a", "d"])]
+    with _stub_opensearch(responses) as (url, requests):
+        client = build_opensearch_client(url, {"pool_maxsize": 4}, aws_auth=False)
+        retriever = _retriever(client=client)
+        docs = retriever.invoke("beef", filters={"tenant_id": "acme"})
+
+    assert [d.metadata["chunk_id"] for d in docs] == ["a", "c", "b", "d"]
+    assert len(requests) == 1
+
+    path, body = requests[0]
+    assert path.startswith("/_msearch")
+    header, knn, _, match = [json.loads(line) for line in body.splitlines()]
+    assert header == {"index": "docs"}
+    tenant_filter = {"terms": {"metadata.tenant_id.keyword": ["acme"]}}
+    assert knn["query"]["knn"]["vector_field"]["filter"]["bool"]["filter"] == [
+        tenant_filter
+    ]
+    assert match["query"]["bool"]["must"] == [{"match": {"text": "beef"}}]
+    assert match["query"]["bool"]["filter"] == [tenant_filter]
+
+
+def test_opensearch_hybrid_async_client():
+    """ainvoke goes through the AsyncOpenSearch client"""
+    import asyncio
+    from app.utils.opensearch import build_async_opensearch_client
+
+    responses = [_hits(["a", "b"]), _hits(["b"])]
+    with _stub_opensearch(responses) as (url, requests):
+
+        async def run():
+            async_client = build_async_opensearch_client(url, aws_auth=False)
+            try:
+                retriever = _retriever(client=None, async_client=async_client)
+                return await retriever.ainvoke("beef")
+            finally:
+                await async_client.close()
+
+        docs = asyncio.run(run())
+
+    assert [d.metadata["chunk_id"] for d in docs] == ["b", "a"]
+    assert len(requests) == 1
+
+
+def test_opensearch_hybrid_query_body():
+    """hybrid mode sends both sub-queries in one hybrid query"""
+    retriever = _retriever(client=None, mode="hybrid", search_pipeline="rrf")
+
+    body = retriever._request("beef", [0.0] * 8, None)
+
+    knn, match = body["query"]["hybrid"]["queries"]
+    assert knn["knn"]["vector_field"]["k"] == 3
+    assert match == {"match": {"text": "beef"}}
+    assert retriever._search_params() == {"search_pipeline": "rrf"}
@@ -0,0 +1,242 @@
+def test_pipeline_runs_stages_in_order():
+    """Items flow through every stage in order, each stage is counted"""
+    from ingestion.pipeline import Pipeline
+
+    def double(items):
+        for item in items:
+            yield item * 2
+
+    def pairs(items):
+        items = list(items)
+        yield from zip(items[::2], items[1::2])
+
+    pipeline = Pipeline(queue_size=4)
+    result = pipeline.run(
+        ("load", range(10)), [("double", double), ("pairs", pairs)], ("sink", list)
+    )
+
+    assert result == [(0, 2), (4, 6), (8, 10), (12, 14), (16, 18)]
+    assert {name: stats.items for name, stats in pipeline.stats.items()} == {
+        "load": 10,
+        "double": 10,
+        "pairs": 5,
+        "sink": 5,
+    }
+
+
+def test_pipeline_backpressure_bounds_the_source():
+    """A slow sink stops the source from running ahead of the queues"""
+    import time
+    from ingestion.pipeline import Pipeline
+
+    produced = []
+
+    def source():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+
+    def slow_sink(items):
+        next(items)
+        time.sleep(0.2)
+        ahead = len(produced)
+        return ahead, 1 + sum(1 for _ in items)
+
+    pipeline = Pipeline(queue_size=2)
+    ahead, consumed = pipeline.run(
+        ("load", source()), [("identity", lambda items: items)], ("sink", slow_sink)
+    )
+
+    #  two queues of two, plus one item held by each thread
+    assert ahead <= 7
+    assert consumed == 1000
+
+
+def test_pipeline_raises_stage_errors():
+    """The first error in a stage stops the pipeline and is raised by run"""
+    import pytest
+    from ingestion.pipeline import Pipeline
+
+    def fail_at_5(items):
+        for item in items:
+            if item == 5:
+                raise ValueError("bad chunk")
+            yield item
+
+    with pytest.raises(ValueError, match="bad chunk"):
+        Pipeline(queue_size=2).run(
+            ("load", range(1000)), [("process", fail_at_5)], ("sink", list)
+        )
+
+
+def test_ingest_stream_builds_faiss_index(monkeypatch, tmp_path):
+    """Chunks are numbered across process batches, saved, embedded and indexed"""
+    from dataclasses import replace
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    import app.utils.vector_stores as vector_stores
+    import ingestion.pipeline as pipeline_module
+    from app.config import StreamingConfig, load_config
+    from app.utils.docs import process_pdf_docs
+    from app.utils.doc_store import read_documents
+
+    embeddings = DeterministicFakeEmbedding(size=8)
+    monkeypatch.setattr(pipeline_module, "build_embeddings", lambda *a: embeddings)
+    monkeypatch.setattr(vector_stores, "_embeddings_from_config", lambda c: embeddings)
+
+    config = load_config()
+    config = replace(
+        config.ingestion,
+        vector_store=config.rag.vector_stores["faiss"],
+        streaming=StreamingConfig(
+            queue_size=2, process_batch_size=2, embed_batch_size=3
+        ),
+    )
+    raw_docs = (
+        Document(
+            page_content=f"chunk {i}",
+            metadata={
+                "category": "Header" if i == 3 else "CompositeElement",
+                "filename": "report.pdf",
+                "source": "report.pdf",
+            },
+        )
+        for i in range(7)
+    )
+
+    num_docs = pipeline_module.ingest_stream(
+        raw_docs,
+        process_pdf_docs,
+        {"source_file": "report.pdf"},
+        config,
+        doc_dest_dir=str(tmp_path / "documents" / "report"),
+        art_dest_dir=str(tmp_path / "faiss" / "report"),
+        doc_id="report.pdf",
+    )
+
+    assert num_docs == 6
+    saved = [
+        doc.metadata["chunk_index"]
+        for doc in read_documents(
+            tmp_path / "documents" / "report" / "documents.parquet"
+        )
+    ]
+    #  chunk 3 is not a CompositeElement, numbering continues across batches
+    assert saved == [0, 1, 2, 4, 5, 6]
+    assert (tmp_path / "faiss" / "report" / "manifest.json").exists()
+
+    index = FAISS.load_local(
+        str(tmp_path / "faiss" / "report"),
+        embeddings,
+        allow_dangerous_deserialization=True,
+    )
+    assert index.index.ntotal == 6
+
+
+def test_ingest_stream_indexes_chunk_delta(monkeypatch, tmp_path):
+    """Re-ingesting a source embeds added chunks only and deletes removed ones"""
+    from dataclasses import replace
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    import app.utils.vector_stores as vector_stores
+    import ingestion.pipeline as pipeline_module
+    from app.config import load_config
+    from app.utils.chunk_diff import content_chunk_id
+
+    embedded = []
+
+    class RecordingEmbedding(DeterministicFakeEmbedding):
+        def embed_documents(self, texts):
+            embedded.extend(texts)
+            return super().embed_documents(texts)
+
+    embeddings = RecordingEmbedding(size=8)
+    monkeypatch.setattr(pipeline_module, "build_embeddings", lambda *a: embeddings)
+    monkeypatch.setattr(vector_stores, "_embeddings_from_config", lambda c: embeddings)
+
+    config = load_config()
+    config = replace(config.ingestion, vector_store=config.rag.vector_stores["faiss"])
+
+    def ingest(texts):
+        docs = [
+            Document(
+                page_content=text,
+                metadata={"chunk_id": content_chunk_id("page", text)},
+            )
+            for text in texts
+        ]
+        return pipeline_module.ingest_stream(
+            docs,
+            None,
+            {"source_url": "https://example.com"},
+            config,
+            doc_dest_dir=str(tmp_path / "documents"),
+            art_dest_dir=str(tmp_path / "faiss"),
+            doc_id="page",
+        )
+
+    ingest(["intro", "beef", "lamb", "outro"])
+    embedded.clear()
+    #  a paragraph inserted before the others, one changed, one duplicated
+    assert ingest(["new", "intro", "beef", "pork", "outro", "outro"]) == 5
+
+    assert embedded == ["new", "pork"]
+    index = FAISS.load_local(
+        str(tmp_path / "faiss"), embeddings, allow_dangerous_deserialization=True
+    )
+    assert sorted(doc.page_content for doc in index.docstore._dict.values()) == [
+        "beef",
+        "intro",
+        "new",
+        "outro",
+        "pork",
+    ]
+    assert index.index.ntotal == 5
+
+
+def test_ingest_stream_saves_source_left_without_chunks(monkeypatch, tmp_path):
+    """A source whose chunks were all removed is emptied and its manifest saved"""
+    import json
+    from dataclasses import replace
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    import app.utils.vector_stores as vector_stores
+    import ingestion.pipeline as pipeline_module
+    from app.config import load_config
+    from app.utils.doc_store import read_documents
+
+    embeddings = DeterministicFakeEmbedding(size=8)
+    monkeypatch.setattr(pipeline_module, "build_embeddings", lambda *a: embeddings)
+    monkeypatch.setattr(vector_stores, "_embeddings_from_config", lambda c: embeddings)
+
+    config = load_config()
+    config = replace(config.ingestion, vector_store=config.rag.vector_stores["faiss"])
+
+    def ingest(texts, sha256):
+        docs = [
+            Document(page_content=text, metadata={"chunk_id": f"page::{text}"})
+            for text in texts
+        ]
+        return pipeline_module.ingest_stream(
+            docs,
+            None,
+            {"source_sha256": sha256},
+            config,
+            doc_dest_dir=str(tmp_path / "documents"),
+            art_dest_dir=str(tmp_path / "faiss"),
+            doc_id="page",
+        )
+
+    ingest(["intro", "outro"], "old")
+    assert ingest([], "new") == 0
+
+    manifest = json.loads((tmp_path / "faiss" / "manifest.json").read_text())
+    assert manifest["source_sha256"] == "new"
+    assert read_documents(tmp_path / "documents" / "documents.parquet") == []
+    index = FAISS.load_local(
+        str(tmp_path / "faiss"), embeddings, allow_dangerous_deserialization=True
+    )
+    assert index.index.ntotal == 0
@@ -16,7 +16,7 @@ def test_build_graph_structure():
         mock_prompts.return_value = (MagicMock(), MagicMock())
 
         # Build graph
-        graph = build_graph(config, eval_mode=False)
+        graph = build_graph(config.rag, eval_mode=False)
 
         # Check that graph was created
         assert graph is not None
@@ -76,3 +76,286 @@ def test_build_prompts_loads_templates():
         # Should have expected variables
         assert "question" in generate_prompt.input_variables
         assert "context" in generate_prompt.input_variables
+
+
+def _invoke_with_mocks(config, question, rewritten_query):
+    """Build and invoke the graph with mocked retriever, LLMs and prompts"""
+    from app.rag_pipeline import build_graph
+    from langchain_core.documents import Document
+    from unittest.mock import MagicMock, patch
+
+    retriever = MagicMock()
+    retriever.invoke.side_effect = lambda q: [
+        Document(page_content=f"result for {q}", metadata={"chunk_id": q})
+    ]
+    query_llm = MagicMock()
+    query_llm.with_structured_output.return_value.invoke.return_value = {
+        "query": rewritten_query
+    }
+
+    with patch("app.rag_pipeline._build_retriever", return_value=retriever), patch(
+        "app.rag_pipeline._build_llms", return_value=(query_llm, MagicMock())
+    ), patch(
+        "app.rag_pipeline._build_prompts", return_value=(MagicMock(), MagicMock())
+    ):
+        graph = build_graph(config.rag)
+        result = graph.invoke({"question": question})
+
+    return result, retriever, query_llm
+
+
+def test_speculative_retrieval_reused_for_equivalent_query():
+    """Speculative results are used when the rewrite does not change keywords"""
+    from app.config import load_config
+
+    config = load_config()
+    config.rag.nodes.retrieve.speculative = True
+
+    result, retriever, _ = _invoke_with_mocks(
+        config, "CO2 emissions of beef?", "co2 emissions beef"
+    )
+
+    retriever.invoke.assert_called_once_with("CO2 emissions of beef?")
+    assert len(result["contexts"]) == 1
+
+
+def test_speculative_retrieval_merged_for_rewritten_query():
+    """Speculative and rewritten-query results are merged without duplicates"""
+    from app.config import load_config
+
+    config = load_config()
+    config.rag.nodes.retrieve.speculative = True
+
+    result, retriever, _ = _invoke_with_mocks(
+        config, "How bad is beef?", "beef greenhouse gas emissions per kg"
+    )
+
+    assert retriever.invoke.call_count == 2
+    assert [doc.metadata["chunk_id"] for doc in result["contexts"]] == [
+        "beef greenhouse gas emissions per kg"
+    ]
+    #  Chunk records stay internal, the result is what /ask returns
+    assert "chunks" not in result and "speculative_chunks" not in result
+
+
+def test_keyword_question_skips_rewrite():
+    """Short keyword-like questions are used as the query without an LLM call"""
+    from app.config import load_config
+
+    config = load_config()
+    config.rag.nodes.analyze_query.skip_rewrite_max_words = 3
+
+    result, retriever, query_llm = _invoke_with_mocks(
+        config, "beef emissions", "unused"
+    )
+
+    query_llm.with_structured_output.assert_not_called()
+    retriever.invoke.assert_called_once_with("beef emissions")
+
+
+def test_merge_contexts_interleaves_and_deduplicates():
+    """Merged contexts alternate between lists and keep the longer list's length"""
+    from app.rag_pipeline import _merge_contexts
+    from app.utils.retrievers import Chunk
+
+    def chunks(*ids):
+        return [Chunk(i, i, {"chunk_id": i}) for i in ids]
+
+    merged = _merge_contexts(chunks("a", "b", "c"), chunks("b", "d"))
+
+    assert [chunk.id for chunk in merged] == ["a", "b", "d"]
+
+
+def test_tenant_routes_to_shard_or_becomes_filter():
+    """The tenant goes to the shard router with tenant shards, else it is a filter"""
+    from app.rag_pipeline import build_graph
+    from app.config import load_config
+    from unittest.mock import MagicMock, patch
+
+    config = load_config()
+
+    for tenant_shards, expected_kwargs in [
+        (True, {"tenant_id": "acme"}),
+        (False, {"filters": {"tenant_id": ["acme"]}}),
+    ]:
+        config.rag.nodes.retrieve.tenant_shards = tenant_shards
+        retriever = MagicMock()
+        retriever.invoke.return_value = []
+        query_llm = MagicMock()
+        query_llm.with_structured_output.return_value.invoke.return_value = {
+            "query": "beef"
+        }
+        with patch("app.rag_pipeline._build_retriever", return_value=retriever), patch(
+            "app.rag_pipeline._build_llms", return_value=(query_llm, MagicMock())
+        ), patch(
+            "app.rag_pipeline._build_prompts", return_value=(MagicMock(), MagicMock())
+        ):
+            graph = build_graph(config.rag)
+            graph.invoke({"question": "beef?", "tenant_id": "acme"})
+
+        retriever.invoke.assert_called_once_with("beef", **expected_kwargs)
+
+
+def test_answer_batch_streams_results_and_isolates_failures():
+    """Rewrites and answers are batched, a failed rewrite only fails its question"""
+    from app.rag_pipeline import build_graph
+    from app.config import load_config
+    from langchain_core.documents import Document
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+    from unittest.mock import MagicMock, patch
+
+    config = load_config()
+    config.rag.nodes.analyze_query.skip_rewrite_max_words = 3
+    retriever = MagicMock()
+    retriever.invoke.side_effect = lambda q, **kwargs: [
+        Document(page_content=f"result for {q}", metadata={"chunk_id": q})
+    ]
+    query_llm = MagicMock()
+    query_llm.with_structured_output.return_value.batch.return_value = [
+        {"query": "beef emissions"},
+        ValueError("rate limited"),
+    ]
+    generate_llm = RunnableLambda(
+        lambda messages: AIMessage(
+            content="answer", response_metadata={"model_name": "fake"}
+        )
+    )
+
+    with patch("app.rag_pipeline._build_retriever", return_value=retriever), patch(
+        "app.rag_pipeline._build_llms", return_value=(query_llm, generate_llm)
+    ), patch(
+        "app.rag_pipeline._build_prompts",
+        return_value=(None, RunnableLambda(lambda x: x["context"])),
+    ):
+        graph = build_graph(config.rag)
+        results = list(
+            graph.answer_batch(
+                [
+                    {"question": "What are the emissions of beef?"},
+                    {"question": "How much CO2 does rice produce?"},
+                    {"question": "lamb", "tenant_id": "acme"},
+                ],
+                max_concurrency=2,
+            )
+        )
+
+    query_llm.with_structured_output.return_value.batch.assert_called_once()
+    by_index = {result["index"]: result for result in results}
+    assert by_index[0]["answer"] == "answer"
+    assert by_index[0]["contexts"][0].metadata["chunk_id"] == "beef emissions"
+    assert by_index[1]["error"] == "ValueError: rate limited"
+    assert by_index[2]["contexts"][0].page_content == "result for lamb"
+    retriever.invoke.assert_any_call("lamb", filters={"tenant_id": ["acme"]})
+
+
+def test_deadline_degrades_stages_in_order():
+    """A short budget skips the rewrite, then rerank, then truncates the context"""
+    import threading
+    import time
+    from app.rag_pipeline import build_graph
+    from app.config import DeadlineConfig, load_config
+    from app.utils.retrievers import RerankRetriever
+    from langchain_core.documents import Document
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+    from unittest.mock import MagicMock, patch
+
+    config = load_config()
+    config.rag.deadlines = DeadlineConfig(
+        rewrite_s=0.2,
+        retrieve_s=0.1,
+        rerank_s=0.2,
+        generate_s=0.3,
+        truncated_contexts=1,
+    )
+    base_retriever = MagicMock()
+    base_retriever.invoke.side_effect = lambda q: [
+        Document(page_content=f"{q} {i}", metadata={"chunk_id": str(i)})
+        for i in range(3)
+    ]
+    reranker = MagicMock(top_n=2)
+    reranker.rerank.return_value = [{"index": 2, "relevance_score": 0.9}]
+    retriever = RerankRetriever(base_retriever=base_retriever, reranker=reranker)
+    #  the rewrite hangs until released
+    release = threading.Event()
+    query_llm = MagicMock()
+    query_llm.with_structured_output.return_value.invoke.side_effect = (
+        lambda _: release.wait() and {"query": "rewritten"}
+    )
+    generate_llm = RunnableLambda(
+        lambda context: AIMessage(
+            content=context, response_metadata={"model_name": "fake"}
+        )
+    )
+
+    with patch("app.rag_pipeline._build_retriever", return_value=retriever), patch(
+        "app.rag_pipeline._build_llms", return_value=(query_llm, generate_llm)
+    ), patch(
+        "app.rag_pipeline._build_prompts",
+        return_value=(None, RunnableLambda(lambda x: x["context"])),
+    ):
+        graph = build_graph(config.rag)
+        try:
+            #  room for everything: the rewrite times out, rerank is skipped
+            start = time.monotonic()
+            result = graph.invoke({"question": "beef", "deadline": start + 1.0})
+            assert 0.5 < time.monotonic() - start < 1.0
+            assert result["degradations"] == ["skip_rewrite", "skip_rerank"]
+            assert [doc.metadata["chunk_id"] for doc in result["contexts"]] == [
+                "0",
+                "1",
+            ]
+
+            #  too little for any optional stage or the full context
+            result = graph.invoke(
+                {"question": "beef", "deadline": time.monotonic() + 0.2}
+            )
+            assert result["degradations"] == [
+                "skip_rewrite",
+                "skip_rerank",
+                "truncate_context",
+            ]
+            assert result["answer"] == "beef 0 "
+
+            #  without a deadline nothing is degraded
+            release.set()
+            result = graph.invoke({"question": "beef"})
+            assert result["degradations"] == []
+            assert result["contexts"][0].metadata["relevance_score"] == 0.9
+        finally:
+            release.set()
+
+
+def test_source_shards_rescore_with_their_own_vectors(tmp_path):
+    """Source shards never re-score with the vectors of the merged index"""
+    import numpy as np
+    from app.config import load_config
+    from app.rag_pipeline import _build_source_sharded_retriever
+    from app.utils.vector_stores import RESCORE_VECTORS_FILE, VS_REGISTRY
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from unittest.mock import patch
+
+    config = load_config()
+    config.rag.nodes.retrieve.dense_vector_store_key = "faiss"
+    config.rag.nodes.retrieve.dense_params["rescore_candidates"] = 20
+    #  the merged index's vectors, and a shard with its own
+    np.save(tmp_path / RESCORE_VECTORS_FILE, np.zeros((5, 16), dtype="float32"))
+    for name in ["a", "b"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "manifest.json").write_text("{}")
+    np.save(tmp_path / "b" / RESCORE_VECTORS_FILE, np.ones((1, 16), dtype="float32"))
+
+    def load(vs_config, path):
+        return FAISS.from_documents(
+            [Document(page_content=path.name, metadata={"chunk_id": path.name})],
+            DeterministicFakeEmbedding(size=16),
+        )
+
+    with patch.dict(VS_REGISTRY["faiss"], {"load": load}):
+        sharded = _build_source_sharded_retriever(config.rag, tmp_path)
+
+    assert sharded.shards["a"].vectors is None
+    assert np.array_equal(sharded.shards["b"].vectors, np.ones((1, 16)))
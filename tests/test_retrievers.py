@@ -0,0 +1,306 @@
+def _docs():
+    from langchain_core.documents import Document
+
+    docs = []
+    for i in range(40):
+        metadata = {
+            "tenant_id": "acme" if i % 2 else "default",
+            "filetype": "pdf" if i < 20 else "sql",
+            "doc_id": f"doc-{i // 10}",
+            "tags": ["beef"] if i % 5 == 0 else [],
+            "chunk_id": f"doc-{i // 10}::{i}",
+        }
+        docs.append(
+            Document(page_content=f"beef emissions chunk {i}", metadata=metadata)
+        )
+    return docs
+
+
+def test_metadata_index_combines_filters():
+    """Values of a field are OR-ed, fields are AND-ed"""
+    import pytest
+    from app.utils.retrievers import build_metadata_index
+
+    index = build_metadata_index(_docs())
+
+    assert index.select(None) is None
+    assert index.select({"tags": "beef"}).tolist() == [0, 5, 10, 15, 20, 25, 30, 35]
+    assert index.select(
+        {"tenant_id": "acme", "doc_id": ["doc-0", "doc-3"]}
+    ).tolist() == [
+        1,
+        3,
+        5,
+        7,
+        9,
+        31,
+        33,
+        35,
+        37,
+        39,
+    ]
+    assert len(index.select({"tenant_id": "missing"})) == 0
+    with pytest.raises(ValueError):
+        index.select({"page_number": "1"})
+
+
+def test_filtered_bm25_only_returns_matching_chunks():
+    """Test filtered BM25 scores only the selected chunks"""
+    from app.utils.retrievers import FilteredBM25Retriever, build_metadata_index
+    from app.utils.text import regex_clean_tokens
+    from rank_bm25 import BM25Okapi
+
+    docs = _docs()
+    retriever = FilteredBM25Retriever(
+        vectorizer=BM25Okapi([regex_clean_tokens(d.page_content) for d in docs]),
+        docs=docs,
+        preprocess_func=regex_clean_tokens,
+        metadata_index=build_metadata_index(docs),
+        k=50,
+    )
+
+    results = retriever.invoke("beef", filters={"filetype": "sql", "tenant_id": "acme"})
+
+    assert len(results) == 10
+    assert all(d.metadata["filetype"] == "sql" for d in results)
+    assert all(d.metadata["tenant_id"] == "acme" for d in results)
+    assert len(retriever.invoke("beef")) == 40
+
+
+def test_faiss_retriever_filters_exact_and_with_id_selector():
+    """Test filtered HNSW search (scored exactly) matches the filtered flat search"""
+    from app.utils.retrievers import FAISSRetriever, build_faiss_metadata_index
+    from app.utils.vector_stores import build_faiss_index
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    def retriever(index_factory):
+        vector_store = FAISS.from_documents(
+            _docs(), DeterministicFakeEmbedding(size=16)
+        )
+        vector_store.index = build_faiss_index(
+            vector_store.index.reconstruct_n(0, vector_store.index.ntotal),
+            index_factory,
+        )
+        return FAISSRetriever(
+            vector_store=vector_store,
+            k=5,
+            metadata_index=build_faiss_metadata_index(vector_store),
+        )
+
+    filters = {"doc_id": "doc-2"}
+    flat = retriever("Flat").invoke("query", filters=filters)
+    hnsw = retriever("HNSW8").invoke("query", filters=filters)
+
+    assert [d.metadata["chunk_id"] for d in hnsw] == [
+        d.metadata["chunk_id"] for d in flat
+    ]
+    assert len(flat) == 5
+    assert all(d.metadata["doc_id"] == "doc-2" for d in flat)
+    assert retriever("Flat").invoke("query", filters={"doc_id": "missing"}) == []
+
+
+def test_ensemble_passes_filters_to_retrievers():
+    """Test the ensemble forwards filters to both dense and sparse retrievers"""
+    from app.utils.retrievers import (
+        FAISSRetriever,
+        FilteredBM25Retriever,
+        FilteredEnsembleRetriever,
+        build_faiss_metadata_index,
+        build_metadata_index,
+    )
+    from app.utils.text import regex_clean_tokens
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from rank_bm25 import BM25Okapi
+
+    docs = _docs()
+    vector_store = FAISS.from_documents(docs, DeterministicFakeEmbedding(size=16))
+    ensemble = FilteredEnsembleRetriever(
+        retrievers=[
+            FAISSRetriever(
+                vector_store=vector_store,
+                k=10,
+                metadata_index=build_faiss_metadata_index(vector_store),
+            ),
+            FilteredBM25Retriever(
+                vectorizer=BM25Okapi(
+                    [regex_clean_tokens(d.page_content) for d in docs]
+                ),
+                docs=docs,
+                preprocess_func=regex_clean_tokens,
+                metadata_index=build_metadata_index(docs),
+                k=10,
+            ),
+        ],
+        weights=[0.5, 0.5],
+    )
+
+    results = ensemble.invoke("beef", filters={"tenant_id": "acme"})
+
+    assert results
+    assert all(d.metadata["tenant_id"] == "acme" for d in results)
+
+
+def test_opensearch_filter_clauses():
+    """Test filters map to OpenSearch terms filters on the metadata keyword fields"""
+    from app.utils.filters import opensearch_filter
+
+    assert opensearch_filter({"tenant_id": "acme", "tags": ["a", "b"]}) == {
+        "bool": {
+            "filter": [
+                {"terms": {"metadata.tenant_id.keyword": ["acme"]}},
+                {"terms": {"metadata.tags.keyword": ["a", "b"]}},
+            ]
+        }
+    }
+    assert opensearch_filter(None) == {}
+
+
+def test_sharded_faiss_retriever_matches_merged_index():
+    """Scatter-gather over shards returns the same top k as the merged index"""
+    from app.utils.retrievers import (
+        FAISSRetriever,
+        ShardedFAISSRetriever,
+        build_faiss_metadata_index,
+    )
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    embeddings = DeterministicFakeEmbedding(size=16)
+    docs = _docs()
+
+    def dense(shard_docs):
+        vector_store = FAISS.from_documents(shard_docs, embeddings)
+        return FAISSRetriever(
+            vector_store=vector_store,
+            k=8,
+            metadata_index=build_faiss_metadata_index(vector_store),
+        )
+
+    merged = dense(docs)
+    sharded = ShardedFAISSRetriever(
+        shards={f"doc-{i}": dense(docs[10 * i : 10 * (i + 1)]) for i in range(3)},
+        k=8,
+    )
+    assert sharded._pool_size == 3
+    sharded.add_shard("doc-3", dense(docs[30:]))
+    #  the pool grows with the shards added while serving
+    assert sharded._pool_size == 4
+
+    def chunk_ids(results):
+        return [d.metadata["chunk_id"] for d in results]
+
+    assert chunk_ids(sharded.invoke("query")) == chunk_ids(merged.invoke("query"))
+    filters = {"tenant_id": "acme"}
+    assert chunk_ids(sharded.invoke("query", filters=filters)) == chunk_ids(
+        merged.invoke("query", filters=filters)
+    )
+
+    sharded.remove_shard("doc-0")
+    assert all(d.metadata["doc_id"] != "doc-0" for d in sharded.invoke("query"))
+
+
+def test_reranked_chunks_reference_stored_documents():
+    """Stages pass Chunks sharing the stored metadata, invoke builds Documents"""
+    from app.utils.retrievers import (
+        FilteredBM25Retriever,
+        RerankRetriever,
+        build_metadata_index,
+        retrieve_chunks,
+    )
+    from app.utils.text import regex_clean_tokens
+    from rank_bm25 import BM25Okapi
+
+    class ReverseReranker:
+        def rerank(self, documents, query):
+            order = list(reversed(range(len(documents))))[:2]
+            return [
+                {"index": i, "relevance_score": 1.0 / (rank + 1)}
+                for rank, i in enumerate(order)
+            ]
+
+    docs = _docs()
+    bm25 = FilteredBM25Retriever(
+        vectorizer=BM25Okapi([regex_clean_tokens(d.page_content) for d in docs]),
+        docs=docs,
+        preprocess_func=regex_clean_tokens,
+        metadata_index=build_metadata_index(docs),
+        k=4,
+    )
+    reranker = RerankRetriever(base_retriever=bm25, reranker=ReverseReranker())
+    filters = {"tenant_id": "acme"}
+
+    candidates = bm25.search_chunks("beef chunk 7", filters=filters)
+    chunks = retrieve_chunks(reranker, "beef chunk 7", filters=filters)
+    assert [c.id for c in chunks] == [c.id for c in candidates[::-1][:2]]
+    stored = {id(d.metadata) for d in docs}
+    assert all(id(chunk.metadata) in stored for chunk in chunks)
+
+    results = reranker.invoke("beef chunk 7", filters=filters)
+    assert [d.metadata["chunk_id"] for d in results] == [c.id for c in chunks]
+    assert [d.metadata["relevance_score"] for d in results] == [1.0, 0.5]
+    assert all("relevance_score" not in d.metadata for d in docs)
+
+
+def test_batch_search_matches_single_queries():
+    """A batch is embedded in one call and returns the per-query results"""
+    import pytest
+    from app.utils.retrievers import (
+        FAISSRetriever,
+        FilteredBM25Retriever,
+        FilteredEnsembleRetriever,
+        build_faiss_metadata_index,
+        build_metadata_index,
+    )
+    from app.utils.text import regex_clean_tokens
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from rank_bm25 import BM25Okapi
+
+    calls = []
+
+    class CountingEmbedding(DeterministicFakeEmbedding):
+        def embed_documents(self, texts):
+            calls.append(len(texts))
+            return super().embed_documents(texts)
+
+    docs = _docs()
+    vector_store = FAISS.from_documents(docs, CountingEmbedding(size=16))
+    ensemble = FilteredEnsembleRetriever(
+        retrievers=[
+            FAISSRetriever(
+                vector_store=vector_store,
+                k=5,
+                metadata_index=build_faiss_metadata_index(vector_store),
+            ),
+            FilteredBM25Retriever(
+                vectorizer=BM25Okapi(
+                    [regex_clean_tokens(d.page_content) for d in docs]
+                ),
+                docs=docs,
+                preprocess_func=regex_clean_tokens,
+                metadata_index=build_metadata_index(docs),
+                k=5,
+                batch_block_size=2,
+            ),
+        ],
+        weights=[0.5, 0.5],
+    )
+    queries = ["beef chunk 3", "emissions 12 12", "chunk 7", "beef"]
+    filters = [None, {"tenant_id": "acme"}, {"doc_id": "missing"}, None]
+
+    calls.clear()
+    batch = ensemble.search_chunks_batch(queries, filters)
+    assert calls == [4]
+
+    single = [ensemble.search_chunks(q, filters=f) for q, f in zip(queries, filters)]
+    assert [[c.id for c in chunks] for chunks in batch] == [
+        [c.id for c in chunks] for chunks in single
+    ]
+    bm25 = ensemble.retrievers[1]
+    for query, query_filters in zip(queries, filters):
+        expected = bm25.search_chunks(query, filters=query_filters)
+        (result,) = bm25.search_chunks_batch([query], [query_filters])
+        assert [c.id for c in result] == [c.id for c in expected]
+        assert [c.score for c in result] == pytest.approx([c.score for c in expected])
@@ -0,0 +1,60 @@
+def test_shard_cache_evicts_least_recently_used():
+    """Test shards load once, are hit after, and are evicted LRU by count and size"""
+    from app.utils.shards import ShardCache
+
+    loaded = []
+
+    def load(key):
+        loaded.append(key)
+        return f"retriever for {key}"
+
+    sizes = {"a": 10.0, "b": 10.0, "c": 10.0, "big": 25.0}
+    cache = ShardCache(load, sizes.get, max_shards=2, max_memory_mb=30.0)
+
+    assert cache.get("a") == "retriever for a"
+    cache.get("b")
+    cache.get("a")
+    cache.get("c")  #  over max_shards, evicts b
+
+    summary = cache.summary()
+    assert summary["loaded"] == ["a", "c"]
+    assert summary["shards"]["a"]["hits"] == 1
+    assert summary["shards"]["b"]["evictions"] == 1
+    assert summary["shards"]["b"]["loaded"] is False
+
+    cache.get("big")  #  over max_memory_mb, evicts a and c
+    assert cache.summary()["loaded"] == ["big"]
+    assert loaded == ["a", "b", "c", "big"]
+
+
+def test_shard_cache_loads_once_under_concurrency():
+    """Concurrent first queries of a tenant share a single load"""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from app.utils.shards import ShardCache
+
+    loads = []
+
+    def load(key):
+        loads.append(key)
+        time.sleep(0.05)
+        return object()
+
+    cache = ShardCache(load, lambda key: 1.0)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        shards = list(pool.map(cache.get, ["t"] * 8))
+
+    assert loads == ["t"]
+    assert all(shard is shards[0] for shard in shards)
+    assert cache.stats["t"].hits == 7
+
+
+def test_tenant_ids_cannot_escape_tenant_dir():
+    """Test tenant ids are restricted to safe directory names"""
+    import pytest
+    from app.utils.shards import UnknownTenantError, check_tenant_id
+
+    assert check_tenant_id("acme-corp_1") == "acme-corp_1"
+    for tenant_id in ("../default", "", ".hidden", "a/b"):
+        with pytest.raises(UnknownTenantError):
+            check_tenant_id(tenant_id)
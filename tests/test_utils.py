@@ -73,3 +73,85 @@ def test_clean_text_fixes_encoding():
     assert clean is not None
     assert len(clean) > 0
     # ftfy should handle various encoding issues
+
+
+def test_regex_tokenizer_matches_nltk():
+    """Test the regex tokenizer gives the same tokens as the NLTK one"""
+    from app.utils.text import regex_clean_tokens
+
+    texts = [
+        "",
+        "Hello! WORLD? Testing, testing.",
+        "Beef produces approximately 99.48 kg of CO2-equivalents per kg.",
+        "The EU's Farm to Fork strategy (2020) targets a 50% cut in pesticides.",
+        "Greenhouse gas emissions from agriculture: methane, nitrous oxide & CO2",
+        "Plant-based diets\treduce land use\nby up to 75 percent, according to FAO.",
+        "Foods or ingredients of type Cheese, when sourced from Sweden "
+        "and produced with Conventional methods",
+    ]
+
+    for text in texts:
+        assert regex_clean_tokens(text) == clean_tokens(text)
+
+
+def test_query_tokenizer_is_memoized():
+    """Test repeated queries are served from the LRU cache"""
+    from app.utils.text import _cached_tokens, get_query_tokenizer
+
+    tokenize = get_query_tokenizer("regex")
+    _cached_tokens.cache_clear()
+
+    first = tokenize("carbon footprint of cheese")
+    second = tokenize("carbon footprint of cheese")
+
+    assert first == second == ["carbon", "footprint", "cheese"]
+    assert _cached_tokens.cache_info().hits == 1
+
+
+def test_batch_clean_tokens_preserves_order():
+    """Test batch tokenization in a spawned process pool keeps input order"""
+    from concurrent.futures import ProcessPoolExecutor
+    from unittest.mock import patch
+    from app.utils.text import batch_clean_tokens, regex_clean_tokens
+
+    texts = [f"document number {i} about emissions" for i in range(50)]
+
+    with patch("app.utils.text.ProcessPoolExecutor", wraps=ProcessPoolExecutor) as pool:
+        result = batch_clean_tokens(texts, max_workers=2, chunksize=8, min_parallel=0)
+
+    assert result == [regex_clean_tokens(text) for text in texts]
+    #  never forked, the API tokenizes from threads
+    assert pool.call_args.kwargs["mp_context"].get_start_method() == "spawn"
+
+
+def test_api_import_defers_backend_modules():
+    """Test importing the API does not import backend-specific packages"""
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, app.main\n"
+        "from app.startup_profile import DEFERRED_MODULES\n"
+        "print(','.join(m for m in DEFERRED_MODULES if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip() == ""
+
+
+def test_deadline_pool_created_once_and_sized_from_admission():
+    """Threads racing for the timed-call pool share one, sized by configure_pool"""
+    from concurrent.futures import ThreadPoolExecutor
+    import app.utils.deadline as deadline
+
+    deadline.configure_pool(4)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as threads:
+            pools = set(threads.map(lambda _: deadline._get_pool(), range(64)))
+        assert len(pools) == 1
+        assert pools.pop()._max_workers == 8
+        assert deadline.call_with_timeout(lambda x: x + 1, 1.0, 1) == 2
+    finally:
+        deadline.configure_pool(16)
@@ -26,3 +26,113 @@ def test_vector_store_config_matches_registry():
         assert (
             vs_config.type in VS_REGISTRY
         ), f"Vector store type '{vs_config.type}' not in registry"
+
+
+def test_rebuild_faiss_index_keeps_docstore_mapping():
+    """Test rebuilding with an index factory keeps search results mapped to docs"""
+    from app.utils.vector_stores import rebuild_faiss_index
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    texts = [f"chunk number {i}" for i in range(300)]
+    vector_store = FAISS.from_texts(texts, DeterministicFakeEmbedding(size=32))
+
+    rebuild_faiss_index(vector_store, "IVF4,Flat", train_sample_size=200)
+
+    assert "IVF" in type(vector_store.index).__name__
+    assert vector_store.index.ntotal == len(texts)
+    vector_store.index.nprobe = 4
+    assert vector_store.similarity_search("chunk number 42", k=1)[0].page_content == (
+        "chunk number 42"
+    )
+
+
+def test_faiss_search_params_split_from_search_kwargs():
+    """Test nprobe/efSearch are set on the index, not passed to similarity_search"""
+    import faiss
+    import numpy as np
+    from app.utils.vector_stores import (
+        build_faiss_index,
+        set_faiss_search_params,
+        split_faiss_search_params,
+    )
+
+    search_kwargs, index_params = split_faiss_search_params({"k": 10, "efSearch": 77})
+    assert search_kwargs == {"k": 10}
+    assert index_params == {"efSearch": 77}
+
+    vectors = np.random.default_rng(0).random((100, 16), dtype="float32")
+    index = build_faiss_index(vectors, "HNSW8")
+    set_faiss_search_params(index, index_params)
+
+    assert faiss.downcast_index(index).hnsw.efSearch == 77
+
+
+def test_truncated_embeddings_are_unit_norm():
+    """Test Matryoshka truncation keeps the leading dimensions and re-normalizes"""
+    import numpy as np
+    from app.utils.vector_stores import TruncatedEmbeddings
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    full = DeterministicFakeEmbedding(size=64)
+    truncated = TruncatedEmbeddings(full, dimensions=16)
+
+    vector = np.asarray(truncated.embed_query("a question"))
+    full_vector = np.asarray(full.embed_query("a question"))
+
+    assert vector.shape == (16,)
+    assert np.isclose(np.linalg.norm(vector), 1.0)
+    assert np.allclose(vector, full_vector[:16] / np.linalg.norm(full_vector[:16]))
+
+
+def test_faiss_index_factory_composes_vector_dtype():
+    """Test vector_dtype is folded into the configured index factory"""
+    import pytest
+    from app.config import VectorStoreConfig
+    from app.utils.vector_stores import faiss_index_factory
+
+    def factory(index_factory, vector_dtype):
+        cfg = VectorStoreConfig(
+            type="faiss",
+            embedding_model="text-embedding-3-large",
+            kwargs={"index_factory": index_factory},
+            vector_dtype=vector_dtype,
+        )
+        return faiss_index_factory(cfg)
+
+    assert factory("Flat", "float32") == "Flat"
+    assert factory("Flat", "float16") == "SQfp16"
+    assert factory("HNSW32", "sq8") == "HNSW32,SQ8"
+    assert factory("IVF64,Flat", "sq8") == "IVF64,SQ8"
+    with pytest.raises(ValueError):
+        factory("IVF64,PQ16", "float16")
+    with pytest.raises(ValueError):
+        factory("Flat", "int4")
+
+
+def test_rescoring_retriever_matches_exact_search(tmp_path):
+    """Test re-scoring compressed-index candidates recovers the exact top k"""
+    from app.utils.retrievers import FAISSRetriever
+    from app.utils.vector_stores import (
+        load_rescore_vectors,
+        rebuild_faiss_index,
+        save_rescore_vectors,
+    )
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    texts = [f"chunk number {i}" for i in range(300)]
+    vector_store = FAISS.from_texts(texts, DeterministicFakeEmbedding(size=32))
+    exact = [doc.page_content for doc in vector_store.similarity_search("query", k=5)]
+
+    save_rescore_vectors(vector_store.index, tmp_path)
+    rebuild_faiss_index(vector_store, "SQ4", train_sample_size=300)
+    retriever = FAISSRetriever(
+        vector_store=vector_store,
+        vectors=load_rescore_vectors(tmp_path),
+        k=5,
+        rescore_candidates=300,
+    )
+
+    assert [doc.page_content for doc in retriever.invoke("query")] == exact
+    assert load_rescore_vectors(tmp_path / "missing") is None
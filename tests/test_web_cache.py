@@ -0,0 +1,129 @@
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@contextmanager
+def _site(page):
+    """
+    Local HTTP server for page, a dict with the body and an optional etag,
+    answering If-None-Match with a 304.
+    """
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(dict(self.headers))
+            etag = page.get("etag")
+            if etag and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = page["body"].encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/page", requests
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_web_cache_sends_conditional_requests(tmp_path):
+    """A cached ETag is sent back, and a 304 means the page is unchanged"""
+    from ingestion.web_cache import WebFetchCache
+
+    page = {"body": "<p>beef</p>", "etag": '"v1"'}
+    with _site(page) as (url, requests):
+        cache = WebFetchCache(tmp_path / "cache.json")
+        first = cache.fetch(url)
+        assert first.status == "new" and first.content == b"<p>beef</p>"
+        cache.commit(url)
+
+        cache = WebFetchCache(tmp_path / "cache.json")
+        assert cache.fetch(url).status == "unchanged"
+        assert requests[-1]["If-None-Match"] == '"v1"'
+
+        page.update(body="<p>lamb</p>", etag='"v2"')
+        changed = cache.fetch(url)
+        assert changed.status == "changed" and changed.content == b"<p>lamb</p>"
+
+    #  not committed: the change is seen again until the page is ingested
+    assert WebFetchCache(tmp_path / "cache.json").entries[url]["etag"] == '"v1"'
+
+
+def test_web_cache_compares_content_hash(tmp_path):
+    """Without validators, an identical body is unchanged"""
+    from ingestion.web_cache import WebFetchCache
+
+    page = {"body": "<p>beef</p>"}
+    with _site(page) as (url, requests):
+        cache = WebFetchCache(tmp_path / "cache.json")
+        cache.fetch(url)
+        cache.commit(url)
+
+        assert cache.fetch(url).status == "unchanged"
+        assert "If-None-Match" not in requests[-1]
+
+        page["body"] = "<p>lamb</p>"
+        assert cache.fetch(url).status == "changed"
+
+
+def test_ingest_commits_cache_only_after_a_real_run(monkeypatch, tmp_path):
+    """A dry run writes no cache entries, a failed ingestion commits none for its page"""
+    import json
+    from functools import partial
+    import pytest
+    import ingestion.ingest as ingest_module
+    from app.utils.urls import url_to_resource_name
+    from ingestion.web_cache import WebFetchCache
+    from tests.test_ingest import _faiss_ingestion_config
+
+    cache_path = tmp_path / "cache.json"
+    page = {"body": "<p>beef</p>", "etag": '"v1"'}
+    with _site(page) as (url, requests):
+        (tmp_path / "data" / "web").mkdir(parents=True)
+        (tmp_path / "data" / "web" / "urls.json").write_text(
+            json.dumps({"urls": [url]})
+        )
+        index_dir = tmp_path / "artifacts" / "faiss" / url_to_resource_name(url)
+        index_dir.mkdir(parents=True)
+        for name in ["index.faiss", "index.pkl"]:
+            (index_dir / name).touch()
+        (index_dir / "manifest.json").write_text("{}")
+        monkeypatch.setattr(ingest_module, "DATA_DIR", tmp_path / "data")
+        monkeypatch.setattr(ingest_module, "ART_DIR", tmp_path / "artifacts")
+        monkeypatch.setattr(
+            ingest_module, "WebFetchCache", partial(WebFetchCache, cache_path)
+        )
+        config = _faiss_ingestion_config()
+
+        ingest_module.ingest(config, dry_run=True)
+        assert not cache_path.exists()
+
+        #  indexed before pages were cached: recorded by a real run
+        ingest_module.ingest(config)
+        assert WebFetchCache(cache_path).entries[url]["etag"] == '"v1"'
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("embedding failed")
+
+        monkeypatch.setattr(ingest_module, "ingest_web", fail)
+        page.update(body="<p>lamb</p>", etag='"v2"')
+        with pytest.raises(RuntimeError):
+            ingest_module.ingest(config)
+
+    #  still the ingested version, the change is retried next run
+    assert WebFetchCache(cache_path).entries[url]["etag"] == '"v1"'